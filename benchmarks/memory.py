@@ -0,0 +1,73 @@
+"""Memory footprint of an initialised pop of pop_size x indiv_size rules.
+
+Usage: python -m benchmarks.memory [--pop-size N] [--indiv-size N]
+    [--obs-dim N] [--real]
+
+Prints a single JSON record."""
+import argparse
+import gc
+import json
+import tracemalloc
+
+from pplst.encoding import (IntegerUnorderedBoundEncoding,
+                            RealUnorderedBoundEncoding)
+from pplst.hyperparams import register_hyperparams
+from pplst.init import init_pop
+from pplst.rng import seed_rng
+
+from .standin import make_standin_obs_space
+
+_SELECTABLE_ACTIONS = (0, 1, 2, 3)
+
+
+def measure_pop_memory(pop_size, indiv_size, obs_dim, is_integer, seed=0):
+    register_hyperparams({
+        "seed": seed,
+        "pop_size": pop_size,
+        "indiv_size": indiv_size,
+        "r_nought": (4 if is_integer else 0.5),
+        "weight_I_min": -1.0,
+        "weight_I_max": 1.0,
+        "x_nought": 1.0,
+        "use_indiv_policy_cache": False
+    })
+    seed_rng(seed)
+    obs_space = make_standin_obs_space(obs_dim, is_integer)
+    encoding = (IntegerUnorderedBoundEncoding(obs_space)
+                if is_integer else RealUnorderedBoundEncoding(obs_space))
+
+    gc.collect()
+    tracemalloc.start()
+    baseline_bytes = tracemalloc.get_traced_memory()[0]
+    pop = init_pop(encoding, _SELECTABLE_ACTIONS)
+    gc.collect()
+    pop_bytes = (tracemalloc.get_traced_memory()[0] - baseline_bytes)
+    tracemalloc.stop()
+
+    num_rules = sum(len(indiv) for indiv in pop)
+    return {
+        "benchmark": "pop_memory",
+        "pop_size": pop_size,
+        "indiv_size": indiv_size,
+        "obs_dim": obs_dim,
+        "obs_space": ("integer" if is_integer else "real"),
+        "pop_bytes": pop_bytes,
+        "bytes_per_rule": (pop_bytes / num_rules)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pop-size", type=int, default=100)
+    parser.add_argument("--indiv-size", type=int, default=100)
+    parser.add_argument("--obs-dim", type=int, default=4)
+    parser.add_argument("--real", action="store_true")
+    args = parser.parse_args()
+    print(
+        json.dumps(
+            measure_pop_memory(args.pop_size, args.indiv_size, args.obs_dim,
+                               is_integer=(not args.real))))
+
+
+if __name__ == "__main__":
+    main()
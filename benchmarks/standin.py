@@ -0,0 +1,156 @@
+"""Lightweight, deterministic stand-ins for rlenvs objects, so that
+benchmarks do not depend on any particular gym environment."""
+from collections import namedtuple
+
+import numpy as np
+from rlenvs.obs_space import IntegerObsSpace, RealObsSpace
+
+StandinDimension = namedtuple("StandinDimension",
+                              ["lower", "upper", "span", "name"])
+StandinEnvResponse = namedtuple("StandinEnvResponse",
+                                ["obs", "reward", "is_terminal"])
+
+
+def make_standin_dim(lower, upper, is_integer, name=None):
+    span = ((upper - lower + 1) if is_integer else (upper - lower))
+    return StandinDimension(lower, upper, span, name)
+
+
+class _StandinObsSpaceMixin:
+    def __init__(self, dims):
+        self._dims = tuple(dims)
+
+    @property
+    def dims(self):
+        return self._dims
+
+    def __iter__(self):
+        return iter(self._dims)
+
+    def __len__(self):
+        return len(self._dims)
+
+    def __getitem__(self, idx):
+        return self._dims[idx]
+
+
+class StandinIntegerObsSpace(_StandinObsSpaceMixin, IntegerObsSpace):
+    pass
+
+
+class StandinRealObsSpace(_StandinObsSpaceMixin, RealObsSpace):
+    pass
+
+
+def make_standin_obs_space(obs_dim, is_integer, dim_size=8):
+    """obs_dim dims, each [0, dim_size - 1] for integer spaces and
+    [0.0, 1.0] for real ones."""
+    upper = ((dim_size - 1) if is_integer else 1.0)
+    dims = [
+        make_standin_dim(0, upper, is_integer, name=f"x{idx}")
+        for idx in range(obs_dim)
+    ]
+    cls = (StandinIntegerObsSpace if is_integer else StandinRealObsSpace)
+    return cls(dims)
+
+
+class StandinEnv:
+    """Cheap, deterministic episodic env over a stand-in obs space.
+
+    Initial obss are drawn from the iod rng and subsequent ones from the
+    wrapped rng, mirroring the two rngs of rlenvs envs, so behaviour is
+    fully determined by the seeds given to reseed_iod_rng and
+    reseed_wrapped_rng. Reward is 1 if action equals the "correct" action
+    for the current obs (sum of its discretised values mod num. actions),
+    else 0. Episodes last episode_len steps."""
+    def __init__(self,
+                 obs_dim,
+                 is_integer,
+                 num_actions=4,
+                 episode_len=20,
+                 dim_size=8,
+                 seed=0):
+        assert num_actions >= 2
+        assert episode_len >= 1
+        self._obs_space = make_standin_obs_space(obs_dim, is_integer,
+                                                 dim_size)
+        self._is_integer = is_integer
+        self._action_space = tuple(range(num_actions))
+        self._episode_len = episode_len
+        self._dim_size = dim_size
+        self._obs = None
+        self._num_steps = 0
+        self.reseed_iod_rng(seed)
+        self.reseed_wrapped_rng(seed)
+
+    @property
+    def obs_space(self):
+        return self._obs_space
+
+    @property
+    def action_space(self):
+        return self._action_space
+
+    def reseed_iod_rng(self, new_seed):
+        self._iod_rng = np.random.RandomState(new_seed)
+
+    def reseed_wrapped_rng(self, new_seed):
+        # offset so that iod and wrapped streams differ for the same seed
+        self._wrapped_rng = np.random.RandomState(new_seed + 1)
+
+    def _sample_obs(self, rng):
+        obs_dim = len(self._obs_space)
+        if self._is_integer:
+            return rng.randint(low=0, high=self._dim_size, size=obs_dim)
+        else:
+            return rng.uniform(low=0.0, high=1.0, size=obs_dim)
+
+    def _calc_correct_action(self, obs):
+        if self._is_integer:
+            discretised = obs
+        else:
+            discretised = np.minimum((obs * self._dim_size).astype(int),
+                                     self._dim_size - 1)
+        return int(np.sum(discretised) % len(self._action_space))
+
+    def reset(self):
+        self._obs = self._sample_obs(self._iod_rng)
+        self._num_steps = 0
+        return self._obs
+
+    def step(self, action):
+        assert not self.is_terminal()
+        reward = float(action == self._calc_correct_action(self._obs))
+        self._obs = self._sample_obs(self._wrapped_rng)
+        self._num_steps += 1
+        return StandinEnvResponse(obs=self._obs,
+                                  reward=reward,
+                                  is_terminal=self.is_terminal())
+
+    def is_terminal(self):
+        return self._num_steps >= self._episode_len
+
+
+def make_standin_hyperparams(is_integer, **overrides):
+    """Full set of PPLST hyperparams suitable for stand-in envs."""
+    hyperparams = {
+        "seed": 0,
+        "pop_size": 20,
+        "indiv_size": 50,
+        "tourn_size": 3,
+        "p_cross": 0.7,
+        "p_cross_swap": 0.5,
+        "p_mut": 0.05,
+        "mut_sigma_pcnt": 0.1,
+        "r_nought": (7 if is_integer else 0.5),
+        "weight_I_min": -1.0,
+        "weight_I_max": 1.0,
+        "x_nought": 1.0,
+        "eta": 0.1,
+        "gamma": 0.9,
+        "num_reinf_rollouts": 5,
+        "num_perf_rollouts": 5,
+        "use_indiv_policy_cache": False
+    }
+    hyperparams.update(overrides)
+    return hyperparams
@@ -0,0 +1,345 @@
+"""Timings of PPLST hot paths and of full gens on stand-in envs, plus
+parallel scaling over num. worker processes, checking that results are
+identical to those of serial (in-process) learning.
+
+Usage: python -m benchmarks.suite [--obs-dim N] [--real] [--num-repeats N]
+    [--num-obss N] [--max-cpus N] [--num-gens N] [--num-cluster-workers N]
+    [--output PATH]
+
+Emits one JSON record per line (to stdout, or PATH if given). Exits with
+status 1 if any parallel run's results differ from the serial run's."""
+import argparse
+import copy
+import hashlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from pplst.encoding import (IntegerUnorderedBoundEncoding,
+                            RealUnorderedBoundEncoding)
+from pplst.eval_cache import calc_genotype_key
+from pplst.executor import ClusterExecutor, SerialExecutor, get_num_cpus
+from pplst.frozen_policy import export_policy, load_policy
+from pplst.ga import crossover, mutate
+from pplst.hyperparams import register_hyperparams
+from pplst.inference import (NULL_ACTION, _gen_match_set,
+                             infer_action_and_action_set)
+from pplst.init import init_pop
+from pplst.param_update import update_action_set
+from pplst.pplst import PPLST
+from pplst.rng import seed_rng
+
+from .standin import StandinEnv, make_standin_hyperparams
+
+_INIT_POP_NUM_REPEATS = 3
+_CLUSTER_AUTHKEY_NBYTES = 16
+# for localhost workers to connect, and to exit once done
+_CLUSTER_TIMEOUT_SECS = 60
+
+
+def _make_encoding(obs_space, is_integer):
+    return (IntegerUnorderedBoundEncoding(obs_space)
+            if is_integer else RealUnorderedBoundEncoding(obs_space))
+
+
+def _make_envs(obs_dim, is_integer):
+    """(reinf env, perf env), differing only in seed."""
+    return (StandinEnv(obs_dim, is_integer, seed=0),
+            StandinEnv(obs_dim, is_integer, seed=1))
+
+
+def _time_per_call(func, args_seq, num_repeats, copy_args=False):
+    """Time calling func on each args tuple in args_seq, num_repeats times
+    over, returning (min, median) over repeats of mean secs per call. If
+    copy_args (for funcs that modify their args), each repeat is on fresh
+    deep copies of args_seq, made outside of timing."""
+    assert len(args_seq) > 0
+    secs_per_call = []
+    for _ in range(num_repeats):
+        repeat_args_seq = (copy.deepcopy(args_seq) if copy_args else args_seq)
+        start = time.perf_counter()
+        for args in repeat_args_seq:
+            func(*args)
+        secs_per_call.append((time.perf_counter() - start) / len(args_seq))
+    return (min(secs_per_call), statistics.median(secs_per_call))
+
+
+def _make_record(benchmark, is_integer, obs_dim, **fields):
+    record = {
+        "benchmark": benchmark,
+        "obs_space": ("integer" if is_integer else "real"),
+        "obs_dim": obs_dim
+    }
+    record.update(fields)
+    return record
+
+
+def _make_hot_path_record(name, is_integer, obs_dim, num_calls, timings):
+    (min_secs, median_secs) = timings
+    return _make_record("hot_path",
+                        is_integer,
+                        obs_dim,
+                        name=name,
+                        num_calls=num_calls,
+                        min_secs_per_call=min_secs,
+                        median_secs_per_call=median_secs)
+
+
+def bench_hot_paths(is_integer, obs_dim, num_repeats, num_obss, seed=0):
+    """Time each hot path separately, on an initialised pop and obss drawn
+    from a stand-in env."""
+    hyperparams = make_standin_hyperparams(is_integer, seed=seed)
+    register_hyperparams(hyperparams)
+    seed_rng(seed)
+    (env, _) = _make_envs(obs_dim, is_integer)
+    encoding = _make_encoding(env.obs_space, is_integer)
+    selectable_actions = env.action_space
+    records = []
+
+    timings = _time_per_call(init_pop, [(encoding, selectable_actions)],
+                             num_repeats=_INIT_POP_NUM_REPEATS)
+    records.append(
+        _make_hot_path_record("init_pop", is_integer, obs_dim, 1, timings))
+
+    pop = init_pop(encoding, selectable_actions)
+    indiv = pop[0]
+    obss = [env.reset() for _ in range(num_obss)]
+    obs_args = [(indiv, obs) for obs in obss]
+    for (name, func) in (("_gen_match_set", _gen_match_set),
+                         ("infer_action_and_action_set",
+                          infer_action_and_action_set)):
+        timings = _time_per_call(func, obs_args, num_repeats)
+        records.append(
+            _make_hot_path_record(name, is_integer, obs_dim, len(obs_args),
+                                  timings))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        policy_path = os.path.join(tmp_dir, "policy.bin")
+        export_policy(indiv, policy_path)
+        policy = load_policy(policy_path)
+        timings = _time_per_call(policy.select_action, [(obs, )
+                                                        for obs in obss],
+                                 num_repeats)
+        records.append(
+            _make_hot_path_record("FrozenPolicy.select_action", is_integer,
+                                  obs_dim, len(obss), timings))
+        # drop memory map of file before tmp_dir is removed
+        del policy
+
+    update_args = []
+    for obs in obss:
+        (action, action_set) = infer_action_and_action_set(indiv, obs)
+        if action != NULL_ACTION:
+            update_args.append((action_set, 1.0, obs))
+    if len(update_args) > 0:
+        timings = _time_per_call(update_action_set, update_args, num_repeats)
+        records.append(
+            _make_hot_path_record("update_action_set", is_integer, obs_dim,
+                                  len(update_args), timings))
+
+    # mutate in place on copies so each repeat starts from the same pop
+    mutate_args = [(indiv, encoding) for indiv in pop]
+    timings = _time_per_call(mutate, mutate_args, num_repeats, copy_args=True)
+    records.append(
+        _make_hot_path_record("mutate", is_integer, obs_dim,
+                              len(mutate_args), timings))
+
+    crossover_args = [(parent_a, parent_b, selectable_actions)
+                      for (parent_a, parent_b) in zip(pop[0::2], pop[1::2])]
+    timings = _time_per_call(crossover, crossover_args, num_repeats)
+    records.append(
+        _make_hot_path_record("crossover", is_integer, obs_dim,
+                              len(crossover_args), timings))
+    return records
+
+
+def calc_pop_fingerprint(pop):
+    """Hash of genotypes, learned params and perfs of all of pop, in
+    order."""
+    hasher = hashlib.blake2b(digest_size=16)
+    for indiv in pop:
+        hasher.update(calc_genotype_key(indiv))
+        hasher.update(repr(float(indiv.fitness)).encode())
+    return hasher.hexdigest()
+
+
+def _run_pplst(is_integer, obs_dim, num_gens, seed, **kwargs):
+    """Returns (init secs, per gen secs, per gen pop fingerprints)."""
+    (reinf_env, perf_env) = _make_envs(obs_dim, is_integer)
+    encoding = _make_encoding(reinf_env.obs_space, is_integer)
+    hyperparams = make_standin_hyperparams(is_integer, seed=seed)
+    gen_secs = []
+    fingerprints = []
+    with PPLST(reinf_env, perf_env, encoding, hyperparams,
+               **kwargs) as pplst:
+        start = time.perf_counter()
+        pplst.init()
+        init_secs = (time.perf_counter() - start)
+        for _ in range(num_gens):
+            start = time.perf_counter()
+            pplst.run_gen()
+            gen_secs.append(time.perf_counter() - start)
+            fingerprints.append(calc_pop_fingerprint(pplst.pop))
+    return (init_secs, gen_secs, fingerprints)
+
+
+def _calc_num_cpus_seq(max_cpus):
+    """1, 2, 4, ... up to and including max_cpus."""
+    num_cpus_seq = []
+    num_cpus = 1
+    while num_cpus < max_cpus:
+        num_cpus_seq.append(num_cpus)
+        num_cpus *= 2
+    num_cpus_seq.append(max_cpus)
+    return num_cpus_seq
+
+
+def bench_scaling(is_integer,
+                  obs_dim,
+                  max_cpus,
+                  num_gens,
+                  num_cluster_workers=0,
+                  seed=0):
+    """Time full gens (run_gen) with serial learning, then with worker pools
+    of increasing size, then (if num_cluster_workers > 0) with a cluster of
+    that many localhost workers, checking each parallel run against the
+    serial one gen by gen."""
+    records = []
+    (init_secs, serial_gen_secs,
+     serial_fingerprints) = _run_pplst(is_integer,
+                                       obs_dim,
+                                       num_gens,
+                                       seed,
+                                       executor=SerialExecutor())
+    serial_mean_gen_secs = statistics.mean(serial_gen_secs)
+    records.append(
+        _make_record("run_gen",
+                     is_integer,
+                     obs_dim,
+                     mode="serial",
+                     num_cpus=None,
+                     init_secs=init_secs,
+                     gen_secs=serial_gen_secs,
+                     mean_gen_secs=serial_mean_gen_secs))
+
+    for num_cpus in _calc_num_cpus_seq(max_cpus):
+        (init_secs, gen_secs,
+         fingerprints) = _run_pplst(is_integer,
+                                    obs_dim,
+                                    num_gens,
+                                    seed,
+                                    num_cpus=num_cpus)
+        mean_gen_secs = statistics.mean(gen_secs)
+        records.append(
+            _make_record("run_gen",
+                         is_integer,
+                         obs_dim,
+                         mode="parallel",
+                         num_cpus=num_cpus,
+                         init_secs=init_secs,
+                         gen_secs=gen_secs,
+                         mean_gen_secs=mean_gen_secs,
+                         speedup_vs_serial=(serial_mean_gen_secs /
+                                            mean_gen_secs),
+                         matches_serial=(fingerprints == serial_fingerprints)))
+
+    if num_cluster_workers > 0:
+        (init_secs, gen_secs,
+         fingerprints) = _run_pplst_on_local_cluster(is_integer, obs_dim,
+                                                     num_gens, seed,
+                                                     num_cluster_workers)
+        mean_gen_secs = statistics.mean(gen_secs)
+        records.append(
+            _make_record("run_gen",
+                         is_integer,
+                         obs_dim,
+                         mode="cluster",
+                         num_cpus=num_cluster_workers,
+                         init_secs=init_secs,
+                         gen_secs=gen_secs,
+                         mean_gen_secs=mean_gen_secs,
+                         speedup_vs_serial=(serial_mean_gen_secs /
+                                            mean_gen_secs),
+                         matches_serial=(fingerprints == serial_fingerprints)))
+    return records
+
+
+def _run_pplst_on_local_cluster(is_integer, obs_dim, num_gens, seed,
+                                num_workers):
+    """_run_pplst with a ClusterExecutor driving num_workers worker
+    processes on this host."""
+    executor = ClusterExecutor(("localhost", 0),
+                               authkey=os.urandom(_CLUSTER_AUTHKEY_NBYTES),
+                               connect_timeout=_CLUSTER_TIMEOUT_SECS)
+    worker_procs = executor.launch_local_workers(num_workers)
+    try:
+        return _run_pplst(is_integer,
+                          obs_dim,
+                          num_gens,
+                          seed,
+                          executor=executor)
+    finally:
+        # workers exit once driver closes their connections
+        executor.close()
+        for proc in worker_procs:
+            try:
+                proc.wait(timeout=_CLUSTER_TIMEOUT_SECS)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+def _make_meta_record():
+    return {
+        "benchmark": "meta",
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "num_cpus_available": get_num_cpus(),
+        "timestamp": time.time()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--obs-dim", type=int, default=4)
+    parser.add_argument("--real", action="store_true")
+    parser.add_argument("--num-repeats", type=int, default=5)
+    parser.add_argument("--num-obss", type=int, default=200)
+    parser.add_argument("--max-cpus", type=int, default=get_num_cpus())
+    parser.add_argument("--num-gens", type=int, default=3)
+    parser.add_argument("--num-cluster-workers", type=int, default=2)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+    is_integer = (not args.real)
+
+    records = [_make_meta_record()]
+    records.extend(
+        bench_hot_paths(is_integer, args.obs_dim, args.num_repeats,
+                        args.num_obss))
+    records.extend(
+        bench_scaling(is_integer, args.obs_dim, args.max_cpus,
+                      args.num_gens, args.num_cluster_workers))
+
+    out_file = (open(args.output, "w")
+                if args.output is not None else sys.stdout)
+    try:
+        for record in records:
+            out_file.write(json.dumps(record) + "\n")
+    finally:
+        if out_file is not sys.stdout:
+            out_file.close()
+
+    all_match = all(record["matches_serial"] for record in records
+                    if "matches_serial" in record)
+    sys.exit(0 if all_match else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""Append-only on-disk archive of every evaluated Indiv of a run: genotype,
+learned params, fitness, lineage (parent ids) and gen of evaluation.
+
+An archive is a dir holding one file per field, each a flat array of
+fixed-width records (fields as per transport.calc_pop_array_layouts, plus
+gens and fitnesses) that grows by appending, and a meta file giving record
+layouts and num committed records. Appends write to field files, then
+commit by replacing the meta file, so readers (incl. those in other
+processes) only ever see whole appends, and a writer interrupted mid-append
+loses just that append.
+
+Records are in gen order. Queries read only the fields they need, via
+read-only memory maps: arrays from these are invalidated by
+discard_after_gen, or by opening the archive writable (which discards any
+uncommitted records)."""
+import json
+import os
+
+import numpy as np
+
+from .transport import calc_pop_array_layouts, pack_indiv
+
+_FORMAT_VERSION = 1
+_META_FILENAME = "meta.json"
+_FIELD_FILE_EXT = ".bin"
+
+
+def _calc_field_layouts(indiv_size, obs_dim, allele_dtype):
+    """{field name: (record shape, dtype)}."""
+    layouts = {"gens": ((), np.dtype(np.int64)),
+               "fitnesses": ((), np.dtype(np.float64))}
+    for (name, (shape, dtype)) in calc_pop_array_layouts(
+            1, indiv_size, obs_dim, allele_dtype).items():
+        layouts[name] = (shape[1:], np.dtype(dtype))
+    return layouts
+
+
+class IndivArchive:
+    """Make via create or open."""
+    def __init__(self, path, writable):
+        self._path = path
+        self._writable = writable
+        meta = _read_meta(path)
+        assert meta["format_version"] == _FORMAT_VERSION
+        self._meta_fields = meta["fields"]
+        self._layouts = {
+            name: (tuple(shape), np.dtype(dtype_str))
+            for (name, (shape, dtype_str)) in self._meta_fields.items()
+        }
+        self._num_records = meta["num_records"]
+        # memory maps of fields, valid for current num records
+        self._columns = {}
+        self._fps = {}
+        if writable:
+            self._truncate_field_files()
+            self._fps = {
+                name: open(_calc_field_path(self._path, name), "ab")
+                for name in self._layouts
+            }
+
+    @classmethod
+    def create(cls, path, encoding, indiv_size):
+        """Make new (empty, writable) archive in dir at path, for Indivs of
+        indiv_size rules whose conditions are encoded by encoding."""
+        os.makedirs(path, exist_ok=True)
+        assert not os.path.exists(os.path.join(path, _META_FILENAME)), \
+            f"Archive already exists at {path}"
+        layouts = _calc_field_layouts(indiv_size, len(encoding.obs_space),
+                                      encoding.allele_dtype)
+        for name in layouts:
+            open(_calc_field_path(path, name), "wb").close()
+        fields = {
+            name: (list(shape), dtype.str)
+            for (name, (shape, dtype)) in layouts.items()
+        }
+        _write_meta(path, fields, num_records=0)
+        return cls(path, writable=True)
+
+    @classmethod
+    def open(cls, path, writable=False):
+        """Open existing archive: for appending to (e.g. when resuming a
+        run) if writable, else for queries only."""
+        return cls(path, writable)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Safe to call multiple times."""
+        for fp in self._fps.values():
+            fp.close()
+        self._fps = {}
+        self._columns = {}
+
+    def __len__(self):
+        return self._num_records
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def field_names(self):
+        return list(self._layouts)
+
+    @property
+    def last_gen(self):
+        """Gen of most recent records, None if empty."""
+        return (int(self.column("gens")[-1])
+                if self._num_records > 0 else None)
+
+    def refresh(self):
+        """See records committed (by another process) since opened or last
+        refreshed."""
+        assert not self._writable
+        self._num_records = _read_meta(self._path)["num_records"]
+        self._columns = {}
+
+    def append(self, gen, indivs):
+        """Append records of (evaluated) indivs as of gen, which must not be
+        before that of any records already in archive."""
+        assert self._writable
+        if len(indivs) == 0:
+            return
+        last_gen = self.last_gen
+        assert last_gen is None or gen >= last_gen
+        arrays = {
+            name: np.empty(shape=((len(indivs), ) + shape), dtype=dtype)
+            for (name, (shape, dtype)) in self._layouts.items()
+        }
+        for (idx, indiv) in enumerate(indivs):
+            pack_indiv(arrays, idx, indiv)
+            arrays["fitnesses"][idx] = indiv.fitness
+        arrays["gens"][:] = gen
+        for (name, fp) in self._fps.items():
+            arrays[name].tofile(fp)
+        # records must be on disk before commit makes them visible
+        for fp in self._fps.values():
+            fp.flush()
+            os.fsync(fp.fileno())
+        self._commit(self._num_records + len(indivs))
+
+    def discard_after_gen(self, gen):
+        """Drop all records of gens after gen, e.g. those written after the
+        checkpoint a run is being resumed from."""
+        assert self._writable
+        num_records = int(
+            np.searchsorted(self.column("gens"), gen, side="right"))
+        if num_records < self._num_records:
+            self._commit(num_records)
+            self._truncate_field_files()
+
+    def column(self, name):
+        """All records' values of field name, as a read-only memory map."""
+        try:
+            return self._columns[name]
+        except KeyError:
+            (shape, dtype) = self._layouts[name]
+            shape = ((self._num_records, ) + shape)
+            if self._num_records > 0:
+                column = np.memmap(_calc_field_path(self._path, name),
+                                   dtype=dtype,
+                                   mode="r",
+                                   shape=shape)
+            else:
+                # empty files cannot be memory mapped
+                column = np.empty(shape=shape, dtype=dtype)
+            self._columns[name] = column
+            return column
+
+    def read(self, record_idxs, field_names=None):
+        """{field name: values of records at record_idxs (slice or idxs)},
+        copied into memory, for given fields (default: all)."""
+        field_names = (field_names
+                       if field_names is not None else self._layouts)
+        return {
+            name: np.array(self.column(name)[record_idxs])
+            for name in field_names
+        }
+
+    def gen_slice(self, start_gen, stop_gen=None):
+        """Slice of records of gens in [start_gen, stop_gen) (default: just
+        start_gen), found by bisection."""
+        stop_gen = (stop_gen if stop_gen is not None else start_gen + 1)
+        gens = self.column("gens")
+        return slice(int(np.searchsorted(gens, start_gen, side="left")),
+                     int(np.searchsorted(gens, stop_gen, side="left")))
+
+    def select(self,
+               start_gen=None,
+               stop_gen=None,
+               min_fitness=None,
+               max_fitness=None):
+        """Idxs of records of gens in [start_gen, stop_gen) (default: all)
+        with fitness in [min_fitness, max_fitness] (default: any)."""
+        gen_slice = self._calc_gen_slice(start_gen, stop_gen)
+        fitnesses = self.column("fitnesses")[gen_slice]
+        mask = np.ones(shape=len(fitnesses), dtype=bool)
+        if min_fitness is not None:
+            mask &= (fitnesses >= min_fitness)
+        if max_fitness is not None:
+            mask &= (fitnesses <= max_fitness)
+        return (gen_slice.start + np.flatnonzero(mask))
+
+    def fittest(self, num, start_gen=None, stop_gen=None):
+        """Idxs of num fittest records of gens in [start_gen, stop_gen)
+        (default: all), fittest first, ties broken by record order."""
+        gen_slice = self._calc_gen_slice(start_gen, stop_gen)
+        fitnesses = self.column("fitnesses")[gen_slice]
+        return (gen_slice.start +
+                np.argsort(-fitnesses, kind="stable")[:num])
+
+    def find_ids(self, indiv_ids):
+        """Idxs of records of Indivs with any of indiv_ids, in record
+        order."""
+        return np.flatnonzero(np.isin(self.column("ids"), indiv_ids))
+
+    def _calc_gen_slice(self, start_gen, stop_gen):
+        if start_gen is None and stop_gen is None:
+            return slice(0, self._num_records)
+        gens = self.column("gens")
+        return self.gen_slice(
+            (start_gen if start_gen is not None else int(gens[0])),
+            (stop_gen if stop_gen is not None else int(gens[-1]) + 1))
+
+    def _commit(self, num_records):
+        _write_meta(self._path, self._meta_fields, num_records)
+        self._num_records = num_records
+        self._columns = {}
+
+    def _truncate_field_files(self):
+        """Cut field files to num committed records, dropping any partly
+        written appends."""
+        for (name, (shape, dtype)) in self._layouts.items():
+            record_nbytes = int(np.prod(shape)) * dtype.itemsize
+            os.truncate(_calc_field_path(self._path, name),
+                        self._num_records * record_nbytes)
+
+
+def _calc_field_path(path, name):
+    return os.path.join(path, name + _FIELD_FILE_EXT)
+
+
+def _read_meta(path):
+    with open(os.path.join(path, _META_FILENAME)) as fp:
+        return json.load(fp)
+
+
+def _write_meta(path, fields, num_records):
+    """Via temp file + rename, so commit is atomic."""
+    meta_path = os.path.join(path, _META_FILENAME)
+    tmp_path = (meta_path + ".tmp")
+    with open(tmp_path, "w") as fp:
+        json.dump(
+            {
+                "format_version": _FORMAT_VERSION,
+                "num_records": num_records,
+                "fields": fields
+            }, fp)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(tmp_path, meta_path)
@@ -0,0 +1,144 @@
+"""Checkpointing of PPLST runs to a single (uncompressed) .npz file holding:
+pop as columnar arrays (see transport.calc_pop_array_layouts) + perf
+assessment results, gen num, hyperparams, rng and indiv id state of the
+run's runtime context, and eval cache entries (if any). This is everything
+that determines how a run continues, so a run resumed from a checkpoint
+continues exactly as if it had not been interrupted (given envs and
+encoding made as for the original run).
+
+Perf assessment results can be of any type so are pickled: only load
+checkpoints from trusted sources."""
+import json
+import os
+import pickle
+from collections import namedtuple
+
+import numpy as np
+
+from .transport import calc_pop_array_layouts, pack_indiv, unpack_indiv
+
+_FORMAT_VERSION = 2
+_RNG_ALGO = "MT19937"
+_POP_PREFIX = "pop_"
+_EVAL_CACHE_PREFIX = "eval_cache_"
+
+Checkpoint = namedtuple("Checkpoint", [
+    "hyperparams_dict", "pop_arrays", "perf_assessment_ress", "gen",
+    "rng_state", "indiv_id_state", "eval_cache_keys",
+    "eval_cache_perf_assessment_ress", "eval_cache_param_arrays"
+])
+
+
+def write_checkpoint(path,
+                     pop,
+                     encoding,
+                     hyperparams_dict,
+                     ctx,
+                     gen,
+                     eval_cache=None):
+    """Write checkpoint to path via temp file + rename, so that if
+    interrupted mid-write any previous checkpoint at path is left intact."""
+    assert len(pop) > 0
+    layouts = calc_pop_array_layouts(pop_size=len(pop),
+                                     indiv_size=len(pop[0]),
+                                     obs_dim=len(encoding.obs_space),
+                                     allele_dtype=encoding.allele_dtype)
+    pop_arrays = {
+        name: np.empty(shape, dtype)
+        for (name, (shape, dtype)) in layouts.items()
+    }
+    for (pop_idx, indiv) in enumerate(pop):
+        pack_indiv(pop_arrays, pop_idx, indiv)
+    arrays = {(_POP_PREFIX + name): arr for (name, arr) in pop_arrays.items()}
+
+    if eval_cache is not None:
+        (eval_cache_keys, eval_cache_perf_assessment_ress,
+         eval_cache_param_arrays) = eval_cache.export_columns()
+    else:
+        (eval_cache_keys, eval_cache_perf_assessment_ress,
+         eval_cache_param_arrays) = ([], [], {})
+    arrays[_EVAL_CACHE_PREFIX + "keys"] = np.array(
+        [np.frombuffer(key, dtype=np.uint8) for key in eval_cache_keys],
+        dtype=np.uint8)
+    for (name, arr) in eval_cache_param_arrays.items():
+        arrays[_EVAL_CACHE_PREFIX + name] = arr
+
+    (rng_algo, rng_keys, rng_pos, rng_has_gauss,
+     rng_cached_gaussian) = ctx.get_rng_state()
+    assert rng_algo == _RNG_ALGO
+    arrays.update({
+        "format_version": np.array(_FORMAT_VERSION),
+        "hyperparams_json": np.array(json.dumps(hyperparams_dict)),
+        "gen": np.array(gen),
+        "rng_keys": rng_keys,
+        "rng_pos": np.array(rng_pos),
+        "rng_has_gauss": np.array(rng_has_gauss),
+        "rng_cached_gaussian": np.array(rng_cached_gaussian),
+        "indiv_id_state": np.array(ctx.id_allocator.get_state()),
+        "pickled_perf_assessment_ress": np.frombuffer(pickle.dumps(
+            ([indiv.perf_assessment_res for indiv in pop],
+             eval_cache_perf_assessment_ress)),
+                                                      dtype=np.uint8)
+    })
+
+    tmp_path = (path + ".tmp")
+    with open(tmp_path, "wb") as fp:
+        np.savez(fp, **arrays)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_checkpoint(path):
+    with np.load(path, allow_pickle=False) as npz:
+        assert int(npz["format_version"]) == _FORMAT_VERSION
+        pop_arrays = {}
+        eval_cache_param_arrays = {}
+        for name in npz.files:
+            if name.startswith(_POP_PREFIX):
+                pop_arrays[name[len(_POP_PREFIX):]] = npz[name]
+            elif (name.startswith(_EVAL_CACHE_PREFIX)
+                  and name != (_EVAL_CACHE_PREFIX + "keys")):
+                eval_cache_param_arrays[name[len(_EVAL_CACHE_PREFIX):]] = \
+                    npz[name]
+        (perf_assessment_ress, eval_cache_perf_assessment_ress) = \
+            pickle.loads(npz["pickled_perf_assessment_ress"].tobytes())
+        return Checkpoint(
+            hyperparams_dict=json.loads(str(npz["hyperparams_json"])),
+            pop_arrays=pop_arrays,
+            perf_assessment_ress=perf_assessment_ress,
+            gen=int(npz["gen"]),
+            rng_state=(_RNG_ALGO, npz["rng_keys"], int(npz["rng_pos"]),
+                       int(npz["rng_has_gauss"]),
+                       float(npz["rng_cached_gaussian"])),
+            indiv_id_state=tuple(npz["indiv_id_state"].tolist()),
+            eval_cache_keys=[
+                key.tobytes() for key in npz[_EVAL_CACHE_PREFIX + "keys"]
+            ],
+            eval_cache_perf_assessment_ress=eval_cache_perf_assessment_ress,
+            eval_cache_param_arrays=eval_cache_param_arrays)
+
+
+def restore_pop(checkpoint, encoding, selectable_actions, ctx):
+    """Re-make pop (same ids, learned params and perf assessment results).
+    Requires checkpoint's hyperparams to be those of ctx."""
+    pop = []
+    for (pop_idx, perf_assessment_res) in enumerate(
+            checkpoint.perf_assessment_ress):
+        indiv = unpack_indiv(checkpoint.pop_arrays, pop_idx, encoding,
+                             selectable_actions, ctx)
+        indiv.perf_assessment_res = perf_assessment_res
+        pop.append(indiv)
+    return pop
+
+
+def restore_eval_cache(checkpoint, eval_cache):
+    eval_cache.import_columns(checkpoint.eval_cache_keys,
+                              checkpoint.eval_cache_perf_assessment_ress,
+                              checkpoint.eval_cache_param_arrays)
+
+
+def restore_runtime_state(checkpoint, ctx):
+    """Restore rng and indiv id allocation state of ctx."""
+    ctx.set_rng_state(checkpoint.rng_state)
+    ctx.id_allocator.set_state(checkpoint.indiv_id_state)
@@ -3,22 +3,26 @@ _SPAN_FRAC_MAX_INCL = 1
 
 
 class Condition:
+    # conditions are immutable and there is one per rule, so keep them
+    # compact: just alleles (as tuple) + encoding. the phenotype is decoded
+    # on demand, as inference/learning use the bounds held in RuleStores.
+    __slots__ = ("_alleles", "_encoding")
+
     def __init__(self, alleles, encoding):
-        self._alleles = list(alleles)
+        self._alleles = tuple(alleles)
         self._encoding = encoding
-        # cache the phenotype
-        self._phenotype = self._encoding.decode(self._alleles)
-        self._matching_idx_order = \
-            self._calc_matching_idx_order(self._phenotype,
-                                          obs_space=self._encoding.obs_space)
 
     @property
     def alleles(self):
-        return self._alleles
+        return list(self._alleles)
+
+    @property
+    def encoding(self):
+        return self._encoding
 
     @property
     def phenotype(self):
-        return self._phenotype
+        return self._encoding.decode(self._alleles)
 
     def _calc_matching_idx_order(self, phenotype, obs_space):
         # first calc "span fracs" of all intervals in phenotype relative to
@@ -39,8 +43,11 @@ class Condition:
         return matching_idx_order
 
     def does_match(self, obs):
-        for idx in self._matching_idx_order:
-            interval = self._phenotype[idx]
+        phenotype = self.phenotype
+        matching_idx_order = self._calc_matching_idx_order(
+            phenotype, obs_space=self._encoding.obs_space)
+        for idx in matching_idx_order:
+            interval = phenotype[idx]
             obs_val = obs[idx]
             if not interval.contains_val(obs_val):
                 return False
@@ -54,7 +61,7 @@ class Condition:
         return self._alleles == other._alleles
 
     def __len__(self):
-        return len(self._phenotype)
+        return (len(self._alleles) // 2)
 
     def __str__(self):
-        return " && ".join([str(interval) for interval in self._phenotype])
+        return " && ".join([str(interval) for interval in self.phenotype])
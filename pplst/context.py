@@ -0,0 +1,175 @@
+"""Runtime context of a PPLST run: its hyperparams (frozen), rng, indiv id
+allocator and per-process learning state.
+
+Each PPLST owns a RuntimeContext and passes it explicitly to init, ga,
+encoding, rule, param_update and indiv functions, so several runs can live
+in one process. Code that is not given a context uses the *active* one:
+that made active in the current thread via use_context (as PPLST does for
+the duration of each of its methods), else the process-wide default. The
+module-level functions of hyperparams, rng and ids act on the active
+context, i.e. are a shim over this module for code written against them."""
+import contextlib
+import threading
+from types import MappingProxyType
+
+import numpy as np
+
+# sentinel for "no default given", since None is a valid default
+NO_DEFAULT = object()
+
+_INT_HYPERPARAMS = ("seed", "pop_size", "indiv_size", "tourn_size",
+                    "num_reinf_rollouts", "num_perf_rollouts")
+_FLOAT_HYPERPARAMS = ("p_cross", "p_cross_swap", "p_mut", "weight_I_min",
+                      "weight_I_max", "x_nought", "eta", "gamma",
+                      "mut_sigma_pcnt")
+
+
+def _coerce_hyperparam(name, val):
+    if name in _INT_HYPERPARAMS:
+        return int(val)
+    elif name in _FLOAT_HYPERPARAMS:
+        return float(val)
+    else:
+        return val
+
+
+class Hyperparams:
+    """Frozen mapping of hyperparams, with core numeric ones converted to
+    Python int/float. Read via attrs (required hyperparams) or
+    get (as for hyperparams.get_hyperparam)."""
+    __slots__ = ("_vals", )
+
+    def __init__(self, hyperparams_dict):
+        object.__setattr__(
+            self, "_vals",
+            MappingProxyType({
+                name: _coerce_hyperparam(name, val)
+                for (name, val) in hyperparams_dict.items()
+            }))
+
+    def __reduce__(self):
+        return (Hyperparams, (self.as_dict(), ))
+
+    def __getattr__(self, name):
+        try:
+            return self._vals[name]
+        except KeyError:
+            raise AttributeError(f"No hyperparam {name!r}") from None
+
+    def __setattr__(self, name, val):
+        raise AttributeError("Hyperparams are frozen")
+
+    def __contains__(self, name):
+        return name in self._vals
+
+    def get(self, name, default=NO_DEFAULT):
+        """default is only for optional hyperparams, i.e. those which enable
+        optional features."""
+        try:
+            return self._vals[name]
+        except KeyError:
+            if default is NO_DEFAULT:
+                raise
+            return default
+
+    def updated(self, hyperparams_dict):
+        """New Hyperparams with hyperparams_dict merged over these."""
+        return Hyperparams({**self._vals, **hyperparams_dict})
+
+    def as_dict(self):
+        return dict(self._vals)
+
+
+class IndivIdAllocator:
+    """ids are allocated as offset + (stride * n) for n = 0, 1, ..., so that
+    disjoint id spaces can be given to e.g. islands while keeping ids
+    small."""
+    def __init__(self, offset=0, stride=1):
+        self.set_space(offset, stride)
+
+    def next_id(self):
+        indiv_id = (self._offset + self._stride * self._num_allocated)
+        self._num_allocated += 1
+        return indiv_id
+
+    def set_space(self, offset, stride):
+        """Restart allocation from offset, in steps of stride."""
+        assert 0 <= offset < stride
+        (self._offset, self._stride, self._num_allocated) = (offset, stride,
+                                                             0)
+
+    def get_state(self):
+        return (self._offset, self._stride, self._num_allocated)
+
+    def set_state(self, state):
+        (self._offset, self._stride, self._num_allocated) = state
+
+
+class RuntimeContext:
+    def __init__(self, hyperparams_dict=None):
+        self.hyperparams = Hyperparams(
+            hyperparams_dict if hyperparams_dict is not None else {})
+        self._rng = np.random.RandomState()
+        self._has_seeded_rng = False
+        self.id_allocator = IndivIdAllocator()
+        # per-process learning state set up by executor worker initialisers,
+        # see pplst._init_worker
+        self.worker_state = None
+        # profiling.TaskCounters of task being run under this context, None
+        # if not profiling
+        self.active_counters = None
+
+    @classmethod
+    def for_run(cls, hyperparams_dict):
+        """Context with rng seeded as per hyperparams."""
+        ctx = cls(hyperparams_dict)
+        ctx.seed_rng(ctx.hyperparams.seed)
+        return ctx
+
+    def register_hyperparams(self, hyperparams_dict):
+        """Replace hyperparams with ones that have hyperparams_dict merged
+        in."""
+        self.hyperparams = self.hyperparams.updated(hyperparams_dict)
+
+    @property
+    def rng(self):
+        assert self._has_seeded_rng
+        return self._rng
+
+    def seed_rng(self, seed):
+        self._rng.seed(int(seed))
+        self._has_seeded_rng = True
+
+    def get_rng_state(self):
+        return self._rng.get_state()
+
+    def set_rng_state(self, state):
+        self._rng.set_state(state)
+        self._has_seeded_rng = True
+
+
+_default_ctx = RuntimeContext()
+_thread_local = threading.local()
+
+
+def get_context():
+    """Active context of current thread."""
+    return getattr(_thread_local, "ctx", _default_ctx)
+
+
+def get_default_context():
+    return _default_ctx
+
+
+@contextlib.contextmanager
+def use_context(ctx):
+    """Make ctx the active context of current thread for duration."""
+    prev_ctx = getattr(_thread_local, "ctx", None)
+    _thread_local.ctx = ctx
+    try:
+        yield ctx
+    finally:
+        if prev_ctx is None:
+            del _thread_local.ctx
+        else:
+            _thread_local.ctx = prev_ctx
@@ -1,17 +1,20 @@
 import abc
 import math
 
+import numpy as np
+
 from rlenvs.obs_space import IntegerObsSpace, RealObsSpace
 
 from .condition import Condition
-from .hyperparams import get_hyperparam as get_hp
-from .interval import IntegerInterval, RealInterval
-from .rng import get_rng
+from .context import get_context
+from .interval import RealInterval, make_integer_interval
 
 _GENERALITY_UB_INCL = 1.0
 
 
 class EncodingABC(metaclass=abc.ABCMeta):
+    _ALLELE_DTYPE = None
+
     def __init__(self, obs_space):
         self._obs_space = obs_space
 
@@ -19,8 +22,14 @@ class EncodingABC(metaclass=abc.ABCMeta):
     def obs_space(self):
         return self._obs_space
 
+    @property
+    def allele_dtype(self):
+        """NumPy dtype able to hold alleles exactly, for packing conditions
+        into arrays."""
+        return self._ALLELE_DTYPE
+
     @abc.abstractmethod
-    def init_condition(self):
+    def init_condition(self, ctx=None):
         raise NotImplementedError
 
     @abc.abstractmethod
@@ -32,29 +41,78 @@ class EncodingABC(metaclass=abc.ABCMeta):
         raise NotImplementedError
 
     @abc.abstractmethod
-    def mutate_condition_alleles(self, cond_alleles):
+    def mutate_condition_alleles(self, cond_alleles, ctx=None):
         raise NotImplementedError
 
 
 class UnorderedBoundEncodingABC(EncodingABC, metaclass=abc.ABCMeta):
-    def init_condition(self):
+    """Bulk methods operate on arrays of shape (num conditions, obs dim, 2):
+    for alleles, the last axis is the (unordered) allele pair of each dim;
+    for bounds, it is (lower, upper).
+
+    Methods that draw from rng take ctx, the runtime context whose rng and
+    hyperparams to use (default: active context)."""
+    def __init__(self, obs_space):
+        super().__init__(obs_space)
+        # per dim constants for mutation and bulk ops
+        self._dim_lowers = np.array([dim.lower for dim in obs_space])
+        self._dim_uppers = np.array([dim.upper for dim in obs_space])
+        self._dim_spans = np.array([dim.span for dim in obs_space])
+
+    def init_condition(self, ctx=None):
+        ctx = (ctx if ctx is not None else get_context())
+        rng = ctx.rng
         num_alleles = (len(self._obs_space) * 2)
         cond_alleles = []
         for dim in self._obs_space:
-            (lower, upper) = self._init_alleles_for_dim(dim)
+            (lower, upper) = self._init_alleles_for_dim(dim, ctx)
             dim_alleles = [lower, upper]
             # to avoid bias, insert alleles into genotype in random order
-            get_rng().shuffle(dim_alleles)
+            rng.shuffle(dim_alleles)
             for allele in dim_alleles:
                 cond_alleles.append(allele)
         assert len(cond_alleles) == num_alleles
         return Condition(cond_alleles, self)
 
     @abc.abstractmethod
-    def _init_alleles_for_dim(self, dim):
+    def _init_alleles_for_dim(self, dim, ctx):
         """Return (lower, upper) init alleles, with lower <= upper."""
         raise NotImplementedError
 
+    def init_condition_alleles_bulk(self, num_conditions, ctx=None):
+        """Bulk equivalent of init_condition (same distribution, but
+        different consumption of the rng stream), returning alleles array."""
+        ctx = (ctx if ctx is not None else get_context())
+        bounds = self._init_bounds_bulk(num_conditions, ctx)
+        # to avoid bias, put alleles of each dim into genotype in random
+        # order
+        do_swap = (ctx.rng.random_sample(size=bounds.shape[:2]) < 0.5)
+        alleles = np.where(do_swap[:, :, np.newaxis], bounds[:, :, ::-1],
+                           bounds)
+        return alleles.astype(self._ALLELE_DTYPE)
+
+    @abc.abstractmethod
+    def _init_bounds_bulk(self, num_conditions, ctx):
+        """Return bounds array of init (lower, upper) for all conditions, as
+        per _init_alleles_for_dim."""
+        raise NotImplementedError
+
+    def decode_bulk(self, alleles):
+        """Bulk equivalent of decode, returning bounds array."""
+        alleles = np.asarray(alleles)
+        assert alleles.ndim == 3 and alleles.shape[2] == 2
+        return np.stack((np.min(alleles, axis=2), np.max(alleles, axis=2)),
+                        axis=2)
+
+    def make_conditions_bulk(self, alleles):
+        """Make Condition objs. from alleles array."""
+        alleles = np.asarray(alleles)
+        num_conditions = alleles.shape[0]
+        return [
+            Condition(cond_alleles, self) for cond_alleles in np.reshape(
+                alleles, (num_conditions, -1)).tolist()
+        ]
+
     def decode(self, cond_alleles):
         phenotype = []
         assert len(cond_alleles) % 2 == 0
@@ -63,24 +121,32 @@ class UnorderedBoundEncodingABC(EncodingABC, metaclass=abc.ABCMeta):
             second_allele = cond_alleles[i + 1]
             lower = min(first_allele, second_allele)
             upper = max(first_allele, second_allele)
-            phenotype.append(self._INTERVAL_CLS(lower, upper))
+            phenotype.append(self._make_interval(lower, upper))
         assert len(phenotype) == len(cond_alleles) // 2
         return phenotype
 
+    @abc.abstractmethod
+    def _make_interval(self, lower, upper):
+        raise NotImplementedError
+
     @abc.abstractmethod
     def calc_condition_generality(self, cond_intervals):
         raise NotImplementedError
 
-    def mutate_condition_alleles(self, alleles):
+    def mutate_condition_alleles(self, alleles, ctx=None):
+        ctx = (ctx if ctx is not None else get_context())
+        # looked up once rather than per allele
+        (rng, p_mut) = (ctx.rng, ctx.hyperparams.p_mut)
         assert len(alleles) % 2 == 0
         # iterate in allele pairs (i.e. over each dim)
         allele_pairs = [(alleles[i], alleles[i + 1])
                         for i in range(0, len(alleles), 2)]
         mut_alleles = []
-        for (allele_pair, dim) in zip(allele_pairs, self._obs_space):
+        for (dim_idx, (allele_pair, dim)) in enumerate(
+                zip(allele_pairs, self._obs_space)):
             for allele in allele_pair:
-                if get_rng().random() < get_hp("p_mut"):
-                    noise = self._gen_mutation_noise(dim)
+                if rng.random() < p_mut:
+                    noise = self._gen_mutation_noise(dim_idx, ctx)
                     mut_allele = (allele + noise)
                     mut_allele = max(mut_allele, dim.lower)
                     mut_allele = min(mut_allele, dim.upper)
@@ -91,30 +157,73 @@ class UnorderedBoundEncodingABC(EncodingABC, metaclass=abc.ABCMeta):
         return mut_alleles
 
     @abc.abstractmethod
-    def _gen_mutation_noise(self, dim):
-        """Mutation noise, *inclusive of sign*"""
+    def _gen_mutation_noise(self, dim_idx, ctx):
+        """Mutation noise, *inclusive of sign*, for allele of dim at
+        dim_idx."""
+        raise NotImplementedError
+
+    def mutate_condition_alleles_bulk(self, alleles, ctx=None):
+        """Bulk equivalent of mutate_condition_alleles on alleles array,
+        returning mutated copy.
+
+        Reproducibility: for given rng state, draws are made in a fixed order
+        whose size depends only on alleles.shape (not on which alleles end up
+        mutated): first the (num conditions, obs dim, 2) U[0, 1) mutation
+        mask, then mutation noise for *every* allele (see
+        _gen_mutation_noise_bulk). Same seed + same shapes => same result,
+        though not the same as per-condition mutate_condition_alleles."""
+        ctx = (ctx if ctx is not None else get_context())
+        alleles = np.asarray(alleles)
+        assert alleles.ndim == 3 and alleles.shape[1:] == (len(
+            self._obs_space), 2)
+        do_mut = (ctx.rng.random_sample(size=alleles.shape) <
+                  ctx.hyperparams.p_mut)
+        noise = self._gen_mutation_noise_bulk(alleles.shape, ctx)
+        mut_alleles = np.clip(alleles + noise,
+                              a_min=self._dim_lowers[:, np.newaxis],
+                              a_max=self._dim_uppers[:, np.newaxis])
+        return np.where(do_mut, mut_alleles,
+                        alleles).astype(self._ALLELE_DTYPE)
+
+    @abc.abstractmethod
+    def _gen_mutation_noise_bulk(self, shape, ctx):
+        """Mutation noise (inclusive of sign) for alleles array of shape."""
         raise NotImplementedError
 
 
 class IntegerUnorderedBoundEncoding(UnorderedBoundEncodingABC):
     _GENERALITY_LB_EXCL = 0
-    _INTERVAL_CLS = IntegerInterval
+    _ALLELE_DTYPE = np.int64
     _GEOM_MUT_TARGET_MASS = 0.99
 
     def __init__(self, obs_space):
         assert isinstance(obs_space, IntegerObsSpace)
         super().__init__(obs_space)
+        # per dim geom. dist. p for mutation
+        self._geom_mut_ps = np.array(
+            [self._calc_geom_mut_p(dim) for dim in self._obs_space])
 
-    def _init_alleles_for_dim(self, dim):
-        r_nought = get_hp("r_nought")
+    def _init_alleles_for_dim(self, dim, ctx):
+        r_nought = ctx.hyperparams.r_nought
         # rand integer ~ [0, r_nought] for lower, upper
-        first = get_rng().randint(low=0, high=(r_nought + 1))
-        second = get_rng().randint(low=0, high=(r_nought + 1))
+        first = ctx.rng.randint(low=0, high=(r_nought + 1))
+        second = ctx.rng.randint(low=0, high=(r_nought + 1))
         lower = min(first, second)
         upper = max(first, second)
         assert lower <= upper
         return (lower, upper)
 
+    def _init_bounds_bulk(self, num_conditions, ctx):
+        r_nought = ctx.hyperparams.r_nought
+        pairs = ctx.rng.randint(low=0,
+                                high=(r_nought + 1),
+                                size=(num_conditions, len(self._obs_space),
+                                      2))
+        return np.sort(pairs, axis=2)
+
+    def _make_interval(self, lower, upper):
+        return make_integer_interval(lower, upper)
+
     def calc_condition_generality(self, cond_intervals):
         # condition generality calc as in
         # Wilson '00 Mining Oblique Data with XCS
@@ -124,38 +233,47 @@ class IntegerUnorderedBoundEncoding(UnorderedBoundEncodingABC):
         assert self._GENERALITY_LB_EXCL < generality <= _GENERALITY_UB_INCL
         return generality
 
-    def _gen_mutation_noise(self, dim):
+    def _gen_mutation_noise(self, dim_idx, ctx):
         """'Dimension aware' geometric mutation."""
         # base noise is integer ~ Geo(p): supported on integers >= 1 i.e.
         # "shifted" geom. dist.
+        geom_noise = ctx.rng.geometric(self._geom_mut_ps[dim_idx])
+        sign = ctx.rng.choice([-1, 1])
+        return (sign * geom_noise)
+
+    def _calc_geom_mut_p(self, dim):
         # set p for geom dist according to satisfying target prob.
         # mass on CDF after k trials, k = floor(dim.span / 2), i.e. satisfy
         # target mass over half dim span
         k = math.floor(dim.span / 2)
         # rearranged CDF eqn. to solve for p
-        p = 1 - (1 - self._GEOM_MUT_TARGET_MASS)**(1 / k)
-        geom_noise = get_rng().geometric(p)
-        sign = get_rng().choice([-1, 1])
-        return (sign * geom_noise)
+        return 1 - (1 - self._GEOM_MUT_TARGET_MASS)**(1 / k)
+
+    def _gen_mutation_noise_bulk(self, shape, ctx):
+        """Geometric noise for all alleles, then signs for all alleles."""
+        geom_noise = ctx.rng.geometric(
+            np.broadcast_to(self._geom_mut_ps[:, np.newaxis], shape))
+        signs = ctx.rng.choice([-1, 1], size=shape)
+        return (signs * geom_noise)
 
 
 class RealUnorderedBoundEncoding(UnorderedBoundEncodingABC):
     _GENERALITY_LB_INCL = 0
-    _INTERVAL_CLS = RealInterval
+    _ALLELE_DTYPE = np.float64
     _MUT_MEAN = 0.0
 
     def __init__(self, obs_space):
         assert isinstance(obs_space, RealObsSpace)
         super().__init__(obs_space)
 
-    def _init_alleles_for_dim(self, dim):
-        center = get_rng().uniform(low=dim.lower, high=dim.upper)
+    def _init_alleles_for_dim(self, dim, ctx):
+        center = ctx.rng.uniform(low=dim.lower, high=dim.upper)
         # for continuous space, r_nought interpreted as fraction of dim span
         # over which to draw noise from for span
-        r_nought = get_hp("r_nought")
+        r_nought = ctx.hyperparams.r_nought
         assert 0.0 < r_nought <= 1.0
         spread_high = (r_nought * dim.span)
-        spread = get_rng().uniform(low=0, high=spread_high)
+        spread = ctx.rng.uniform(low=0, high=spread_high)
         lower = (center - spread)
         upper = (center + spread)
         # trunc
@@ -164,6 +282,23 @@ class RealUnorderedBoundEncoding(UnorderedBoundEncodingABC):
         assert lower <= upper
         return (lower, upper)
 
+    def _init_bounds_bulk(self, num_conditions, ctx):
+        size = (num_conditions, len(self._obs_space))
+        centers = ctx.rng.uniform(low=self._dim_lowers,
+                                  high=self._dim_uppers,
+                                  size=size)
+        r_nought = ctx.hyperparams.r_nought
+        assert 0.0 < r_nought <= 1.0
+        spreads = ctx.rng.uniform(low=0,
+                                  high=(r_nought * self._dim_spans),
+                                  size=size)
+        lowers = np.maximum(centers - spreads, self._dim_lowers)
+        uppers = np.minimum(centers + spreads, self._dim_uppers)
+        return np.stack((lowers, uppers), axis=2)
+
+    def _make_interval(self, lower, upper):
+        return RealInterval(lower, upper)
+
     def calc_condition_generality(self, cond_intervals):
         numer = sum([interval.span for interval in cond_intervals])
         denom = sum([dim.span for dim in self._obs_space])
@@ -171,8 +306,15 @@ class RealUnorderedBoundEncoding(UnorderedBoundEncodingABC):
         assert self._GENERALITY_LB_INCL <= generality <= _GENERALITY_UB_INCL
         return generality
 
-    def _gen_mutation_noise(self, dim):
+    def _gen_mutation_noise(self, dim_idx, ctx):
         """For reals, mutation is Gaussian noise, mean=0, stdev dependent on
         magnitude of dim operating on."""
-        stdev = (get_hp("mut_sigma_pcnt") * dim.span)
-        return get_rng().normal(loc=self._MUT_MEAN, scale=stdev)
+        stdev = (ctx.hyperparams.mut_sigma_pcnt * self._dim_spans[dim_idx])
+        return ctx.rng.normal(loc=self._MUT_MEAN, scale=stdev)
+
+    def _gen_mutation_noise_bulk(self, shape, ctx):
+        """Gaussian noise for all alleles."""
+        stdevs = (ctx.hyperparams.mut_sigma_pcnt * self._dim_spans)
+        return ctx.rng.normal(loc=self._MUT_MEAN,
+                              scale=np.broadcast_to(stdevs[:, np.newaxis],
+                                                    shape))
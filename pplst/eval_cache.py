@@ -0,0 +1,172 @@
+import hashlib
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+_KEY_DIGEST_SIZE = 16
+
+_EvalCacheEntry = namedtuple(
+    "_EvalCacheEntry",
+    ["perf_assessment_res", "weight_mat", "payoff_vars", "payoff_stdevs"])
+
+
+def calc_genotype_key(indiv):
+    """Canonical hash of everything that determines the outcome of learning
+    for indiv: condition alleles, actions and (pre-learning) learned
+    params."""
+    store = indiv.rule_store
+    alleles = np.asarray([rule.condition.alleles for rule in indiv.rules])
+    hasher = hashlib.blake2b(digest_size=_KEY_DIGEST_SIZE)
+    for arr in (alleles, store.actions, store.weight_mat, store.payoff_vars,
+                store.payoff_stdevs):
+        hasher.update(str((arr.dtype, arr.shape)).encode())
+        hasher.update(np.ascontiguousarray(arr).tobytes())
+    return hasher.digest()
+
+
+class EvalCache:
+    """Bounded (LRU) cache of learning outcomes (perf assessment result +
+    learned params) keyed by genotype, so that duplicate Indivs, e.g.
+    unmutated clones of parents, are not re-learned/re-assessed within or
+    across gens.
+
+    Each outcome is keyed by genotype both before and after learning: the
+    latter is what an unmutated clone of an already learned parent looks
+    like.
+
+    Note that a duplicate thus gets the exact outcome of the Indiv it
+    duplicates, rather than that of a fresh evaluation seeded by its own
+    id."""
+    def __init__(self, max_size):
+        assert max_size >= 1
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        self._num_hits = 0
+        self._num_misses = 0
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    @property
+    def num_hits(self):
+        return self._num_hits
+
+    @property
+    def num_misses(self):
+        return self._num_misses
+
+    @property
+    def hit_rate(self):
+        num_lookups = (self._num_hits + self._num_misses)
+        return (self._num_hits / num_lookups if num_lookups > 0 else 0.0)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def run_pop_learning(self, pop, learn_pop_func, is_cacheable_func=None):
+        """Do learning for pop via learn_pop_func, but only on those Indivs
+        whose genotypes are unique within pop and not already in cache. The
+        rest have their learning outcomes filled in from the cache (or from
+        their duplicate in pop). Outcomes for which is_cacheable_func(learned
+        indiv) is False, e.g. perf assessments stopped early by racing, are
+        not cached."""
+        keys = [calc_genotype_key(indiv) for indiv in pop]
+        pop_entries = {}
+        learner_idxs = OrderedDict()
+        for (idx, key) in enumerate(keys):
+            if key in pop_entries or key in learner_idxs:
+                self._num_hits += 1
+                continue
+            try:
+                entry = self._entries[key]
+            except KeyError:
+                self._num_misses += 1
+                learner_idxs[key] = idx
+            else:
+                self._num_hits += 1
+                self._entries.move_to_end(key)
+                pop_entries[key] = entry
+
+        if len(learner_idxs) > 0:
+            learned = learn_pop_func(
+                [pop[idx] for idx in learner_idxs.values()])
+        else:
+            learned = []
+        learned_by_idx = dict(zip(learner_idxs.values(), learned))
+        for (key, indiv) in zip(learner_idxs.keys(), learned):
+            entry = self._make_entry(indiv)
+            pop_entries[key] = entry
+            if is_cacheable_func is None or is_cacheable_func(indiv):
+                self._insert_entry(key, indiv, entry)
+
+        updated_pop = []
+        for (idx, (indiv, key)) in enumerate(zip(pop, keys)):
+            try:
+                updated_pop.append(learned_by_idx[idx])
+            except KeyError:
+                self._apply_entry(pop_entries[key], indiv)
+                updated_pop.append(indiv)
+        return updated_pop
+
+    def add(self, pre_learning_key, indiv):
+        """Cache learning outcome of indiv, learned outside of
+        run_pop_learning (e.g. its perf assessment completed afterwards),
+        given its genotype key before learning."""
+        self._insert_entry(pre_learning_key, indiv, self._make_entry(indiv))
+
+    def export_columns(self):
+        """Entries (least recently used first) as (keys, perf assessment
+        results, {name: stacked learned params arrays}), e.g. for
+        checkpointing."""
+        keys = list(self._entries.keys())
+        entries = list(self._entries.values())
+        perf_assessment_ress = [entry.perf_assessment_res for entry in entries]
+        param_arrays = {
+            name: np.stack([getattr(entry, name) for entry in entries])
+            for name in ("weight_mat", "payoff_vars", "payoff_stdevs")
+        } if len(entries) > 0 else {}
+        return (keys, perf_assessment_ress, param_arrays)
+
+    def import_columns(self, keys, perf_assessment_ress, param_arrays):
+        """Insert entries as exported by export_columns, in order (so LRU
+        order is kept, and only the most recent max_size are kept)."""
+        for (idx, (key, perf_assessment_res)) in enumerate(
+                zip(keys, perf_assessment_ress)):
+            self._insert(
+                key,
+                _EvalCacheEntry(
+                    perf_assessment_res=perf_assessment_res,
+                    weight_mat=param_arrays["weight_mat"][idx].copy(),
+                    payoff_vars=param_arrays["payoff_vars"][idx].copy(),
+                    payoff_stdevs=param_arrays["payoff_stdevs"][idx].copy()))
+
+    def _make_entry(self, indiv):
+        store = indiv.rule_store
+        return _EvalCacheEntry(
+            perf_assessment_res=indiv.perf_assessment_res,
+            weight_mat=store.weight_mat.copy(),
+            payoff_vars=store.payoff_vars.copy(),
+            payoff_stdevs=store.payoff_stdevs.copy())
+
+    def _apply_entry(self, entry, indiv):
+        store = indiv.rule_store
+        store.weight_mat[:] = entry.weight_mat
+        store.payoff_vars[:] = entry.payoff_vars
+        store.payoff_stdevs[:] = entry.payoff_stdevs
+        indiv.perf_assessment_res = entry.perf_assessment_res
+
+    def _insert_entry(self, pre_learning_key, indiv, entry):
+        # under genotype keys before and after learning
+        self._insert(pre_learning_key, entry)
+        self._insert(calc_genotype_key(indiv), entry)
+
+    def _insert(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            # evict least recently used
+            self._entries.popitem(last=False)
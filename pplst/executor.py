@@ -0,0 +1,508 @@
+"""Executors run learning tasks for PPLST: each is started with an
+initializer (+ args) that is run once in every worker before any tasks, then
+maps task funcs over args in parallel (or not), returning results in order.
+Starting again re-initialises all workers, so an executor can be shared by
+successive PPLSTs.
+
+Backends:
+    SerialExecutor: in the calling process, e.g. for debugging/profiling.
+    LocalPoolExecutor: multiprocessing Pool on this node.
+    ClusterExecutor: worker processes on any hosts connect to the driver
+        over TCP (see run_cluster_worker), are sent the initializer once,
+        then are streamed tasks. Tasks of workers that die (or exceed
+        task_timeout) are resubmitted to other workers, so tasks must be
+        deterministic functions of their args.
+
+Task funcs, args and results must be picklable for all but SerialExecutor.
+Usage as a worker: python -m pplst.executor HOST:PORT, with the driver's
+authkey (hex encoded) in env var PPLST_CLUSTER_AUTHKEY."""
+import abc
+import logging
+import os
+import queue
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from multiprocessing import AuthenticationError, Pool
+from multiprocessing.connection import Client, Listener, wait
+
+_AUTHKEY_ENV_VAR = "PPLST_CLUSTER_AUTHKEY"
+# how often driver checks for newly connected workers and timed out tasks
+_POLL_INTERVAL_SECS = 0.1
+
+_logger = logging.getLogger(__name__)
+
+
+def get_num_cpus():
+    """Num CPUs to use for worker pool: that allocated by SLURM if running
+    under it, else those available to this process."""
+    try:
+        return int(os.environ["SLURM_JOB_CPUS_PER_NODE"])
+    except KeyError:
+        try:
+            return len(os.sched_getaffinity(0))
+        except AttributeError:
+            return (os.cpu_count() or 1)
+
+
+class ClusterTaskError(Exception):
+    """A task raised in a cluster worker: not retried, since tasks are
+    deterministic."""
+    pass
+
+
+class ExecutorABC(metaclass=abc.ABCMeta):
+    """Besides starmap, tasks can be run asynchronously: submit returns a
+    task id, and wait_completed blocks until some submitted task(s) are
+    done."""
+    # whether workers share this node's memory, i.e. can use shm transport
+    supports_shared_memory = True
+
+    def __init__(self):
+        self._is_started = False
+        self._next_task_id = 0
+        # ids of submitted tasks not yet returned by wait_completed
+        self._live_task_ids = set()
+
+    @property
+    def is_started(self):
+        return self._is_started
+
+    @property
+    @abc.abstractmethod
+    def capacity(self):
+        """Num tasks that can usefully be in flight at once."""
+        raise NotImplementedError
+
+    @property
+    def num_live_tasks(self):
+        return len(self._live_task_ids)
+
+    def start(self, initializer, initargs):
+        """(Re-)initialise workers with initializer(*initargs)."""
+        self._start(initializer, initargs)
+        self._is_started = True
+
+    @abc.abstractmethod
+    def _start(self, initializer, initargs):
+        raise NotImplementedError
+
+    def starmap(self, func, args_seq):
+        """[func(*args) for args in args_seq], run on workers."""
+        task_ids = [self.submit(func, args) for args in args_seq]
+        results = {}
+        try:
+            while len(results) < len(task_ids):
+                results.update(self.wait_completed())
+        finally:
+            self.cancel([
+                task_id for task_id in task_ids if task_id not in results
+            ])
+        return [results[task_id] for task_id in task_ids]
+
+    def submit(self, func, args):
+        """Submit func(*args) to be run on a worker, returning task id."""
+        assert self._is_started
+        task_id = self._next_task_id
+        self._next_task_id += 1
+        self._live_task_ids.add(task_id)
+        self._submit(task_id, func, args)
+        return task_id
+
+    @abc.abstractmethod
+    def _submit(self, task_id, func, args):
+        raise NotImplementedError
+
+    def wait_completed(self):
+        """Block until at least one submitted task is done, then return
+        {task id: result} of all done so far. Raises if a task raised."""
+        assert len(self._live_task_ids) > 0
+        completed = {}
+        while len(completed) == 0:
+            for (task_id, is_ok, payload) in self._wait_completed():
+                if task_id not in self._live_task_ids:
+                    # cancelled
+                    continue
+                self._live_task_ids.remove(task_id)
+                if not is_ok:
+                    raise payload
+                completed[task_id] = payload
+        return completed
+
+    @abc.abstractmethod
+    def _wait_completed(self):
+        """Block until some task(s) done, returning list of (task id, is ok,
+        result or exception)."""
+        raise NotImplementedError
+
+    def cancel(self, task_ids):
+        """Forget about tasks (their results are discarded), e.g. those left
+        when a starmap raised."""
+        for task_id in task_ids:
+            self._live_task_ids.discard(task_id)
+        self._cancel(task_ids)
+
+    def _cancel(self, task_ids):
+        """Optionally stop tasks from being run."""
+        pass
+
+    @abc.abstractmethod
+    def close(self):
+        """Shut down workers. Safe to call multiple times."""
+        raise NotImplementedError
+
+
+class SerialExecutor(ExecutorABC):
+    """Tasks are run in submission order, one per wait_completed."""
+    def __init__(self):
+        super().__init__()
+        self._queue = deque()
+
+    @property
+    def capacity(self):
+        return 1
+
+    def _start(self, initializer, initargs):
+        initializer(*initargs)
+
+    def starmap(self, func, args_seq):
+        assert self._is_started
+        return [func(*args) for args in args_seq]
+
+    def _submit(self, task_id, func, args):
+        self._queue.append((task_id, func, args))
+
+    def _wait_completed(self):
+        (task_id, func, args) = self._queue.popleft()
+        try:
+            return [(task_id, True, func(*args))]
+        except Exception as e:
+            return [(task_id, False, e)]
+
+    def _cancel(self, task_ids):
+        task_ids = set(task_ids)
+        self._queue = deque(task for task in self._queue
+                            if task[0] not in task_ids)
+
+    def close(self):
+        self._queue.clear()
+
+
+class LocalPoolExecutor(ExecutorABC):
+    def __init__(self, num_cpus=None):
+        super().__init__()
+        self._num_cpus = (num_cpus if num_cpus is not None else
+                          get_num_cpus())
+        assert self._num_cpus >= 1
+        self._pool = None
+        # async results are put here by pool's result handler thread
+        self._completed_queue = queue.SimpleQueue()
+
+    @property
+    def num_cpus(self):
+        return self._num_cpus
+
+    @property
+    def capacity(self):
+        return self._num_cpus
+
+    def _start(self, initializer, initargs):
+        self.close()
+        self._pool = Pool(processes=self._num_cpus,
+                          initializer=initializer,
+                          initargs=initargs)
+
+    def starmap(self, func, args_seq):
+        # pool's own starmap chunks tasks
+        assert self._is_started
+        return self._pool.starmap(func, args_seq)
+
+    def _submit(self, task_id, func, args):
+        completed_queue = self._completed_queue
+        self._pool.apply_async(
+            func,
+            args,
+            callback=lambda res: completed_queue.put((task_id, True, res)),
+            error_callback=lambda e: completed_queue.put((task_id, False, e)))
+
+    def _wait_completed(self):
+        completed = [self._completed_queue.get()]
+        while not self._completed_queue.empty():
+            completed.append(self._completed_queue.get())
+        return completed
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+class _ClusterWorker:
+    """Driver side handle on a connected worker."""
+    def __init__(self, conn):
+        self.conn = conn
+        # task id -> time sent
+        self.inflight = {}
+
+
+class ClusterExecutor(ExecutorABC):
+    """Driver of a TCP worker cluster. Listens on address (port 0 means
+    any free port, see address property) from construction, so workers can
+    connect before or during the run. Connections are authenticated with
+    authkey (bytes).
+
+    Up to max_inflight tasks are kept in flight per worker to hide network
+    latency. If no workers are connected, wait_completed waits for some for
+    up to connect_timeout secs (None means forever)."""
+    supports_shared_memory = False
+
+    def __init__(self,
+                 address,
+                 authkey,
+                 max_inflight=2,
+                 task_timeout=None,
+                 connect_timeout=None):
+        super().__init__()
+        assert max_inflight >= 1
+        self._listener = Listener(address=address, authkey=authkey)
+        self._authkey = authkey
+        self._max_inflight = max_inflight
+        self._task_timeout = task_timeout
+        self._connect_timeout = connect_timeout
+        self._init_msg = None
+        self._workers = []
+        self._new_conns = []
+        self._new_conns_lock = threading.Lock()
+        # task id -> (func, args), for tasks not yet done
+        self._tasks = {}
+        # ids of tasks waiting to be sent to a worker
+        self._pending = deque()
+        self._num_resubmitted = 0
+        self._is_closed = False
+        self._accept_thread = threading.Thread(target=self._accept_conns,
+                                               daemon=True)
+        self._accept_thread.start()
+
+    @property
+    def address(self):
+        return self._listener.address
+
+    @property
+    def num_workers(self):
+        return len(self._workers)
+
+    @property
+    def capacity(self):
+        return (max(len(self._workers), 1) * self._max_inflight)
+
+    @property
+    def num_resubmitted(self):
+        """Num tasks resubmitted due to dead/timed out workers, so far."""
+        return self._num_resubmitted
+
+    def _accept_conns(self):
+        while not self._is_closed:
+            try:
+                conn = self._listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                # failed handshake, or woken up by close()
+                continue
+            with self._new_conns_lock:
+                self._new_conns.append(conn)
+
+    def _start(self, initializer, initargs):
+        self._init_msg = ("init", initializer, initargs)
+        # re-init already connected workers
+        for worker in list(self._workers):
+            try:
+                worker.conn.send(self._init_msg)
+            except OSError:
+                self._drop_worker(worker)
+
+    def _admit_new_workers(self):
+        with self._new_conns_lock:
+            (new_conns, self._new_conns) = (self._new_conns, [])
+        for conn in new_conns:
+            try:
+                conn.send(self._init_msg)
+            except OSError:
+                conn.close()
+                continue
+            self._workers.append(_ClusterWorker(conn))
+
+    def _drop_worker(self, worker):
+        """Close conn to worker and resubmit its inflight tasks."""
+        task_ids = [
+            task_id for task_id in worker.inflight.keys()
+            if task_id in self._tasks
+        ]
+        _logger.warning(f"Dropping cluster worker, resubmitting "
+                        f"{len(task_ids)} tasks")
+        self._workers.remove(worker)
+        worker.conn.close()
+        # front of queue so they are not delayed further
+        self._pending.extendleft(sorted(task_ids, reverse=True))
+        self._num_resubmitted += len(task_ids)
+
+    def _submit(self, task_id, func, args):
+        self._tasks[task_id] = (func, args)
+        self._pending.append(task_id)
+        self._admit_new_workers()
+        self._dispatch()
+
+    def _wait_completed(self):
+        completed = []
+        no_workers_since = None
+        while len(completed) == 0:
+            self._admit_new_workers()
+            self._dispatch()
+            if len(self._workers) == 0:
+                no_workers_since = (no_workers_since or time.monotonic())
+                if (self._connect_timeout is not None and
+                        time.monotonic() - no_workers_since >
+                        self._connect_timeout):
+                    raise RuntimeError("No cluster workers connected")
+                time.sleep(_POLL_INTERVAL_SECS)
+                continue
+            no_workers_since = None
+            conn_workers = {worker.conn: worker for worker in self._workers}
+            for conn in wait(list(conn_workers.keys()),
+                             timeout=_POLL_INTERVAL_SECS):
+                worker = conn_workers[conn]
+                try:
+                    (kind, task_id, payload) = conn.recv()
+                except (EOFError, OSError):
+                    self._drop_worker(worker)
+                    continue
+                if kind == "init_error":
+                    # initializer would fail on other workers too
+                    self._drop_worker(worker)
+                    raise RuntimeError(
+                        f"Cluster worker initializer raised:\n{payload}")
+                del worker.inflight[task_id]
+                if self._tasks.pop(task_id, None) is None:
+                    # cancelled
+                    continue
+                if kind == "error":
+                    completed.append(
+                        (task_id, False, ClusterTaskError(payload)))
+                else:
+                    completed.append((task_id, True, payload))
+            self._drop_timed_out_workers()
+        return completed
+
+    def _dispatch(self):
+        for worker in list(self._workers):
+            while (len(worker.inflight) < self._max_inflight
+                   and len(self._pending) > 0):
+                task_id = self._pending.popleft()
+                if task_id not in self._tasks:
+                    # cancelled
+                    continue
+                (func, args) = self._tasks[task_id]
+                try:
+                    worker.conn.send(("task", task_id, func, args))
+                except OSError:
+                    self._pending.appendleft(task_id)
+                    self._drop_worker(worker)
+                    break
+                worker.inflight[task_id] = time.monotonic()
+
+    def _drop_timed_out_workers(self):
+        if self._task_timeout is None:
+            return
+        now = time.monotonic()
+        for worker in list(self._workers):
+            if any((now - sent_time) > self._task_timeout
+                   for sent_time in worker.inflight.values()):
+                self._drop_worker(worker)
+
+    def _cancel(self, task_ids):
+        for task_id in task_ids:
+            self._tasks.pop(task_id, None)
+
+    def close(self):
+        if self._is_closed:
+            return
+        self._is_closed = True
+        # closing listener does not interrupt a blocking accept, so wake
+        # accept thread up with a dummy connection first
+        try:
+            socket.create_connection(self.address,
+                                     timeout=_POLL_INTERVAL_SECS).close()
+        except OSError:
+            pass
+        self._accept_thread.join()
+        self._listener.close()
+        with self._new_conns_lock:
+            conns = ([worker.conn for worker in self._workers] +
+                     self._new_conns)
+            self._new_conns = []
+        self._workers = []
+        for conn in conns:
+            try:
+                conn.send(("close", ))
+            except OSError:
+                pass
+            conn.close()
+
+    def launch_local_workers(self, num_workers):
+        """Start num_workers worker processes on this host connected to this
+        executor (e.g. for testing), returning their Popen objs."""
+        (host, port) = self.address
+        env = {**os.environ, _AUTHKEY_ENV_VAR: self._authkey.hex()}
+        return [
+            subprocess.Popen(
+                [sys.executable, "-m", "pplst.executor", f"{host}:{port}"],
+                env=env) for _ in range(num_workers)
+        ]
+
+
+def run_cluster_worker(address, authkey):
+    """Worker loop: connect to driver at address, run initializer when sent
+    it, then run tasks until driver closes connection. If initializer
+    raises, the error is sent to the driver (which raises it in turn) and
+    the worker exits."""
+    conn = Client(address, authkey=authkey)
+    try:
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                return
+            kind = msg[0]
+            if kind == "init":
+                (_, initializer, initargs) = msg
+                try:
+                    initializer(*initargs)
+                except Exception:
+                    # no use running tasks: report to driver and exit
+                    conn.send(("init_error", None, traceback.format_exc()))
+                    return
+            elif kind == "task":
+                (_, task_id, func, args) = msg
+                try:
+                    res = ("result", task_id, func(*args))
+                except Exception:
+                    res = ("error", task_id, traceback.format_exc())
+                conn.send(res)
+            else:
+                assert kind == "close"
+                return
+    finally:
+        conn.close()
+
+
+def _main():
+    (host, port) = sys.argv[1].rsplit(":", 1)
+    authkey = bytes.fromhex(os.environ[_AUTHKEY_ENV_VAR])
+    run_cluster_worker((host, int(port)), authkey)
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,191 @@
+"""Frozen policies: an Indiv's condition bounds, actions, weights and payoff
+stdevs (i.e. all that inference uses) exported to a compact, versioned file,
+plus a runtime that selects actions from such a file.
+
+Depends on NumPy only, so policies can be deployed without the rest of
+pplst (or its env deps): copy this module alongside the exported files.
+
+File layout (all little-endian): fixed size header (see _HEADER_DTYPE), then
+arrays (see _calc_array_layout), each starting at a multiple of
+_ARRAY_ALIGNMENT bytes so that they can be used straight from a memory map
+of the file."""
+import os
+
+import numpy as np
+
+# same as inference.NULL_ACTION, which is not imported so as to keep this
+# module NumPy-only
+NULL_ACTION = -1
+
+_MAGIC = b"PPLSTPOL"
+_FORMAT_VERSION = 1
+_ARRAY_ALIGNMENT = 64
+
+_HEADER_DTYPE = np.dtype([("magic", "S8"), ("format_version", "<u4"),
+                          ("num_rules", "<u4"), ("obs_dim", "<u4"),
+                          ("reserved", "<u4"), ("indiv_id", "<i8"),
+                          ("x_nought", "<f8")])
+
+
+def _align(offset):
+    return -(-offset // _ARRAY_ALIGNMENT) * _ARRAY_ALIGNMENT
+
+
+def _check_shape(name, arr, shape):
+    if arr.shape != shape:
+        raise ValueError(f"Bad {name} shape {arr.shape}, expected {shape}")
+
+
+def _calc_array_layout(num_rules, obs_dim):
+    """([(name, shape, dtype, offset)], total file size). dtypes are as in
+    RuleStore, so inference on loaded arrays gives identical results."""
+    (n, d) = (num_rules, obs_dim)
+    layout = []
+    offset = _HEADER_DTYPE.itemsize
+    for (name, shape, dtype) in (("lowers", (n, d), np.dtype("<f8")),
+                                 ("uppers", (n, d), np.dtype("<f8")),
+                                 ("actions", (n, ), np.dtype("<i8")),
+                                 ("weight_mat", (n, d + 1), np.dtype("<f4")),
+                                 ("payoff_stdevs", (n, ), np.dtype("<f8"))):
+        offset = _align(offset)
+        layout.append((name, shape, dtype, offset))
+        offset += int(np.prod(shape)) * dtype.itemsize
+    return (layout, offset)
+
+
+def export_policy(indiv, path):
+    """Write indiv's policy (as of its current learned params) to path via
+    temp file + rename, so that a reader never sees a partial file."""
+    store = indiv.rule_store
+    (num_rules, obs_dim) = store.lowers.shape
+    header = np.zeros(shape=1, dtype=_HEADER_DTYPE)
+    header[0] = (_MAGIC, _FORMAT_VERSION, num_rules, obs_dim, 0, indiv.id,
+                 indiv.x_nought)
+    arrays = {
+        "lowers": store.lowers,
+        "uppers": store.uppers,
+        "actions": store.actions,
+        "weight_mat": store.weight_mat,
+        "payoff_stdevs": store.payoff_stdevs
+    }
+    (layout, size) = _calc_array_layout(num_rules, obs_dim)
+    buf = np.zeros(shape=size, dtype=np.uint8)
+    buf[:_HEADER_DTYPE.itemsize] = header.view(np.uint8)
+    for (name, shape, dtype, offset) in layout:
+        arr = np.ascontiguousarray(arrays[name], dtype=dtype)
+        _check_shape(name, arr, shape)
+        buf[offset:(offset + arr.nbytes)] = arr.reshape(-1).view(np.uint8)
+
+    tmp_path = (path + ".tmp")
+    with open(tmp_path, "wb") as fp:
+        fp.write(buf.tobytes())
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_policy(path, mmap=True):
+    """FrozenPolicy from file at path. If mmap, arrays are (read-only) views
+    of a memory map of the file, else they are read into memory."""
+    if mmap:
+        buf = np.memmap(path, dtype=np.uint8, mode="r")
+    else:
+        buf = np.fromfile(path, dtype=np.uint8)
+        buf.flags.writeable = False
+    if len(buf) < _HEADER_DTYPE.itemsize:
+        raise ValueError("Not a frozen policy file")
+    header = buf[:_HEADER_DTYPE.itemsize].view(_HEADER_DTYPE)[0]
+    if header["magic"] != _MAGIC:
+        raise ValueError("Not a frozen policy file")
+    if header["format_version"] != _FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported format version {header['format_version']}")
+    (layout, size) = _calc_array_layout(int(header["num_rules"]),
+                                        int(header["obs_dim"]))
+    if len(buf) != size:
+        raise ValueError("Truncated or corrupt frozen policy file")
+    arrays = {
+        name: buf[offset:(offset + int(np.prod(shape)) * dtype.itemsize)].view(
+            dtype).reshape(shape)
+        for (name, shape, dtype, offset) in layout
+    }
+    return FrozenPolicy(x_nought=float(header["x_nought"]),
+                        indiv_id=int(header["indiv_id"]),
+                        **arrays)
+
+
+class FrozenPolicy:
+    """Inference for a fixed set of rules, giving the same actions as
+    inference.infer_action (select_action) and
+    inference.infer_actions_and_action_sets (select_actions) do for the
+    Indiv the rules were exported from."""
+    def __init__(self, lowers, uppers, actions, weight_mat, payoff_stdevs,
+                 x_nought, indiv_id):
+        (num_rules, obs_dim) = lowers.shape
+        _check_shape("uppers", uppers, (num_rules, obs_dim))
+        _check_shape("actions", actions, (num_rules, ))
+        _check_shape("weight_mat", weight_mat, (num_rules, obs_dim + 1))
+        _check_shape("payoff_stdevs", payoff_stdevs, (num_rules, ))
+        self._lowers = lowers
+        self._uppers = uppers
+        self._actions = actions
+        self._weight_mat = weight_mat
+        self._payoff_stdevs = payoff_stdevs
+        self._x_nought = x_nought
+        self._indiv_id = indiv_id
+
+    @property
+    def num_rules(self):
+        return len(self._actions)
+
+    @property
+    def obs_dim(self):
+        return self._lowers.shape[1]
+
+    @property
+    def indiv_id(self):
+        """id of the Indiv the policy was exported from."""
+        return self._indiv_id
+
+    @property
+    def x_nought(self):
+        return self._x_nought
+
+    def select_action(self, obs):
+        """Action of obs: that advocated by all matching rules, or if there
+        is a conflict that of the strongest matching rule, or NULL_ACTION if
+        no rule matches."""
+        obs = np.asarray(obs)
+        match_idxs = np.flatnonzero(
+            np.all((self._lowers <= obs) & (obs <= self._uppers), axis=1))
+        if len(match_idxs) == 0:
+            return NULL_ACTION
+        match_actions = self._actions[match_idxs]
+        if np.any(match_actions != match_actions[0]):
+            aug_obs = np.concatenate(([self._x_nought], obs))
+            strengths = ((self._weight_mat[match_idxs] @ aug_obs) -
+                         self._payoff_stdevs[match_idxs])
+            return match_actions[np.argmax(strengths)]
+        else:
+            return match_actions[0]
+
+    def select_actions(self, obs_batch):
+        """Batched select_action: actions array with NULL_ACTION for obss
+        that no rule matches."""
+        obs_batch = np.asarray(obs_batch)
+        match_masks = np.all(
+            (self._lowers <= obs_batch[:, np.newaxis, :]) &
+            (obs_batch[:, np.newaxis, :] <= self._uppers),
+            axis=2)
+        aug_obs_batch = np.hstack((np.full(shape=(len(obs_batch), 1),
+                                           fill_value=self._x_nought),
+                                   obs_batch))
+        # action of strongest matching rule, which if there is no conflict
+        # is the sole action advocated
+        strength_mat = np.where(
+            match_masks,
+            (aug_obs_batch @ self._weight_mat.T) - self._payoff_stdevs,
+            -np.inf)
+        best_rule_idxs = np.argmax(strength_mat, axis=1)
+        return np.where(np.any(match_masks, axis=1),
+                        self._actions[best_rule_idxs], NULL_ACTION)
@@ -1,17 +1,24 @@
+import numpy as np
+
 from .condition import Condition
-from .hyperparams import get_hyperparam as get_hp
+from .context import get_context
 from .indiv import make_indiv
-from .rng import get_rng
+from .rule_store import RuleStore
 
 _MIN_TOURN_SIZE = 2
 
+# functions that draw from rng take ctx, the runtime context whose rng and
+# hyperparams to use (default: active context)
+
 
-def tournament_selection(pop):
-    tourn_size = get_hp("tourn_size")
+def tournament_selection(pop, ctx=None):
+    ctx = (ctx if ctx is not None else get_context())
+    tourn_size = ctx.hyperparams.tourn_size
     assert tourn_size >= _MIN_TOURN_SIZE
+    rng = ctx.rng
 
     def _select_random(pop):
-        idx = get_rng().randint(0, len(pop))
+        idx = rng.randint(0, len(pop))
         return pop[idx]
 
     best = _select_random(pop)
@@ -22,31 +29,52 @@ def tournament_selection(pop):
     return best
 
 
-def crossover(parent_a, parent_b, selectable_actions):
-    if get_rng().random() < get_hp("p_cross"):
+def inverse_tournament_selection(pop, ctx=None):
+    """Idx of tournament loser in pop, i.e. worst of tourn_size randomly
+    selected, e.g. for replacement in steady-state GA."""
+    ctx = (ctx if ctx is not None else get_context())
+    tourn_size = ctx.hyperparams.tourn_size
+    assert tourn_size >= _MIN_TOURN_SIZE
+    rng = ctx.rng
+
+    worst_idx = rng.randint(0, len(pop))
+    for _ in range(_MIN_TOURN_SIZE, (tourn_size + 1)):
+        idx = rng.randint(0, len(pop))
+        if pop[idx].fitness < pop[worst_idx].fitness:
+            worst_idx = idx
+    return worst_idx
+
+
+def crossover(parent_a, parent_b, selectable_actions, ctx=None):
+    ctx = (ctx if ctx is not None else get_context())
+    if ctx.rng.random() < ctx.hyperparams.p_cross:
         return _uniform_crossover_on_rules(parent_a, parent_b,
-                                           selectable_actions)
+                                           selectable_actions, ctx)
     else:
-        return _clone_parents(parent_a, parent_b, selectable_actions)
+        return _clone_parents(parent_a, parent_b, selectable_actions, ctx)
 
 
-def _uniform_crossover_on_rules(parent_a, parent_b, selectable_actions):
+def _uniform_crossover_on_rules(parent_a, parent_b, selectable_actions, ctx):
     """Uniform crossover with swapping acting on whole rules within indivs."""
-    num_rules = get_hp("indiv_size")
+    num_rules = ctx.hyperparams.indiv_size
+    (rng, p_cross_swap) = (ctx.rng, ctx.hyperparams.p_cross_swap)
 
     assert len(parent_a.rules) == num_rules
     assert len(parent_b.rules) == num_rules
-    child_a_rules = parent_a.rules
-    child_b_rules = parent_b.rules
+    # copy lists since parents are not copied
+    child_a_rules = list(parent_a.rules)
+    child_b_rules = list(parent_b.rules)
 
     for idx in range(0, num_rules):
-        if get_rng().random() < get_hp("p_cross_swap"):
+        if rng.random() < p_cross_swap:
             _swap(child_a_rules, child_b_rules, idx)
     assert len(child_a_rules) == num_rules
     assert len(child_b_rules) == num_rules
 
-    child_a = make_indiv(child_a_rules, selectable_actions)
-    child_b = make_indiv(child_b_rules, selectable_actions)
+    # each child has rules of both parents
+    parent_ids = (parent_a.id, parent_b.id)
+    child_a = _make_child(child_a_rules, selectable_actions, parent_ids, ctx)
+    child_b = _make_child(child_b_rules, selectable_actions, parent_ids, ctx)
     return (child_a, child_b)
 
 
@@ -54,33 +82,102 @@ def _swap(seq_a, seq_b, idx):
     seq_a[idx], seq_b[idx] = seq_b[idx], seq_a[idx]
 
 
-def _clone_parents(parent_a, parent_b, selectable_actions):
+def _clone_parents(parent_a, parent_b, selectable_actions, ctx):
     """Re-make make_indiv objects so ids (and possibly policy cache) can be
     inited properly."""
-    child_a = make_indiv(parent_a.rules, selectable_actions)
-    child_b = make_indiv(parent_b.rules, selectable_actions)
+    child_a = _make_child(parent_a.rules, selectable_actions,
+                          (parent_a.id, ), ctx)
+    child_b = _make_child(parent_b.rules, selectable_actions,
+                          (parent_b.id, ), ctx)
     return (child_a, child_b)
 
 
-def mutate(indiv, encoding):
+def _make_child(parent_rules, selectable_actions, parent_ids, ctx):
+    """Copy-on-write child: new (lightweight) Rule objs. that share their
+    immutable conditions with parent rules, but have the parent rules'
+    mutable data (actions, learned params) gathered into the child's own
+    store, so that parents are left untouched by subsequent mutation and
+    learning of the child."""
+    store = RuleStore.gather(parent_rules)
+    rules = [
+        rule.clone_into(store, idx) for (idx, rule) in enumerate(parent_rules)
+    ]
+    child = make_indiv(rules, selectable_actions, rule_store=store, ctx=ctx)
+    child.parent_ids = parent_ids
+    return child
+
+
+def mutate(indiv, encoding, ctx=None):
     """Mutates condition and action of rules contained within indiv by
-    resetting them in Rule object."""
+    resetting them in Rule object. Conditions are immutable (may be shared
+    with parents), so a new one is made only for rules whose alleles
+    change."""
+    ctx = (ctx if ctx is not None else get_context())
     for rule in indiv.rules:
 
         cond_alleles = rule.condition.alleles
-        mut_cond_alleles = encoding.mutate_condition_alleles(cond_alleles)
+        mut_cond_alleles = encoding.mutate_condition_alleles(
+            cond_alleles, ctx)
         cond_alleles_changed = (mut_cond_alleles != cond_alleles)
         # only need to remake condition if alleles have changed
         if cond_alleles_changed:
             rule.condition = Condition(mut_cond_alleles, encoding)
 
-        mut_action = _mutate_action(rule.action, indiv.selectable_actions)
+        mut_action = _mutate_action(rule.action, indiv.selectable_actions,
+                                    ctx)
         rule.action = mut_action
 
 
-def _mutate_action(action, selectable_actions):
-    if get_rng().random() < get_hp("p_mut"):
+def _mutate_action(action, selectable_actions, ctx):
+    if ctx.rng.random() < ctx.hyperparams.p_mut:
         other_actions = list(set(selectable_actions) - {action})
-        return get_rng().choice(other_actions)
+        return ctx.rng.choice(other_actions)
     else:
         return action
+
+
+def mutate_bulk(indivs, encoding, ctx=None):
+    """Batched equivalent of calling mutate on each of indivs (e.g. a whole
+    offspring gen), with all random draws made in a few vectorised calls.
+
+    Reproducibility: for given rng state, draws are made in a fixed order
+    whose sizes depend only on total num rules N and obs dim: condition
+    allele draws as per encoding.mutate_condition_alleles_bulk on (N, obs
+    dim, 2) alleles, then (N, ) U[0, 1) action mutation mask, then (N, )
+    replacement action idxs. Rules are ordered by indiv, then by position in
+    indiv. Same seed + same shapes => same result, though not the same as
+    per-indiv mutate."""
+    ctx = (ctx if ctx is not None else get_context())
+    rules = [rule for indiv in indivs for rule in indiv.rules]
+    num_rules = len(rules)
+    if num_rules == 0:
+        return
+    selectable_actions = list(indivs[0].selectable_actions)
+    num_actions = len(selectable_actions)
+    assert num_actions >= 2
+
+    alleles = np.reshape([rule.condition.alleles for rule in rules],
+                         (num_rules, -1, 2))
+    mut_alleles = encoding.mutate_condition_alleles_bulk(alleles, ctx)
+    do_mut_action = (ctx.rng.random_sample(size=num_rules) <
+                     ctx.hyperparams.p_mut)
+    # replacement is uniform over the *other* actions: draw idx from
+    # (num_actions - 1) then skip over idx of current action
+    other_action_idxs = ctx.rng.randint(0, (num_actions - 1),
+                                        size=num_rules)
+
+    # only need to remake conditions if alleles have changed
+    cond_changed = np.any(mut_alleles != alleles, axis=(1, 2))
+    for rule_idx in np.flatnonzero(cond_changed):
+        rules[rule_idx].condition = Condition(
+            mut_alleles[rule_idx].ravel().tolist(), encoding)
+
+    action_idxs = {action: idx for (idx, action) in
+                   enumerate(selectable_actions)}
+    for rule_idx in np.flatnonzero(do_mut_action):
+        rule = rules[rule_idx]
+        curr_action_idx = action_idxs[rule.action]
+        new_action_idx = other_action_idxs[rule_idx]
+        if new_action_idx >= curr_action_idx:
+            new_action_idx += 1
+        rule.action = selectable_actions[new_action_idx]
@@ -1,10 +1,12 @@
-_hyperparams_registry = {}
+"""Shim over hyperparams of active runtime context (see context module)."""
+from .context import NO_DEFAULT, get_context
 
 
 def register_hyperparams(hyperparams_dict):
-    global _hyperparams_registry
-    _hyperparams_registry = {**_hyperparams_registry, **hyperparams_dict}
+    get_context().register_hyperparams(hyperparams_dict)
 
 
-def get_hyperparam(name):
-    return _hyperparams_registry[name]
+def get_hyperparam(name, default=NO_DEFAULT):
+    """default is only for optional hyperparams, i.e. those which enable
+    optional features."""
+    return get_context().hyperparams.get(name, default)
@@ -1,8 +1,28 @@
-# start at -1 so first id is 0
-_curr_indiv_id = -1
+"""Shim over indiv id allocator of active runtime context (see context
+module)."""
+from .context import get_context
 
 
 def get_next_indiv_id():
-    global _curr_indiv_id
-    _curr_indiv_id += 1
-    return _curr_indiv_id
+    return get_context().id_allocator.next_id()
+
+
+def reset_indiv_ids():
+    """Restart id allocation from 0, e.g. so that multiple runs done one
+    after another in the same context are each reproducible."""
+    set_indiv_id_space(offset=0, stride=1)
+
+
+def set_indiv_id_space(offset, stride):
+    """Restart id allocation from offset, in steps of stride."""
+    get_context().id_allocator.set_space(offset, stride)
+
+
+def get_indiv_id_state():
+    return get_context().id_allocator.get_state()
+
+
+def set_indiv_id_state(state):
+    """Restore state as returned by get_indiv_id_state, e.g. when resuming
+    from a checkpoint."""
+    get_context().id_allocator.set_state(state)
@@ -1,35 +1,63 @@
 import abc
 
+from .context import get_context
 from .error import UnsetPropertyError
 from .inference import infer_action
-from .ids import get_next_indiv_id
-from .hyperparams import get_hyperparam as get_hp
+from .policy_cache import make_policy_cache
+from .rule_store import RuleStore
 
 
-def make_indiv(rules, selectable_actions):
-    use_policy_cache = get_hp("use_indiv_policy_cache")
+def make_indiv(rules,
+               selectable_actions,
+               rule_store=None,
+               indiv_id=None,
+               ctx=None):
+    ctx = (ctx if ctx is not None else get_context())
+    use_policy_cache = ctx.hyperparams.use_indiv_policy_cache
     if use_policy_cache:
         cls = PolicyCacheIndiv
     else:
         cls = Indiv
-    return cls(rules, selectable_actions)
+    return cls(rules, selectable_actions, rule_store, indiv_id, ctx)
 
 
 class IndivABC(metaclass=abc.ABCMeta):
-    def __init__(self, rules, selectable_actions):
+    def __init__(self,
+                 rules,
+                 selectable_actions,
+                 rule_store=None,
+                 indiv_id=None,
+                 ctx=None):
+        """rule_store and indiv_id are only given when re-making an existing
+        Indiv (e.g. from shared memory in another process), in which case
+        rules must already be bound to rule_store. ctx (default: active
+        context) allocates id and gives hyperparams."""
+        ctx = (ctx if ctx is not None else get_context())
         self._rules = list(rules)
+        if rule_store is None:
+            rule_store = RuleStore.from_rules(self._rules)
+        else:
+            assert all(rule.store is rule_store for rule in self._rules)
+        self._rule_store = rule_store
         self._selectable_actions = selectable_actions
         # *most recent* perf assessment result
         self._perf_assessment_res = None
-        self._id = get_next_indiv_id()
+        self._id = (indiv_id
+                    if indiv_id is not None else ctx.id_allocator.next_id())
+        # ids of Indivs this was bred from (none if inited from scratch)
+        self._parent_ids = ()
         # cache x_nought so inference can be done after pickling without
-        # relying on global hp registry
-        self._x_nought = get_hp("x_nought")
+        # relying on runtime context
+        self._x_nought = ctx.hyperparams.x_nought
 
     @property
     def rules(self):
         return self._rules
 
+    @property
+    def rule_store(self):
+        return self._rule_store
+
     @property
     def selectable_actions(self):
         return self._selectable_actions
@@ -54,10 +82,26 @@ class IndivABC(metaclass=abc.ABCMeta):
     def id(self):
         return self._id
 
+    @property
+    def parent_ids(self):
+        return self._parent_ids
+
+    @parent_ids.setter
+    def parent_ids(self, val):
+        self._parent_ids = tuple(val)
+
     @property
     def x_nought(self):
         return self._x_nought
 
+    def compile_match_table(self):
+        """Compile rule conditions into a dense MatchTable over the (integer)
+        obs space, so that matching is a table lookup. Conflict resolution
+        still uses current strengths, so the table stays valid while
+        learned params change, but is dropped if any condition changes."""
+        obs_space = self._rules[0].condition.encoding.obs_space
+        return self._rule_store.compile_match_table(obs_space)
+
     def select_action(self, obs):
         """Performs inference on obs using rules to predict an action;
         i.e. making Indiv act as a policy."""
@@ -73,15 +117,25 @@ class Indiv(IndivABC):
 
 
 class PolicyCacheIndiv(IndivABC):
-    def __init__(self, rules, selectable_actions):
-        super().__init__(rules, selectable_actions)
-        self._policy_cache = {}
+    def __init__(self,
+                 rules,
+                 selectable_actions,
+                 rule_store=None,
+                 indiv_id=None,
+                 ctx=None):
+        ctx = (ctx if ctx is not None else get_context())
+        super().__init__(rules, selectable_actions, rule_store, indiv_id, ctx)
+        # obs space is that which conditions are encoded for
+        obs_space = self._rules[0].condition.encoding.obs_space
+        self._policy_cache = make_policy_cache(obs_space, ctx)
+
+    @property
+    def policy_cache(self):
+        return self._policy_cache
 
     def select_action(self, obs):
-        obs_hashable = tuple(obs)
-        try:
-            return self._policy_cache[obs_hashable]
-        except KeyError:
-            action = infer_action(self, obs)
-            self._policy_cache[obs_hashable] = action
-            return action
+        return self._policy_cache.select_action(
+            obs, infer_action_func=self._infer_action)
+
+    def _infer_action(self, obs):
+        return infer_action(self, obs)
@@ -1,12 +1,13 @@
-from collections import OrderedDict
+import numpy as np
 
-from .util import augment_obs
+from .profiling import get_active_counters
+from .util import augment_obs, augment_obs_batch
 
 NULL_ACTION = -1
 
 
 def infer_action(indiv, obs):
-    (action, _) = _infer_action_and_action_set(indiv, obs)
+    (action, _) = _infer_action_and_action_set_idxs(indiv, obs)
     return action
 
 
@@ -14,63 +15,89 @@ def infer_action_and_action_set(indiv, obs):
     return _infer_action_and_action_set(indiv, obs)
 
 
+def infer_action_and_action_set_idxs(indiv, obs):
+    """As infer_action_and_action_set, but action set is given as idxs of
+    its rules in indiv (None if NULL_ACTION)."""
+    return _infer_action_and_action_set_idxs(indiv, obs)
+
+
+def infer_actions_and_action_sets(indiv, obs_batch):
+    """Batched inference for many obss at once. Returns (actions,
+    action_set_masks), where actions[i] is NULL_ACTION if no rule matches
+    obs_batch[i], and action_set_masks[i] is a bool mask over indiv's rules
+    giving the action set for obs_batch[i]."""
+    store = indiv.rule_store
+    match_masks = store.gen_match_masks(obs_batch)
+    has_match = np.any(match_masks, axis=1)
+    aug_obs_batch = augment_obs_batch(obs_batch, x_nought=indiv.x_nought)
+    # best action for each obs is that of its strongest matching rule, as in
+    # _get_best_action. if there is no action conflict for an obs this just
+    # picks some rule advocating the sole action represented.
+    strength_mat = np.where(match_masks,
+                            store.calc_strength_mat(aug_obs_batch), -np.inf)
+    best_rule_idxs = np.argmax(strength_mat, axis=1)
+    actions = np.where(has_match, store.actions[best_rule_idxs], NULL_ACTION)
+    action_set_masks = (match_masks &
+                        (store.actions == actions[:, np.newaxis]))
+    counters = get_active_counters()
+    if counters is not None:
+        counters.record_inferences(np.sum(match_masks, axis=1),
+                                   np.sum(action_set_masks, axis=1))
+    return (actions, action_set_masks)
+
+
 def _infer_action_and_action_set(indiv, obs):
-    match_set = _gen_match_set(indiv, obs)
-    if not _is_empty(match_set):
-        (action_sets, reprd_actions) = _gen_action_sets(
-            match_set, selectable_actions=indiv.selectable_actions)
+    (best_action,
+     action_set_idxs) = _infer_action_and_action_set_idxs(indiv, obs)
+    if action_set_idxs is not None:
+        rules = indiv.rules
+        action_set = [rules[idx] for idx in action_set_idxs]
+    else:
+        action_set = None
+    return (best_action, action_set)
+
 
-        num_reprd_actions = len(reprd_actions)
-        assert num_reprd_actions > 0
-        is_action_conflict = (num_reprd_actions > 1)
+def _infer_action_and_action_set_idxs(indiv, obs):
+    store = indiv.rule_store
+    match_idxs = _gen_match_set(indiv, obs)
+    if not _is_empty(match_idxs):
+        match_actions = store.actions[match_idxs]
+        is_action_conflict = np.any(match_actions != match_actions[0])
 
         if is_action_conflict:
             # use strength to resolve conflict
             aug_obs = augment_obs(obs, x_nought=indiv.x_nought)
-            best_action = _get_best_action(action_sets, reprd_actions, aug_obs)
-            action_set = action_sets[best_action]
+            best_action = _get_best_action(store, match_idxs, match_actions,
+                                           aug_obs)
         else:
-            assert num_reprd_actions == 1
             # use sole action represented
-            best_action = list(reprd_actions)[0]
-            action_set = action_sets[best_action]
+            best_action = match_actions[0]
+
+        action_set_idxs = match_idxs[match_actions == best_action]
     else:
         best_action = NULL_ACTION
-        action_set = None
-    return (best_action, action_set)
+        action_set_idxs = None
+    counters = get_active_counters()
+    if counters is not None:
+        counters.record_inference(
+            len(match_idxs),
+            (len(action_set_idxs) if action_set_idxs is not None else 0))
+    return (best_action, action_set_idxs)
 
 
 def _gen_match_set(indiv, obs):
-    return [rule for rule in indiv.rules if rule.does_match(obs)]
-
-
-def _gen_action_sets(match_set, selectable_actions):
-    """Build up action sets in more intelligent way that only requires
-    iterating over match set once."""
-    action_sets = OrderedDict({a: [] for a in selectable_actions})
-    reprd_actions = set()
-    for rule in match_set:
-        a = rule.action
-        action_sets[a].append(rule)
-        reprd_actions.add(a)
-    return (action_sets, reprd_actions)
+    """Match set as idxs of matching rules in indiv, computed via single
+    vectorised compare over all rules."""
+    return indiv.rule_store.gen_match_idxs(obs)
 
 
-def _get_best_action(action_sets, reprd_actions, aug_obs):
+def _get_best_action(store, match_idxs, match_actions, aug_obs):
     # pick action with highest strength via double max: first over rule
-    # strengths for each action, then over max strengths of all actions
-    max_a_strengths = _get_max_action_strengths(action_sets, reprd_actions,
-                                                aug_obs)
-    return max(max_a_strengths, key=max_a_strengths.get)
-
-
-def _get_max_action_strengths(action_sets, reprd_actions, aug_obs):
-    max_a_strengths = OrderedDict()
-    for a in reprd_actions:
-        action_set = action_sets[a]
-        max_a_strengths[a] = max(
-            [rule.strength(aug_obs) for rule in action_set])
-    return max_a_strengths
+    # strengths for each action, then over max strengths of all actions.
+    # strengths of all matching rules come from single mat-vec, and the
+    # double max reduces to the action of the single strongest rule.
+    strengths = store.calc_strengths(match_idxs, aug_obs)
+    return match_actions[np.argmax(strengths)]
 
 
 def _is_empty(set_):
@@ -1,33 +1,76 @@
-from .hyperparams import get_hyperparam as get_hp
+from .context import get_context
 from .indiv import make_indiv
-from .rng import get_rng
-from .rule import Rule
+from .rule import Rule, init_learned_params_bulk
+from .rule_store import RuleStore
 
 
-def init_pop(encoding, selectable_actions):
+def init_pop(encoding, selectable_actions, ctx=None):
+    ctx = (ctx if ctx is not None else get_context())
+    # bulk init gives same distribution of pops, but consumes rng stream
+    # differently, so is opt-in to keep existing seeded runs reproducible
+    if ctx.hyperparams.get("use_bulk_init", default=False):
+        return _init_pop_bulk(encoding, selectable_actions, ctx)
     return [
-        _init_indiv(encoding, selectable_actions)
-        for _ in range(get_hp("pop_size"))
+        _init_indiv(encoding, selectable_actions, ctx)
+        for _ in range(ctx.hyperparams.pop_size)
     ]
 
 
-def _init_indiv(encoding, selectable_actions):
-    num_rules = get_hp("indiv_size")
+def _init_indiv(encoding, selectable_actions, ctx):
+    num_rules = ctx.hyperparams.indiv_size
     rules = [
-        _init_rule(encoding, selectable_actions) for _ in range(num_rules)
+        _init_rule(encoding, selectable_actions, ctx)
+        for _ in range(num_rules)
     ]
-    return make_indiv(rules, selectable_actions)
+    return make_indiv(rules, selectable_actions, ctx=ctx)
 
 
-def _init_rule(encoding, selectable_actions):
-    condition = _init_rule_condition(encoding)
-    action = _init_rule_action(selectable_actions)
-    return Rule(condition, action)
+def _init_rule(encoding, selectable_actions, ctx):
+    condition = _init_rule_condition(encoding, ctx)
+    action = _init_rule_action(selectable_actions, ctx)
+    return Rule(condition, action, ctx)
 
 
-def _init_rule_condition(encoding):
-    return encoding.init_condition()
+def _init_rule_condition(encoding, ctx):
+    return encoding.init_condition(ctx)
 
 
-def _init_rule_action(selectable_actions):
-    return get_rng().choice(selectable_actions)
+def _init_rule_action(selectable_actions, ctx):
+    return ctx.rng.choice(selectable_actions)
+
+
+def _init_pop_bulk(encoding, selectable_actions, ctx):
+    """Generate all conditions, actions and learned params for whole pop in a
+    few vectorised calls, then write them straight into each Indiv's
+    store."""
+    pop_size = ctx.hyperparams.pop_size
+    num_rules = ctx.hyperparams.indiv_size
+    num_features = len(encoding.obs_space)
+    total_num_rules = (pop_size * num_rules)
+
+    alleles = encoding.init_condition_alleles_bulk(total_num_rules, ctx)
+    bounds = encoding.decode_bulk(alleles)
+    conditions = encoding.make_conditions_bulk(alleles)
+    actions = ctx.rng.choice(selectable_actions, size=total_num_rules)
+    (weight_mat, payoff_vars,
+     payoff_stdevs) = init_learned_params_bulk(total_num_rules, num_features,
+                                               ctx)
+
+    pop = []
+    for start in range(0, total_num_rules, num_rules):
+        rule_slice = slice(start, start + num_rules)
+        store = RuleStore(num_rules, num_features)
+        store.lowers[:] = bounds[rule_slice, :, 0]
+        store.uppers[:] = bounds[rule_slice, :, 1]
+        store.actions[:] = actions[rule_slice]
+        store.weight_mat[:] = weight_mat[rule_slice]
+        store.payoff_vars[:] = payoff_vars[rule_slice]
+        store.payoff_stdevs[:] = payoff_stdevs[rule_slice]
+        rules = [
+            Rule.view_of(condition, action, store, idx)
+            for (idx, (condition, action)) in enumerate(
+                zip(conditions[rule_slice], actions[rule_slice].tolist()))
+        ]
+        pop.append(
+            make_indiv(rules, selectable_actions, rule_store=store, ctx=ctx))
+    return pop
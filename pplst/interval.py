@@ -1,7 +1,14 @@
 import abc
+import functools
+
+_INTEGER_INTERVAL_FLYWEIGHT_MAX_SIZE = 2**16
 
 
 class IntervalABC(metaclass=abc.ABCMeta):
+    # intervals are immutable, numerous (one per dim per rule) and tiny, so
+    # no per-instance __dict__
+    __slots__ = ("_lower", "_upper", "_span")
+
     def __init__(self, lower, upper):
         assert lower <= upper
         self._lower = lower
@@ -32,10 +39,22 @@ class IntervalABC(metaclass=abc.ABCMeta):
 
 
 class IntegerInterval(IntervalABC):
+    __slots__ = ()
+
     def _calc_span(self, lower, upper):
         return upper - lower + 1
 
 
 class RealInterval(IntervalABC):
+    __slots__ = ()
+
     def _calc_span(self, lower, upper):
         return upper - lower
+
+
+@functools.lru_cache(maxsize=_INTEGER_INTERVAL_FLYWEIGHT_MAX_SIZE)
+def make_integer_interval(lower, upper):
+    """Flyweight factory: integer intervals are immutable and drawn from a
+    small set (bounded by dim spans), so equal ones can be shared between
+    conditions."""
+    return IntegerInterval(lower, upper)
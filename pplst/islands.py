@@ -0,0 +1,239 @@
+"""Island model: num_islands sub-pops, each evolved by its own PPLST (i.e.
+run_gen as usual) with its own rng stream and indiv id space, and every
+migration_interval gens the num_migrants fittest Indivs of each island
+migrate to another island (as per migration_topology), replacing the least
+fit there.
+
+Each island's PPLST has its own runtime context (hyperparams, rng and ids),
+so islands can either run in their own processes (so breeding is spread
+across processes too) or share the main process. Either way, runs are
+reproducible and give identical results.
+
+Hyperparams (besides those of PPLST):
+    num_islands
+    migration_interval: num gens between migrations
+    num_migrants: num Indivs sent by each island per migration
+    migration_topology: "ring" (island i sends to i + 1) or "random" (each
+        island sends to a random other island, redrawn every migration),
+        default "ring". Either way, each island receives from exactly one
+        other, so loses just num_migrants of its own Indivs."""
+import multiprocessing
+import traceback
+
+import numpy as np
+
+from .context import Hyperparams
+from .executor import SerialExecutor
+from .pplst import PPLST
+
+_MIGRATION_TOPOLOGIES = ("ring", "random")
+
+
+def _calc_seeds(seed, num_islands):
+    """Independent seeds for each island's rng stream + one for migration
+    rng."""
+    return [
+        int(child.generate_state(1)[0])
+        for child in np.random.SeedSequence(seed).spawn(num_islands + 1)
+    ]
+
+
+class _Island:
+    def __init__(self, island_idx, num_islands, seed, reinf_env, perf_env,
+                 encoding, hyperparams_dict, executor_factory, pplst_kwargs):
+        island_hyperparams_dict = {**hyperparams_dict, "seed": seed}
+        self._pplst = PPLST(reinf_env,
+                            perf_env,
+                            encoding,
+                            island_hyperparams_dict,
+                            executor=executor_factory(island_idx),
+                            **{
+                                "register_global": False,
+                                **pplst_kwargs
+                            })
+        self._pplst.context.id_allocator.set_space(offset=island_idx,
+                                                   stride=num_islands)
+
+    def init(self):
+        self._pplst.init()
+
+    def run_gen(self):
+        self._pplst.run_gen()
+
+    def select_emigrants(self, num_migrants):
+        # stable sort so ties are broken deterministically by pop position
+        return sorted(self._pplst.pop,
+                      key=lambda indiv: indiv.fitness,
+                      reverse=True)[:num_migrants]
+
+    def immigrate(self, migrants):
+        self._pplst.replace_worst(migrants)
+
+    def get_pop(self):
+        return self._pplst.pop
+
+    def close(self):
+        self._pplst.close()
+
+
+class _LocalIslandHandle:
+    """Island in this process: calls are run when sent."""
+    def __init__(self, island_args):
+        self._island = _Island(*island_args)
+        self._res = None
+
+    def send(self, method_name, *args):
+        self._res = getattr(self._island, method_name)(*args)
+
+    def recv(self):
+        return self._res
+
+    def close(self):
+        self._island.close()
+
+
+def _run_island_process(conn, island_args):
+    island = _Island(*island_args)
+    try:
+        while True:
+            (method_name, args) = conn.recv()
+            if method_name is None:
+                return
+            try:
+                conn.send((True, getattr(island, method_name)(*args)))
+            except Exception:
+                conn.send((False, traceback.format_exc()))
+    finally:
+        island.close()
+        conn.close()
+
+
+class _ProcessIslandHandle:
+    """Island in its own (non-daemonic, so it can have a worker pool)
+    process: calls are sent to it and run concurrently with those of other
+    islands."""
+    def __init__(self, island_args):
+        (self._conn, child_conn) = multiprocessing.Pipe()
+        self._proc = multiprocessing.Process(target=_run_island_process,
+                                             args=(child_conn, island_args))
+        self._proc.start()
+        child_conn.close()
+
+    def send(self, method_name, *args):
+        self._conn.send((method_name, args))
+
+    def recv(self):
+        (is_ok, res) = self._conn.recv()
+        if not is_ok:
+            raise RuntimeError(f"Island raised:\n{res}")
+        return res
+
+    def close(self):
+        try:
+            self._conn.send((None, None))
+        except OSError:
+            pass
+        self._proc.join()
+        self._conn.close()
+
+
+class IslandModel:
+    """executor_factory(island_idx) makes the executor for each island's
+    learning (default: SerialExecutor, i.e. one core per island if
+    use_processes). pplst_kwargs are passed on to each island's PPLST."""
+    def __init__(self,
+                 reinf_env,
+                 perf_env,
+                 encoding,
+                 hyperparams_dict,
+                 use_processes=True,
+                 executor_factory=None,
+                 **pplst_kwargs):
+        hyperparams = Hyperparams(hyperparams_dict)
+        self._num_islands = hyperparams.num_islands
+        self._migration_interval = hyperparams.migration_interval
+        self._num_migrants = hyperparams.num_migrants
+        self._migration_topology = hyperparams.get("migration_topology",
+                                                   default="ring")
+        assert self._num_islands >= 2
+        assert self._migration_interval >= 1
+        assert 0 <= self._num_migrants <= hyperparams.pop_size
+        assert self._migration_topology in _MIGRATION_TOPOLOGIES
+        if executor_factory is None:
+            executor_factory = _make_serial_executor
+        seeds = _calc_seeds(hyperparams.seed, self._num_islands)
+        self._migration_rng = np.random.RandomState(seeds[-1])
+        handle_cls = (_ProcessIslandHandle
+                      if use_processes else _LocalIslandHandle)
+        self._islands = [
+            handle_cls((island_idx, self._num_islands, seeds[island_idx],
+                        reinf_env, perf_env, encoding, hyperparams_dict,
+                        executor_factory, pplst_kwargs))
+            for island_idx in range(self._num_islands)
+        ]
+        self._num_gens = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Shut down islands. Safe to call multiple times."""
+        for island in self._islands:
+            island.close()
+        self._islands = []
+
+    @property
+    def num_islands(self):
+        return self._num_islands
+
+    @property
+    def pops(self):
+        """Pop of each island (copies, if islands are in other
+        processes)."""
+        return self._call_all("get_pop")
+
+    def init(self):
+        self._call_all("init")
+
+    def run_gen(self):
+        """One gen on every island, then migration if due."""
+        self._call_all("run_gen")
+        self._num_gens += 1
+        if (self._num_gens % self._migration_interval == 0
+                and self._num_migrants > 0):
+            self._migrate()
+
+    def _call_all(self, method_name, *args_per_island):
+        """Call method on all islands (concurrently, if in processes),
+        returning results in island order. args_per_island are seqs
+        giving each island's arg."""
+        for (island_idx, island) in enumerate(self._islands):
+            island.send(method_name,
+                        *[args[island_idx] for args in args_per_island])
+        return [island.recv() for island in self._islands]
+
+    def _migrate(self):
+        emigrants = self._call_all("select_emigrants",
+                                   [self._num_migrants] * self._num_islands)
+        immigrants = [[] for _ in range(self._num_islands)]
+        for (src_idx, dest_idx) in enumerate(self._calc_migration_dests()):
+            immigrants[dest_idx].extend(emigrants[src_idx])
+        self._call_all("immigrate", immigrants)
+
+    def _calc_migration_dests(self):
+        num_islands = self._num_islands
+        if self._migration_topology == "ring":
+            return ((np.arange(num_islands) + 1) % num_islands).tolist()
+        # random derangement (permutation in which no island sends to
+        # itself), by rejection: expected ~e draws
+        while True:
+            dests = self._migration_rng.permutation(num_islands)
+            if not np.any(dests == np.arange(num_islands)):
+                return dests.tolist()
+
+
+def _make_serial_executor(island_idx):
+    return SerialExecutor()
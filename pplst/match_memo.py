@@ -0,0 +1,54 @@
+from collections import OrderedDict
+
+import numpy as np
+
+
+class MatchSetMemo:
+    """Bounded (LRU) memo of obs -> match set (as rule idxs). Match sets only
+    depend on rule conditions, so the memo stays valid while learned params
+    change, but must be cleared whenever a condition changes."""
+    def __init__(self, max_size):
+        assert max_size >= 1
+        self._max_size = max_size
+        self._memo = OrderedDict()
+        self._num_hits = 0
+        self._num_misses = 0
+
+    @property
+    def num_hits(self):
+        return self._num_hits
+
+    @property
+    def num_misses(self):
+        return self._num_misses
+
+    @property
+    def hit_rate(self):
+        num_lookups = (self._num_hits + self._num_misses)
+        return (self._num_hits / num_lookups if num_lookups > 0 else 0.0)
+
+    def __len__(self):
+        return len(self._memo)
+
+    def lookup(self, obs, calc_match_idxs_func):
+        """Return memoised match idxs for obs if present, else calc them via
+        calc_match_idxs_func(obs) and memoise them. Returned arrays are shared
+        so must not be modified."""
+        key = np.asarray(obs).tobytes()
+        try:
+            match_idxs = self._memo[key]
+        except KeyError:
+            self._num_misses += 1
+            match_idxs = calc_match_idxs_func(obs)
+            match_idxs.setflags(write=False)
+            self._memo[key] = match_idxs
+            if len(self._memo) > self._max_size:
+                # evict least recently used
+                self._memo.popitem(last=False)
+        else:
+            self._num_hits += 1
+            self._memo.move_to_end(key)
+        return match_idxs
+
+    def clear(self):
+        self._memo.clear()
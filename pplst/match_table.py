@@ -0,0 +1,44 @@
+import numpy as np
+
+from .obs_grid import ObsGrid
+
+
+class MatchTable:
+    """Dense table mapping every state of an integer obs space grid to the
+    bitmask of rules (as packed bits) whose conditions match it, so that
+    matching becomes a table lookup. Only valid for as long as the rule
+    conditions it was built from remain unchanged."""
+    def __init__(self, lowers, uppers, obs_space):
+        self._obs_grid = ObsGrid(obs_space)
+        (self._num_rules, num_dims) = lowers.shape
+        assert num_dims == len(self._obs_grid.shape)
+        self._table = self._build_table(lowers, uppers, self._obs_grid)
+
+    @staticmethod
+    def _build_table(lowers, uppers, obs_grid):
+        # per dim, (num vals in dim, num rules) mask of intervals containing
+        # each val, then AND these together over the grid one dim at a time
+        # (row-major order, to match ObsGrid flat idxs)
+        num_rules = lowers.shape[0]
+        grid_mask = np.ones(shape=(1, num_rules), dtype=bool)
+        for dim_idx in range(len(obs_grid.shape)):
+            vals = obs_grid.dim_vals(dim_idx)[:, np.newaxis]
+            dim_mask = ((lowers[:, dim_idx] <= vals) &
+                        (vals <= uppers[:, dim_idx]))
+            grid_mask = (grid_mask[:, np.newaxis, :] &
+                         dim_mask[np.newaxis, :, :]).reshape(-1, num_rules)
+        assert grid_mask.shape[0] == obs_grid.num_states
+        return np.packbits(grid_mask, axis=1)
+
+    @property
+    def nbytes(self):
+        return self._table.nbytes
+
+    def lookup_match_mask(self, obs):
+        packed = self._table[self._obs_grid.calc_flat_idx(obs)]
+        return np.unpackbits(packed, count=self._num_rules).view(bool)
+
+    def lookup_match_masks(self, obs_batch):
+        packed = self._table[self._obs_grid.calc_flat_idxs(obs_batch)]
+        return np.unpackbits(packed, axis=1,
+                             count=self._num_rules).view(bool)
@@ -0,0 +1,39 @@
+import numpy as np
+from rlenvs.obs_space import IntegerObsSpace
+
+
+class ObsGrid:
+    """Finite grid of all obss in an integer obs space, with obss given flat
+    (row-major) idxs in [0, num_states)."""
+    def __init__(self, obs_space):
+        assert isinstance(obs_space, IntegerObsSpace)
+        self._lowers = np.array([dim.lower for dim in obs_space],
+                                dtype=np.int64)
+        self._shape = tuple(int(dim.span) for dim in obs_space)
+        self._num_states = int(np.prod(self._shape))
+
+    @property
+    def lowers(self):
+        return self._lowers
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def num_states(self):
+        return self._num_states
+
+    def calc_flat_idx(self, obs):
+        return int(
+            np.ravel_multi_index(np.asarray(obs, dtype=np.int64) -
+                                 self._lowers,
+                                 dims=self._shape))
+
+    def calc_flat_idxs(self, obs_batch):
+        offsets = (np.asarray(obs_batch, dtype=np.int64) - self._lowers)
+        return np.ravel_multi_index(offsets.T, dims=self._shape)
+
+    def dim_vals(self, dim_idx):
+        lower = self._lowers[dim_idx]
+        return np.arange(lower, lower + self._shape[dim_idx])
@@ -1,36 +1,58 @@
 import numpy as np
 
-from .hyperparams import get_hyperparam as get_hp
+from .context import get_context
 from .util import augment_obs
 
 np.seterr(divide="raise", over="raise", invalid="raise")
 
 
-def update_action_set(action_set, payoff, obs):
-    aug_obs = augment_obs(obs, x_nought=get_hp("x_nought"))
+def update_action_set(action_set, payoff, obs, ctx=None):
+    ctx = (ctx if ctx is not None else get_context())
+    aug_obs = augment_obs(obs, x_nought=ctx.hyperparams.x_nought)
+    # all rules in action set come from same Indiv, so update them in one
+    # go via its store
+    store = action_set[0].store
+    assert all(rule.store is store for rule in action_set)
+    rule_idxs = np.fromiter((rule.idx for rule in action_set),
+                            dtype=np.int64,
+                            count=len(action_set))
+    update_rules_in_store(store, rule_idxs, payoff, aug_obs, ctx)
+
+
+def update_rules_in_store(store, rule_idxs, payoff, aug_obs, ctx=None):
+    """Vectorised update of payoff prediction, var and stdev for all rules at
+    rule_idxs (must be unique) in store, computing each rule's prediction
+    only once."""
+    eta = (ctx if ctx is not None else get_context()).hyperparams.eta
     proc_obs = _process_aug_obs(aug_obs)
-    for rule in action_set:
-        _update_payoff_prediction(rule, payoff, aug_obs, proc_obs)
-        _update_payoff_var_and_stdev(rule, payoff, aug_obs)
+    preds = store.weight_mat[rule_idxs] @ aug_obs
+    errors = (payoff - preds)
+    _update_payoff_predictions(store, rule_idxs, errors, aug_obs, proc_obs,
+                               eta)
+    _update_payoff_vars_and_stdevs(store, rule_idxs, errors, eta)
 
 
 def _process_aug_obs(aug_obs):
     return np.sum(np.square(aug_obs))
 
 
-def _update_payoff_prediction(rule, payoff, aug_obs, proc_obs):
+def _update_payoff_predictions(store, rule_idxs, errors, aug_obs, proc_obs,
+                               eta):
     """Normalised least mean squares."""
     norm = proc_obs
-    error = payoff - rule.prediction(aug_obs)
-    correction = (get_hp("eta") / norm) * error
-    rule.weight_vec += (aug_obs * correction)
+    corrections = (eta / norm) * errors
+    store.weight_mat[rule_idxs] += np.outer(corrections, aug_obs)
 
 
-def _update_payoff_var_and_stdev(rule, payoff, aug_obs):
+def _update_payoff_vars_and_stdevs(store, rule_idxs, errors, eta):
     """As per SAMUEL: i.e. from 'Learning sequential decision rules using
     simulation models and competition' - Grefenstette."""
-    eta = get_hp("eta")
-    pred = rule.prediction(aug_obs)
-    # v_i = (1 - c)*v_i + c*(mu_i - r)^2
-    rule.payoff_var = (1 - eta) * rule.payoff_var + eta * (pred - payoff)**2
-    rule.payoff_stdev = np.sqrt(rule.payoff_var)
+    # v_i = (1 - c)*v_i + c*(mu_i - r)^2, where mu_i is prediction *after*
+    # the NLMS update. Since the NLMS correction is normalised by
+    # ||aug_obs||^2, that prediction is (pred + eta*error), so
+    # (mu_i - r) == -(1 - eta)*error, no need to compute it again.
+    post_update_errors = ((1 - eta) * errors)
+    payoff_vars = ((1 - eta) * store.payoff_vars[rule_idxs] +
+                   eta * post_update_errors**2)
+    store.payoff_vars[rule_idxs] = payoff_vars
+    store.payoff_stdevs[rule_idxs] = np.sqrt(payoff_vars)
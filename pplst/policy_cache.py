@@ -0,0 +1,158 @@
+import abc
+from collections import OrderedDict
+
+import numpy as np
+
+from .context import get_context
+from .obs_grid import ObsGrid
+
+_POLICY_CACHE_MODES = ("dict", "table")
+_TABLE_UNCACHED = np.iinfo(np.int64).min
+
+
+def make_policy_cache(obs_space, ctx=None):
+    """Make policy cache for PolicyCacheIndiv as configured by (optional)
+    hyperparams:
+        policy_cache_mode: "dict" (default) or "table" (IntegerObsSpace only)
+        policy_cache_size: max num entries in dict mode, LRU eviction beyond
+            that (default None, i.e. unbounded)
+        policy_cache_num_bins: num bins per dim for quantising obss in dict
+            mode (default None, i.e. no quantisation)."""
+    hyperparams = (ctx if ctx is not None else get_context()).hyperparams
+    mode = hyperparams.get("policy_cache_mode", default="dict")
+    assert mode in _POLICY_CACHE_MODES
+    if mode == "table":
+        return TablePolicyCache(obs_space)
+    else:
+        num_bins = hyperparams.get("policy_cache_num_bins", default=None)
+        quantiser = (ObsQuantiser(obs_space, num_bins)
+                     if num_bins is not None else None)
+        return DictPolicyCache(max_size=hyperparams.get("policy_cache_size",
+                                                        default=None),
+                               quantiser=quantiser)
+
+
+class ObsQuantiser:
+    """Maps obss onto a uniform grid of num_bins per dim spanning the obs
+    space. Note that caching on the grid makes the cached policy
+    approximate: all obss in a cell get the action inferred for the first
+    one seen."""
+    def __init__(self, obs_space, num_bins):
+        assert num_bins >= 1
+        self._num_bins = num_bins
+        self._lowers = np.array([dim.lower for dim in obs_space])
+        self._spans = np.array([dim.span for dim in obs_space])
+        assert np.all(self._spans > 0)
+
+    def quantise(self, obs):
+        bins = np.floor((np.asarray(obs) - self._lowers) / self._spans *
+                        self._num_bins).astype(np.int64)
+        return tuple(np.clip(bins, 0, self._num_bins - 1).tolist())
+
+
+class PolicyCacheABC(metaclass=abc.ABCMeta):
+    def __init__(self):
+        self._num_hits = 0
+        self._num_misses = 0
+
+    @property
+    def num_hits(self):
+        return self._num_hits
+
+    @property
+    def num_misses(self):
+        return self._num_misses
+
+    @property
+    def hit_rate(self):
+        num_lookups = (self._num_hits + self._num_misses)
+        return (self._num_hits / num_lookups if num_lookups > 0 else 0.0)
+
+    def select_action(self, obs, infer_action_func):
+        """Return cached action for obs if present, else infer it via
+        infer_action_func(obs) and cache it."""
+        key = self._calc_key(obs)
+        action = self._get(key)
+        if action is not None:
+            self._num_hits += 1
+        else:
+            self._num_misses += 1
+            action = infer_action_func(obs)
+            self._put(key, action)
+        return action
+
+    @abc.abstractmethod
+    def _calc_key(self, obs):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _get(self, key):
+        """Return cached action for key, or None if not present."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _put(self, key, action):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def __len__(self):
+        raise NotImplementedError
+
+
+class DictPolicyCache(PolicyCacheABC):
+    def __init__(self, max_size=None, quantiser=None):
+        super().__init__()
+        assert max_size is None or max_size >= 1
+        self._max_size = max_size
+        self._quantiser = quantiser
+        self._cache = OrderedDict()
+
+    def _calc_key(self, obs):
+        if self._quantiser is not None:
+            return self._quantiser.quantise(obs)
+        else:
+            return tuple(obs)
+
+    def _get(self, key):
+        action = self._cache.get(key)
+        if action is not None and self._max_size is not None:
+            self._cache.move_to_end(key)
+        return action
+
+    def _put(self, key, action):
+        self._cache[key] = action
+        if self._max_size is not None and len(self._cache) > self._max_size:
+            # evict least recently used
+            self._cache.popitem(last=False)
+
+    def __len__(self):
+        return len(self._cache)
+
+
+class TablePolicyCache(PolicyCacheABC):
+    """Flat array indexed by (row-major) position of obs in the integer obs
+    space grid: one slot per possible obs, so no hashing or eviction. The
+    table is allocated on first use."""
+    def __init__(self, obs_space):
+        super().__init__()
+        self._obs_grid = ObsGrid(obs_space)
+        self._table = None
+        self._num_entries = 0
+
+    def _calc_key(self, obs):
+        return self._obs_grid.calc_flat_idx(obs)
+
+    def _get(self, key):
+        if self._table is None:
+            self._table = np.full(shape=self._obs_grid.num_states,
+                                  fill_value=_TABLE_UNCACHED,
+                                  dtype=np.int64)
+        action = self._table[key]
+        return (action if action != _TABLE_UNCACHED else None)
+
+    def _put(self, key, action):
+        self._table[key] = action
+        self._num_entries += 1
+
+    def __len__(self):
+        return self._num_entries
@@ -1,27 +1,72 @@
+import contextlib
 import copy
+import functools
 import logging
-import os
+import time
 from collections import namedtuple
-from multiprocessing import Pool
+from multiprocessing import resource_tracker
 
+import numpy as np
 from rlenvs.environment import assess_perf
+from rlenvs.obs_space import IntegerObsSpace
 
-from .ga import crossover, mutate, tournament_selection
+from .checkpoint import (read_checkpoint, restore_eval_cache, restore_pop,
+                         restore_runtime_state, write_checkpoint)
+from .context import (RuntimeContext, get_context, get_default_context,
+                      use_context)
+from .eval_cache import EvalCache, calc_genotype_key
+# get_num_cpus also re-exported from here for backwards compat.
+from .executor import LocalPoolExecutor, get_num_cpus  # noqa: F401
+from .ga import (crossover, inverse_tournament_selection, mutate,
+                 mutate_bulk, tournament_selection)
 from .hyperparams import get_hyperparam as get_hp
-from .hyperparams import register_hyperparams
-from .inference import NULL_ACTION, infer_action_and_action_set
+from .inference import (NULL_ACTION, infer_action_and_action_set_idxs,
+                        infer_actions_and_action_sets)
 from .init import init_pop
-from .param_update import update_action_set
-from .rng import seed_rng
+from .indiv import PolicyCacheIndiv
+from .profiling import (GenProfiler, get_active_counters, run_profiled_task,
+                        time_learning_phase)
+from .racing import (calc_racing_stats, calc_racing_threshold,
+                     cannot_reach_threshold, is_assessment_complete,
+                     is_racing_enabled, select_incomplete_elite)
+from .rollout import (LockstepPerfAssessmentResult, calc_first_rollout_seed,
+                      run_lockstep_rollouts)
+from .trajectory import TrajectoryBuffer
+from .transport import SharedPop
 
-_NUM_CPUS = int(os.environ['SLURM_JOB_CPUS_PER_NODE'])
+# how pop is sent to/from pool workers: either pickled Indiv objs., or
+# packed into shared memory arrays (only perf assessment results pickled)
+_TRANSPORTS = ("pickle", "shm")
 
-TrajectoryStep = namedtuple("TrajectoryStep",
-                            ["obs", "action", "action_set", "reward"])
+SteadyStateResult = namedtuple("SteadyStateResult",
+                               ["num_evals", "secs", "evals_per_sec"])
+
+
+def _in_own_context(method):
+    """Run PPLST method with PPLST's runtime context active, so code that
+    is not passed it explicitly (incl. learning done in this process) uses
+    it too."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with use_context(self._ctx):
+            return method(self, *args, **kwargs)
+
+    return wrapper
 
 
 class PPLST:
-    def __init__(self, reinf_env, perf_env, encoding, hyperparams_dict):
+    def __init__(self,
+                 reinf_env,
+                 perf_env,
+                 encoding,
+                 hyperparams_dict,
+                 num_cpus=None,
+                 transport="pickle",
+                 eval_cache_size=None,
+                 profile_callback=None,
+                 executor=None,
+                 archive=None,
+                 register_global=True):
         # environment for doing inner loop: trajectory reinforcements
         self._reinf_env = reinf_env
         # environment for doing perf assessment for GA fitness
@@ -30,124 +75,725 @@ class PPLST:
         self._selectable_actions = self._reinf_env.action_space
         self._encoding = encoding
         self._hyperparams_dict = hyperparams_dict
-        register_hyperparams(self._hyperparams_dict)
-        seed_rng(get_hp("seed"))
+        # own hyperparams, rng and indiv ids, so runs are independent of
+        # each other (and of any others in the same process)
+        self._ctx = RuntimeContext.for_run(self._hyperparams_dict)
+        if register_global:
+            # for code using hyperparams/rng modules outside of PPLST
+            # methods, as before runs had own contexts. opt out (e.g. for
+            # several PPLSTs in one process) to leave default context alone
+            default_ctx = get_default_context()
+            default_ctx.register_hyperparams(self._hyperparams_dict)
+            default_ctx.seed_rng(default_ctx.hyperparams.seed)
+        assert transport in _TRANSPORTS
+        self._transport = transport
+        self._shared_pop = None
+        # opt-in cache of learning outcomes keyed by genotype
+        self._eval_cache = (EvalCache(max_size=eval_cache_size)
+                            if eval_cache_size is not None else None)
+        # opt-in per-gen profiling: profile_callback is called with a record
+        # (dict) at the end of each gen, see profiling.GenProfiler
+        self._profiler = (GenProfiler(profile_callback)
+                          if profile_callback is not None else None)
+        # executor runs learning tasks (see executor module): by default a
+        # local worker pool of num_cpus. it is long-lived: started (i.e.
+        # workers given envs etc.) on first use and kept for the whole run.
+        # only executors made here are closed by close().
+        if executor is None:
+            self._executor = LocalPoolExecutor(num_cpus)
+            self._owns_executor = True
+        else:
+            assert num_cpus is None
+            self._executor = executor
+            self._owns_executor = False
+        self._has_started_executor = False
+        assert (transport != "shm" or self._executor.supports_shared_memory)
+        # opt-in archive.IndivArchive (owned by caller, opened writable) to
+        # which every Indiv is appended once evaluated, with its gen
+        self._archive = archive
+        # opt-in racing of perf assessments in run_gen (see racing module),
+        # in increments of lock-step batches
+        with use_context(self._ctx):
+            self._is_racing = is_racing_enabled()
+            assert (not self._is_racing
+                    or get_hp("rollout_batch_size", default=None) is not None)
+            _check_table_hyperparams(self._encoding.obs_space)
+        # threshold that Indivs currently being learned race against, None
+        # if not racing
+        self._perf_threshold = None
+        self._perf_racing_stats = None
         self._pop = None
+        self._gen = None
+
+    @classmethod
+    def load_checkpoint(cls, path, reinf_env, perf_env, encoding, **kwargs):
+        """Make PPLST that resumes the run checkpointed at path (see
+        save_checkpoint). Envs and encoding must be made as for the original
+        run; kwargs are as for __init__ and may differ from the original run
+        (e.g. num_cpus), except that eval cache entries are only restored if
+        eval_cache_size is given."""
+        checkpoint = read_checkpoint(path)
+        pplst = cls(reinf_env, perf_env, encoding,
+                    checkpoint.hyperparams_dict, **kwargs)
+        pplst._pop = restore_pop(checkpoint, encoding,
+                                 pplst._selectable_actions, pplst._ctx)
+        pplst._gen = checkpoint.gen
+        if pplst._archive is not None:
+            # records of gens after checkpoint will be re-made
+            pplst._archive.discard_after_gen(checkpoint.gen)
+        if pplst._eval_cache is not None:
+            restore_eval_cache(checkpoint, pplst._eval_cache)
+        # after init above, which seeds rng
+        restore_runtime_state(checkpoint, pplst._ctx)
+        return pplst
+
+    def save_checkpoint(self, path):
+        """Save everything needed to resume run from current gen onwards
+        exactly as if uninterrupted (see checkpoint module): cheap enough to
+        do every gen."""
+        assert self._pop is not None
+        write_checkpoint(path, self._pop, self._encoding,
+                         self._hyperparams_dict, self._ctx, self._gen,
+                         self._eval_cache)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Shut down executor (if made here) and free shared memory (if any).
+        Safe to call multiple times."""
+        if self._owns_executor:
+            self._executor.close()
+        self._free_shared_pop()
 
     @property
     def pop(self):
         return self._pop
 
+    @property
+    def gen(self):
+        """Num of current pop's gen: 0 after init, +1 per run_gen (or
+        run_steady_state) call."""
+        return self._gen
+
+    @property
+    def context(self):
+        """RuntimeContext holding this run's hyperparams, rng and indiv id
+        allocator."""
+        return self._ctx
+
+    @property
+    def eval_cache(self):
+        return self._eval_cache
+
+    @property
+    def perf_racing_stats(self):
+        """PerfRacingStats of last gen, None if not racing."""
+        return self._perf_racing_stats
+
+    @_in_own_context
     def init(self):
-        self._pop = init_pop(self._encoding, self._selectable_actions)
-        self._pop = self._run_pop_learning_parallel(self._pop)
+        self._start_gen_profile()
+        with self._time_gen_stage("breeding"):
+            pop = init_pop(self._encoding, self._selectable_actions,
+                           self._ctx)
+        with self._time_gen_stage("learning"):
+            self._pop = self._run_pop_learning(pop)
+        self._gen = 0
+        self._archive_evaluated(self._pop)
+        self._end_gen_profile()
         return self._pop
 
+    @_in_own_context
     def run_gen(self):
         pop_size = get_hp("pop_size")
         assert (pop_size % 2) == 0
         num_breeding_rounds = (pop_size // 2)
+        # bulk mutation of whole offspring gen at end of breeding: faster, but
+        # consumes rng stream differently, so opt-in
+        use_bulk_mutation = get_hp("use_bulk_mutation", default=False)
+        self._start_gen_profile()
+        with self._time_gen_stage("breeding"):
+            new_pop = self._breed(num_breeding_rounds, use_bulk_mutation)
+        assert len(new_pop) == pop_size
+        with self._time_gen_stage("learning"):
+            if self._is_racing:
+                self._pop = self._run_pop_learning_racing(new_pop)
+            else:
+                self._pop = self._run_pop_learning(new_pop)
+        self._gen += 1
+        self._archive_evaluated(self._pop)
+        self._end_gen_profile()
+        return self._pop
+
+    @_in_own_context
+    def replace_worst(self, indivs):
+        """Replace the len(indivs) least fit Indivs in pop with indivs (which
+        must already be evaluated), e.g. immigrants from another island."""
+        assert self._pop is not None
+        assert len(indivs) <= len(self._pop)
+        assert all(indiv.perf_assessment_res is not None for indiv in indivs)
+        # stable sort so ties are broken deterministically by pop position
+        worst_idxs = sorted(range(len(self._pop)),
+                            key=lambda idx: self._pop[idx].fitness)
+        self._pop = list(self._pop)
+        for (idx, indiv) in zip(worst_idxs, indivs):
+            self._pop[idx] = indiv
+
+    @_in_own_context
+    def run_steady_state(self, num_evals, max_inflight=None):
+        """Steady-state alternative to run_gen: keep up to max_inflight
+        (default: executor capacity) children being learned at once. As soon
+        as any is done it replaces the loser of an inverse tournament in pop,
+        and a new child is bred from the current pop and dispatched, so
+        workers never wait on the slowest Indiv of a gen. Runs until
+        num_evals children are done; returns SteadyStateResult.
+
+        Children are bred as in run_gen (tournament_selection, crossover,
+        mutate), with both children of a crossover dispatched in turn. The
+        order children complete in depends on worker timing, so runs are
+        only reproducible with a SerialExecutor. Requires pickle transport
+        and no eval cache. If profiling, one record covers the whole call.
+        The call counts as one gen (see gen), that of all its children."""
+        assert self._pop is not None
+        assert self._transport == "pickle"
+        assert self._eval_cache is None
+        executor = self._get_executor()
+        max_inflight = (max_inflight
+                        if max_inflight is not None else executor.capacity)
+        assert max_inflight >= 1
+        # don't modify pop list previously returned to caller
+        self._pop = list(self._pop)
+        self._gen += 1
+        unsent_children = []
+        num_dispatched = 0
+        num_done = 0
+        self._start_gen_profile()
+        start = time.perf_counter()
+        while num_done < num_evals:
+            while (num_dispatched < num_evals
+                   and executor.num_live_tasks < max_inflight):
+                with self._time_gen_stage("breeding"):
+                    if len(unsent_children) == 0:
+                        unsent_children.extend(self._breed(1, False))
+                    child = unsent_children.pop(0)
+                executor.submit(_run_indiv_learning_in_worker, (child, ))
+                num_dispatched += 1
+            with self._time_gen_stage("learning"):
+                completed = executor.wait_completed()
+            children = self._split_task_profiles(list(completed.values()))
+            for child in children:
+                self._pop[inverse_tournament_selection(self._pop,
+                                                       self._ctx)] = child
+                num_done += 1
+            self._archive_evaluated(children)
+        secs = (time.perf_counter() - start)
+        self._end_gen_profile()
+        res = SteadyStateResult(num_evals=num_done,
+                                secs=secs,
+                                evals_per_sec=(num_done / secs))
+        logging.info(f"Steady state: {res.num_evals} evals in "
+                     f"{res.secs:.2f}s = {res.evals_per_sec:.2f} evals/s")
+        return res
+
+    def _breed(self, num_breeding_rounds, use_bulk_mutation):
         new_pop = []
         for _ in range(num_breeding_rounds):
-            parent_a = copy.deepcopy(tournament_selection(self._pop))
-            parent_b = copy.deepcopy(tournament_selection(self._pop))
+            # no need to copy parents: crossover makes copy-on-write
+            # children
+            parent_a = tournament_selection(self._pop, self._ctx)
+            parent_b = tournament_selection(self._pop, self._ctx)
             (child_a, child_b) = crossover(parent_a, parent_b,
-                                           self._selectable_actions)
+                                           self._selectable_actions,
+                                           self._ctx)
             # check children inited properly after crossover as new objs.
             assert child_a.perf_assessment_res is None
             assert child_b.perf_assessment_res is None
 
             for child in (child_a, child_b):
-                mutate(child, self._encoding)
+                if not use_bulk_mutation:
+                    mutate(child, self._encoding, self._ctx)
                 new_pop.append(child)
 
-        assert len(new_pop) == pop_size
-        self._pop = self._run_pop_learning_parallel(new_pop)
-        return self._pop
+        if use_bulk_mutation:
+            mutate_bulk(new_pop, self._encoding, self._ctx)
+        return new_pop
 
-    def _run_pop_learning_serial(self, pop):
-        """For debugging / profiling"""
-        updated_pop = [
-            self._run_indiv_learning(indiv, self._hyperparams_dict)
-            for indiv in pop
-        ]
-        return updated_pop
+    def _archive_evaluated(self, indivs):
+        if self._archive is not None:
+            self._archive.append(self._gen, indivs)
 
-    def _run_pop_learning_parallel(self, pop):
-        # process parallelism for doing "learning" for each indiv in pop
-        with Pool(_NUM_CPUS) as pool:
-            updated_pop = pool.starmap(self._run_indiv_learning,
-                                       [(indiv, self._hyperparams_dict)
-                                        for indiv in pop])
-        return updated_pop
-
-    def _run_indiv_learning(self, indiv, hyperparams_dict):
-        """'Learning' has two stages: first, update payoff estimates (do MC RL)
-        for rules within an Indiv via trajectories in an inner loop.
-        Then eval the perf (fitness) of the Indiv as a whole for GA to use."""
-
-        # but first re-register hyperparams globally for this process. (bit
-        # hacky, maybe change later)
-        register_hyperparams(hyperparams_dict)
-        num_reinf_rollouts = get_hp("num_reinf_rollouts")
+    def _start_gen_profile(self):
+        if self._profiler is not None:
+            self._profiler.start_gen()
+
+    def _time_gen_stage(self, stage):
+        if self._profiler is not None:
+            return self._profiler.time_stage(stage)
+        else:
+            return contextlib.nullcontext()
+
+    def _end_gen_profile(self):
+        if self._profiler is not None:
+            self._profiler.end_gen()
+
+    def _split_task_profiles(self, task_ress):
+        """If profiling, task results are (result, TaskProfile) pairs: hand
+        profiles to profiler and return just results."""
+        if self._profiler is None:
+            return task_ress
+        (ress, task_profiles) = zip(*task_ress) if len(task_ress) > 0 else (
+            (), ())
+        self._profiler.add_task_profiles(task_profiles)
+        return list(ress)
+
+    def _run_pop_learning(self, pop, is_cacheable_func=None):
+        if self._eval_cache is not None:
+            return self._eval_cache.run_pop_learning(
+                pop,
+                learn_pop_func=self._run_pop_learning_parallel,
+                is_cacheable_func=is_cacheable_func)
+        else:
+            return self._run_pop_learning_parallel(pop)
+
+    def _run_pop_learning_racing(self, pop):
+        """Learning with perf assessments raced against previous gen's
+        fitnesses, then elite whose assessments were stopped early have them
+        completed here (repeatedly, since completed ones may drop out of the
+        elite).
+
+        Only complete assessments are cached, since stopped ones depend on
+        this gen's threshold: elite are cached once completed."""
         num_perf_rollouts = get_hp("num_perf_rollouts")
-        gamma = get_hp("gamma")
-
-        self._reinforce_rules_in_indiv(indiv, num_reinf_rollouts, gamma)
-        self._assess_indiv_perf(indiv, num_perf_rollouts, gamma)
-
-        # Return the modified Indiv obj. since this method is being
-        # executed in other process via multiprocessing Pool and needs to
-        # return modified obj. back to the main process.
-        return indiv
-
-    def _reinforce_rules_in_indiv(self, indiv, num_reinf_rollouts, gamma):
-        # copy then reseed reinf env so each indiv has own seeded
-        # seq. of reinf trajectories and state of reinf env not
-        # mutated between indivs, therefore gives same result for diff. num. of
-        # CPUs used.
-        reinf_env = copy.deepcopy(self._reinf_env)
-        reinf_env.reseed_iod_rng(new_seed=indiv.id)
-        reinf_env.reseed_wrapped_rng(new_seed=indiv.id)
-
-        # Sample a trajectory then reinforce it one-at-a-time
-        for _ in range(num_reinf_rollouts):
-            trajectory = self._gen_trajectory_using_indiv(reinf_env, indiv)
-            self._reinforce_trajectory(trajectory, gamma)
-
-    def _gen_trajectory_using_indiv(self, reinf_env, indiv):
-        trajectory = []
-        obs = reinf_env.reset()
-        while not reinf_env.is_terminal():
-            # do whole inference process here, i.e. no policy caching even if
-            # indiv has it enabled. this is because the policy is mutating each
-            # trajectory generated so *probably* not worth it
-            (action, action_set) = infer_action_and_action_set(indiv, obs)
-            if action != NULL_ACTION:
-                assert action_set is not None
-                reinf_env_response = reinf_env.step(action)
-                reward = reinf_env_response.reward
-                trajectory.append(
-                    TrajectoryStep(obs, action, action_set, reward))
-                obs = reinf_env_response.obs
-            else:
-                # trajectory is truncated
-                assert action_set is None
+        threshold = calc_racing_threshold(self._pop)
+        if self._eval_cache is not None:
+            # ids are kept through learning, unlike genotype keys
+            pre_learning_keys = {
+                indiv.id: calc_genotype_key(indiv)
+                for indiv in pop
+            }
+        self._perf_threshold = threshold
+        try:
+            pop = self._run_pop_learning(
+                pop,
+                is_cacheable_func=functools.partial(
+                    is_assessment_complete,
+                    num_perf_rollouts=num_perf_rollouts))
+        finally:
+            self._perf_threshold = None
+        num_completed = 0
+        while True:
+            incomplete_elite = select_incomplete_elite(pop, num_perf_rollouts)
+            if len(incomplete_elite) == 0:
                 break
-        return trajectory
-
-    def _reinforce_trajectory(self, trajectory, gamma):
-        t = len(trajectory)
-        # iterate backwards over trajectory to incrementally calc payoffs for
-        # action sets
-        reward_sum = 0
-        for i in range(t - 1, 0 - 1, -1):
-            (obs, _, action_set, reward) = trajectory[i]
-            reward_sum += reward
-            steps_from_end = (t - 1 - i)
-            payoff = (gamma**(steps_from_end)) * reward_sum
-            update_action_set(action_set, payoff, obs)
-
-    def _assess_indiv_perf(self, indiv, num_perf_rollouts, gamma):
-        indiv.perf_assessment_res = assess_perf(self._perf_env, indiv,
-                                                num_perf_rollouts, gamma)
+            for indiv in incomplete_elite:
+                indiv.perf_assessment_res = _assess_indiv_perf_lockstep(
+                    indiv,
+                    self._perf_env,
+                    num_perf_rollouts,
+                    get_hp("gamma"),
+                    get_hp("rollout_batch_size"),
+                    prev_res=indiv.perf_assessment_res)
+                if self._eval_cache is not None:
+                    self._eval_cache.add(pre_learning_keys[indiv.id], indiv)
+                num_completed += 1
+        self._perf_racing_stats = calc_racing_stats(pop, num_perf_rollouts,
+                                                    threshold, num_completed)
+        stats = self._perf_racing_stats
+        logging.info(f"Perf racing: threshold {stats.threshold:.4f}, "
+                     f"{stats.num_rollouts_saved} rollouts saved, "
+                     f"{stats.num_stopped} stopped, "
+                     f"{stats.num_completed} completed")
+        return pop
+
+    def _run_pop_learning_parallel(self, pop):
+        # parallelism (as per executor) for doing "learning" for each indiv
+        # in pop
+        executor = self._get_executor()
+        if self._transport == "shm":
+            return self._run_pop_learning_parallel_shm(executor, pop)
+        else:
+            return self._split_task_profiles(
+                executor.starmap(_run_indiv_learning_in_worker,
+                                 [(indiv, self._perf_threshold)
+                                  for indiv in pop]))
+
+    def _run_pop_learning_parallel_shm(self, executor, pop):
+        """Workers read genotypes from and write learned params to shared
+        memory in place; only perf assessment results come back through
+        pipes."""
+        shared_pop = self._get_shared_pop(pop)
+        shared_pop.pack(pop)
+        perf_assessment_ress = self._split_task_profiles(
+            executor.starmap(_run_indiv_learning_in_worker_shm,
+                             [(shared_pop.spec, pop_idx, self._perf_threshold)
+                              for pop_idx in range(len(pop))]))
+        shared_pop.unpack_learned_params(pop)
+        for (indiv, perf_assessment_res) in zip(pop, perf_assessment_ress):
+            indiv.perf_assessment_res = perf_assessment_res
+        return pop
+
+    def _get_shared_pop(self, pop):
+        # pop and indiv sizes are fixed for a run so shared memory can be
+        # allocated once (with capacity for a full pop) and re-used every gen
+        if (self._shared_pop is None
+                or not self._shared_pop.is_compatible(pop, self._encoding)):
+            self._free_shared_pop()
+            self._shared_pop = SharedPop.create(
+                pop_size=max(len(pop), get_hp("pop_size")),
+                indiv_size=len(pop[0]),
+                obs_dim=len(self._encoding.obs_space),
+                allele_dtype=self._encoding.allele_dtype)
+        return self._shared_pop
+
+    def _free_shared_pop(self):
+        if self._shared_pop is not None:
+            self._shared_pop.close()
+            self._shared_pop.unlink()
+            self._shared_pop = None
+
+    def _get_executor(self):
+        if not self._has_started_executor:
+            if self._transport == "shm":
+                # workers must share main process' resource tracker, else
+                # each would unlink the shared memory it attached to upon
+                # exiting
+                resource_tracker.ensure_running()
+            self._executor.start(initializer=_init_worker,
+                                 initargs=(self._reinf_env, self._perf_env,
+                                           self._encoding,
+                                           self._hyperparams_dict,
+                                           (self._profiler is not None)))
+            self._has_started_executor = True
+        return self._executor
+
+
+def _check_table_hyperparams(obs_space):
+    """Dense tables over the obs space (see match_table and policy_cache)
+    are only possible for integer obs spaces: fail upfront rather than in
+    workers."""
+    if isinstance(obs_space, IntegerObsSpace):
+        return
+    if get_hp("use_compiled_match_table", default=False):
+        raise ValueError(
+            "use_compiled_match_table requires an IntegerObsSpace")
+    if get_hp("policy_cache_mode", default="dict") == "table":
+        raise ValueError(
+            "policy_cache_mode \"table\" requires an IntegerObsSpace")
+
+
+# shared_pops: SharedPops attached to by worker, keyed by their shm names
+_WorkerState = namedtuple(
+    "_WorkerState",
+    ["reinf_env", "perf_env", "encoding", "profile", "shared_pops"])
+
+
+def _init_worker(reinf_env, perf_env, encoding, hyperparams_dict, profile):
+    """Runs once in each executor worker at startup: register hyperparams in
+    the active runtime context (the process default in a worker process,
+    the PPLST's own for a SerialExecutor) and hold onto envs + encoding (+
+    whether to profile) there for all subsequent tasks."""
+    ctx = get_context()
+    ctx.register_hyperparams(hyperparams_dict)
+    ctx.worker_state = _WorkerState(reinf_env,
+                                    perf_env,
+                                    encoding,
+                                    profile,
+                                    shared_pops={})
+
+
+def _get_worker_state():
+    worker_state = get_context().worker_state
+    assert worker_state is not None
+    return worker_state
+
+
+def _run_indiv_learning_in_worker(indiv, perf_threshold=None):
+    worker_state = _get_worker_state()
+    # Return the modified Indiv obj. since this is being executed in other
+    # process via multiprocessing Pool and needs to return modified obj.
+    # back to the main process.
+    return _run_indiv_learning_task(indiv, worker_state.reinf_env,
+                                    worker_state.perf_env,
+                                    worker_state.profile, perf_threshold)
+
+
+def _run_indiv_learning_in_worker_shm(shared_pop_spec,
+                                      pop_idx,
+                                      perf_threshold=None):
+    worker_state = _get_worker_state()
+    shm_names_key = tuple(sorted(shared_pop_spec.shm_names.items()))
+    try:
+        shared_pop = worker_state.shared_pops[shm_names_key]
+    except KeyError:
+        shared_pop = SharedPop.attach(shared_pop_spec)
+        worker_state.shared_pops[shm_names_key] = shared_pop
+    indiv = shared_pop.make_indiv(
+        pop_idx,
+        encoding=worker_state.encoding,
+        selectable_actions=worker_state.reinf_env.action_space)
+    if worker_state.profile:
+        (indiv, task_profile) = run_profiled_task(_run_indiv_learning, indiv,
+                                                  worker_state.reinf_env,
+                                                  worker_state.perf_env,
+                                                  perf_threshold)
+        return (indiv.perf_assessment_res, task_profile)
+    _run_indiv_learning(indiv, worker_state.reinf_env, worker_state.perf_env,
+                        perf_threshold)
+    return indiv.perf_assessment_res
+
+
+def _run_indiv_learning_task(indiv,
+                             reinf_env,
+                             perf_env,
+                             profile,
+                             perf_threshold=None):
+    """Returns updated indiv, or (updated indiv, TaskProfile) if profile."""
+    if profile:
+        return run_profiled_task(_run_indiv_learning, indiv, reinf_env,
+                                 perf_env, perf_threshold)
+    return _run_indiv_learning(indiv, reinf_env, perf_env, perf_threshold)
+
+
+def _run_indiv_learning(indiv, reinf_env, perf_env, perf_threshold=None):
+    """'Learning' has two stages: first, update payoff estimates (do MC RL)
+    for rules within an Indiv via trajectories in an inner loop.
+    Then eval the perf (fitness) of the Indiv as a whole for GA to use,
+    racing against perf_threshold if given."""
+    num_reinf_rollouts = get_hp("num_reinf_rollouts")
+    num_perf_rollouts = get_hp("num_perf_rollouts")
+    gamma = get_hp("gamma")
+
+    # conditions are fixed during learning, so can compile them into a match
+    # table and/or memoise match sets for duration of it, shared between
+    # reinforcement and perf assessment (dropped after so not shipped back)
+    use_match_table = get_hp("use_compiled_match_table", default=False)
+    match_memo_size = get_hp("match_memo_size", default=None)
+    if use_match_table:
+        indiv.compile_match_table()
+    if match_memo_size is not None:
+        indiv.rule_store.enable_match_memo(match_memo_size)
+    with time_learning_phase("reinf"):
+        _reinforce_rules_in_indiv(indiv, reinf_env, num_reinf_rollouts,
+                                  gamma)
+    with time_learning_phase("perf"):
+        _assess_indiv_perf(indiv, perf_env, num_perf_rollouts, gamma,
+                           perf_threshold)
+    counters = get_active_counters()
+    if counters is not None:
+        _record_cache_lookups(indiv, counters)
+    if use_match_table:
+        indiv.rule_store.clear_match_table()
+    if match_memo_size is not None:
+        indiv.rule_store.disable_match_memo()
+    return indiv
+
+
+def _record_cache_lookups(indiv, counters):
+    # Indivs are only learned once and match memos are enabled afresh for
+    # each task, so all lookups counted are those of this task
+    if isinstance(indiv, PolicyCacheIndiv):
+        policy_cache = indiv.policy_cache
+        (policy_cache_hits, policy_cache_misses) = (policy_cache.num_hits,
+                                                    policy_cache.num_misses)
+    else:
+        (policy_cache_hits, policy_cache_misses) = (0, 0)
+    match_memo = indiv.rule_store.match_memo
+    (match_memo_hits, match_memo_misses) = (
+        (match_memo.num_hits, match_memo.num_misses)
+        if match_memo is not None else (0, 0))
+    counters.record_cache_lookups(policy_cache_hits, policy_cache_misses,
+                                  match_memo_hits, match_memo_misses)
+
+
+def _reinforce_rules_in_indiv(indiv, reinf_env, num_reinf_rollouts, gamma):
+    # lock-step batching seeds an env per rollout rather than per indiv, so
+    # gives different trajectories to those below, but the same ones for
+    # any batch size
+    rollout_batch_size = get_hp("rollout_batch_size", default=None)
+    if rollout_batch_size is not None:
+        _reinforce_rules_in_indiv_lockstep(indiv, reinf_env,
+                                           num_reinf_rollouts, gamma,
+                                           rollout_batch_size)
+        return
+
+    # copy then reseed reinf env so each indiv has own seeded
+    # seq. of reinf trajectories and state of reinf env not
+    # mutated between indivs, therefore gives same result for diff. num. of
+    # CPUs used.
+    reinf_env = copy.deepcopy(reinf_env)
+    reinf_env.reseed_iod_rng(new_seed=indiv.id)
+    reinf_env.reseed_wrapped_rng(new_seed=indiv.id)
+
+    # Sample a trajectory then reinforce it one-at-a-time, re-using the same
+    # buffer for each
+    trajectory_buf = TrajectoryBuffer.for_indiv(indiv)
+    for _ in range(num_reinf_rollouts):
+        _gen_trajectory_using_indiv(reinf_env, indiv, trajectory_buf)
+        trajectory_buf.reinforce(indiv.rule_store, gamma)
+
+
+def _reinforce_rules_in_indiv_lockstep(indiv, reinf_env, num_reinf_rollouts,
+                                       gamma, rollout_batch_size):
+    """Sample trajectories in lock-step batches with policy as of start of
+    batch, then reinforce them one-at-a-time in rollout order. Each
+    trajectory after the first of a batch is replayed before reinforcing
+    it, i.e. its obss re-inferred with policy as updated by those before it:
+    if any action differs, it (and rest of batch) is discarded and sampled
+    again in next batch. Each rollout has its own seeded env copy, so the
+    learning outcome is exactly that of sampling and reinforcing one
+    rollout at a time, whatever the batch size."""
+    first_seed = calc_first_rollout_seed(indiv.id, "reinf",
+                                         num_reinf_rollouts,
+                                         get_hp("num_perf_rollouts"))
+    num_env_copies = min(rollout_batch_size, num_reinf_rollouts)
+    env_copies = [copy.deepcopy(reinf_env) for _ in range(num_env_copies)]
+    trajectory_bufs = [
+        TrajectoryBuffer.for_indiv(indiv) for _ in range(num_env_copies)
+    ]
+    num_done = 0
+    while num_done < num_reinf_rollouts:
+        num_envs = min(rollout_batch_size, num_reinf_rollouts - num_done)
+        envs = env_copies[:num_envs]
+        _reseed_envs(envs, first_seed + num_done)
+        run_lockstep_rollouts(envs,
+                              indiv,
+                              gamma,
+                              trajectory_bufs=trajectory_bufs[:num_envs])
+        for (idx, trajectory_buf) in enumerate(trajectory_bufs[:num_envs]):
+            if idx > 0 and not _is_trajectory_replayed(indiv, trajectory_buf):
+                break
+            trajectory_buf.reinforce(indiv.rule_store, gamma)
+            num_done += 1
+
+
+def _is_trajectory_replayed(indiv, trajectory_buf):
+    """Whether indiv's current policy takes the same actions on
+    trajectory's obss, i.e. whether sampling it again (from same seeded
+    env) would give the same trajectory. Match sets do not change during
+    learning, so neither do action sets given the actions, nor where a
+    trajectory is truncated."""
+    if len(trajectory_buf) == 0:
+        return True
+    (actions, _) = infer_actions_and_action_sets(
+        indiv, trajectory_buf.aug_obss[:, 1:])
+    return np.array_equal(actions, trajectory_buf.actions)
+
+
+def _reseed_envs(envs, first_seed):
+    for (idx, env) in enumerate(envs):
+        env.reseed_iod_rng(new_seed=(first_seed + idx))
+        env.reseed_wrapped_rng(new_seed=(first_seed + idx))
+
+
+def _gen_seeded_env_batches(env,
+                            first_seed,
+                            num_rollouts,
+                            batch_size,
+                            first_rollout_num=0):
+    """Yield (rollout nums, env copies) for each batch of rollouts from
+    first_rollout_num on, with env copy of rollout k reseeded to
+    first_seed + k."""
+    assert batch_size >= 1
+    env_copies = [
+        copy.deepcopy(env)
+        for _ in range(min(batch_size, num_rollouts - first_rollout_num))
+    ]
+    for batch_start in range(first_rollout_num, num_rollouts, batch_size):
+        rollout_nums = range(batch_start,
+                             min(batch_start + batch_size, num_rollouts))
+        envs = env_copies[:len(rollout_nums)]
+        _reseed_envs(envs, first_seed + batch_start)
+        yield (rollout_nums, envs)
+
+
+def _gen_trajectory_using_indiv(reinf_env, indiv, trajectory_buf):
+    """Record trajectory into trajectory_buf (cleared first)."""
+    trajectory_buf.clear()
+    obs = reinf_env.reset()
+    while not reinf_env.is_terminal():
+        # do whole inference process here, i.e. no policy caching even if
+        # indiv has it enabled. this is because the policy is mutating each
+        # trajectory generated. match sets do not change though, so are
+        # memoised if match_memo_size hyperparam is set.
+        (action,
+         action_set_idxs) = infer_action_and_action_set_idxs(indiv, obs)
+        if action != NULL_ACTION:
+            assert action_set_idxs is not None
+            reinf_env_response = reinf_env.step(action)
+            trajectory_buf.append(obs, action, action_set_idxs,
+                                  reinf_env_response.reward)
+            obs = reinf_env_response.obs
+        else:
+            # trajectory is truncated
+            assert action_set_idxs is None
+            break
+
+
+def _assess_indiv_perf(indiv,
+                       perf_env,
+                       num_perf_rollouts,
+                       gamma,
+                       perf_threshold=None):
+    # racing needs per-rollout returns (and all assessments of a run to be
+    # alike, so fitnesses are comparable), else batching does not change
+    # how perf is assessed
+    if is_racing_enabled():
+        indiv.perf_assessment_res = _assess_indiv_perf_lockstep(
+            indiv, perf_env, num_perf_rollouts, gamma,
+            get_hp("rollout_batch_size"), perf_threshold)
+        return
+    assert perf_threshold is None
+
+    # copy perf env so that its state is not mutated between indivs, i.e.
+    # each indiv is assessed on same (pristine) env regardless of which
+    # process assesses it or what it assessed before
+    perf_env = copy.deepcopy(perf_env)
+    indiv.perf_assessment_res = assess_perf(perf_env, indiv,
+                                            num_perf_rollouts, gamma)
+
+
+def _assess_indiv_perf_lockstep(indiv,
+                                perf_env,
+                                num_perf_rollouts,
+                                gamma,
+                                rollout_batch_size,
+                                perf_threshold=None,
+                                prev_res=None):
+    """Perf is mean discounted return over rollouts, done in lock-step
+    batches on copies of perf env, each seeded for its (indiv, rollout) via
+    calc_first_rollout_seed, so independent of batch size.
+
+    If perf_threshold is given, stops after any batch once indiv cannot reach
+    it (see racing module), in which case rollout_returns is only those
+    done. If prev_res is given (such a stopped assessment), continues it to
+    completion."""
+    rollout_returns = np.empty(num_perf_rollouts)
+    if prev_res is not None:
+        num_done = len(prev_res.rollout_returns)
+        rollout_returns[:num_done] = prev_res.rollout_returns
+        num_truncated = prev_res.num_truncated
+    else:
+        (num_done, num_truncated) = (0, 0)
+    first_seed = calc_first_rollout_seed(indiv.id, "perf",
+                                         get_hp("num_reinf_rollouts"),
+                                         num_perf_rollouts)
+    for (rollout_nums, envs) in _gen_seeded_env_batches(
+            perf_env, first_seed, num_perf_rollouts, rollout_batch_size,
+            num_done):
+        rollouts_res = run_lockstep_rollouts(envs, indiv, gamma)
+        rollout_returns[rollout_nums.start:rollout_nums.stop] = \
+            rollouts_res.returns
+        num_truncated += int(np.sum(rollouts_res.was_truncated))
+        num_done = rollout_nums.stop
+        if (perf_threshold is not None and num_done < num_perf_rollouts
+                and cannot_reach_threshold(rollout_returns[:num_done],
+                                           perf_threshold)):
+            break
+    rollout_returns = rollout_returns[:num_done]
+    return LockstepPerfAssessmentResult(perf=float(np.mean(rollout_returns)),
+                                        rollout_returns=rollout_returns,
+                                        num_truncated=num_truncated)
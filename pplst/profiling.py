@@ -0,0 +1,245 @@
+"""Opt-in per-gen profiling: see PPLST's profile_callback.
+
+Learning tasks (one per Indiv) are profiled in whatever process runs them:
+run_profiled_task makes a TaskCounters obj. active in the runtime context
+the task runs under (see context module) for the duration of the task, and
+hot loops record into it only if one is active, so when profiling is
+disabled they pay a single None check. Task profiles
+are returned to the main process alongside task results, where GenProfiler
+aggregates them into one record per gen."""
+import contextlib
+import json
+import os
+import time
+from collections import Counter, namedtuple
+
+import numpy as np
+
+from .context import get_context
+
+_LEARNING_PHASES = ("reinf", "perf")
+_NULL_CONTEXT = contextlib.nullcontext()
+
+TaskProfile = namedtuple("TaskProfile", ["pid", "secs", "counters"])
+
+
+def get_active_counters():
+    return get_context().active_counters
+
+
+def time_learning_phase(phase):
+    """Context for timing one learning phase of active task, under which
+    inferences are attributed to that phase. No-op if not profiling."""
+    counters = get_active_counters()
+    if counters is None:
+        return _NULL_CONTEXT
+    return counters.time_phase(phase)
+
+
+def run_profiled_task(func, *args):
+    """Return (func(*args), TaskProfile), recording into fresh TaskCounters
+    for the duration of the call."""
+    ctx = get_context()
+    counters = TaskCounters()
+    prev_counters = ctx.active_counters
+    ctx.active_counters = counters
+    start = time.perf_counter()
+    try:
+        res = func(*args)
+    finally:
+        ctx.active_counters = prev_counters
+    secs = (time.perf_counter() - start)
+    return (res, TaskProfile(pid=os.getpid(), secs=secs, counters=counters))
+
+
+class TaskCounters:
+    """Counters for one learning task. Inference counters are per learning
+    phase; a NULL_ACTION inference always truncates the rollout it occurs in,
+    so num_null_actions doubles as the num. of truncated rollouts (as seen
+    by inference, i.e. not counting NULL_ACTIONs served from a policy
+    cache)."""
+    def __init__(self):
+        self._phase = None
+        self.phase_secs = dict.fromkeys(_LEARNING_PHASES, 0.0)
+        self.num_inferences = dict.fromkeys(_LEARNING_PHASES, 0)
+        self.num_conflicts = dict.fromkeys(_LEARNING_PHASES, 0)
+        self.num_null_actions = dict.fromkeys(_LEARNING_PHASES, 0)
+        self.match_set_sizes = Counter()
+        self.policy_cache_hits = 0
+        self.policy_cache_misses = 0
+        self.match_memo_hits = 0
+        self.match_memo_misses = 0
+
+    @contextlib.contextmanager
+    def time_phase(self, phase):
+        assert phase in _LEARNING_PHASES
+        (prev_phase, self._phase) = (self._phase, phase)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_secs[phase] += (time.perf_counter() - start)
+            self._phase = prev_phase
+
+    def record_inference(self, match_set_size, action_set_size):
+        phase = self._phase
+        self.num_inferences[phase] += 1
+        self.match_set_sizes[match_set_size] += 1
+        if match_set_size == 0:
+            self.num_null_actions[phase] += 1
+        elif action_set_size < match_set_size:
+            # match set advocates more than one action
+            self.num_conflicts[phase] += 1
+
+    def record_inferences(self, match_set_sizes, action_set_sizes):
+        """Batched equivalent of record_inference."""
+        phase = self._phase
+        self.num_inferences[phase] += len(match_set_sizes)
+        self.match_set_sizes.update(np.asarray(match_set_sizes).tolist())
+        self.num_null_actions[phase] += int(np.sum(match_set_sizes == 0))
+        self.num_conflicts[phase] += int(
+            np.sum(action_set_sizes < match_set_sizes))
+
+    def record_cache_lookups(self, policy_cache_hits, policy_cache_misses,
+                             match_memo_hits, match_memo_misses):
+        self.policy_cache_hits += policy_cache_hits
+        self.policy_cache_misses += policy_cache_misses
+        self.match_memo_hits += match_memo_hits
+        self.match_memo_misses += match_memo_misses
+
+
+def _calc_rate(numer, denom):
+    return (numer / denom if denom > 0 else 0.0)
+
+
+def _summarise_match_set_sizes(match_set_sizes):
+    if len(match_set_sizes) == 0:
+        return {"count": 0}
+    sorted_sizes = sorted(match_set_sizes.keys())
+    sizes = np.array(sorted_sizes)
+    counts = np.array([match_set_sizes[size] for size in sorted_sizes])
+    num = int(np.sum(counts))
+    cum_fracs = (np.cumsum(counts) / num)
+    return {
+        "count": num,
+        "mean": float(np.sum(sizes * counts) / num),
+        "min": int(sizes[0]),
+        "p50": int(sizes[np.searchsorted(cum_fracs, 0.5)]),
+        "p90": int(sizes[np.searchsorted(cum_fracs, 0.9)]),
+        "max": int(sizes[-1]),
+        "hist": {str(int(size)): int(count)
+                 for (size, count) in zip(sizes, counts)}
+    }
+
+
+class GenProfiler:
+    """Main process side of profiling: times the stages of each gen,
+    collects task profiles of its learning tasks, and passes a record
+    summarising it all to callback at the end of each gen.
+
+    Record fields:
+        gen: 0 for init, then 1, 2, ...
+        breeding_secs, learning_secs: wall time of making new pop and of
+            learning for it (incl. any eval cache overhead)
+        reinf_secs, perf_secs: time spent in each learning phase, summed
+            over tasks
+        ipc_secs: estimate of learning wall time not spent running tasks on
+            the busiest worker, i.e. transport (pickling, pipes or shm
+            packing) + scheduling overhead
+        worker_task_secs: per worker (pid) durations of its tasks
+        match_set_sizes: distribution over all inferences
+        action_conflict_rate, num_truncated_rollouts: per learning phase
+        policy_cache, match_memo: lookup counts and hit rate."""
+    def __init__(self, callback):
+        self._callback = callback
+        self._gen = 0
+        self._stage_secs = None
+        self._task_profiles = None
+
+    def start_gen(self):
+        self._stage_secs = {"breeding": 0.0, "learning": 0.0}
+        self._task_profiles = []
+
+    @contextlib.contextmanager
+    def time_stage(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._stage_secs[stage] += (time.perf_counter() - start)
+
+    def add_task_profiles(self, task_profiles):
+        self._task_profiles.extend(task_profiles)
+
+    def end_gen(self):
+        self._callback(self._make_record())
+        self._gen += 1
+        self._stage_secs = None
+        self._task_profiles = None
+
+    def _make_record(self):
+        worker_task_secs = {}
+        totals = TaskCounters()
+        for task_profile in self._task_profiles:
+            worker_task_secs.setdefault(str(task_profile.pid),
+                                        []).append(task_profile.secs)
+            counters = task_profile.counters
+            for phase in _LEARNING_PHASES:
+                totals.phase_secs[phase] += counters.phase_secs[phase]
+                totals.num_inferences[phase] += counters.num_inferences[phase]
+                totals.num_conflicts[phase] += counters.num_conflicts[phase]
+                totals.num_null_actions[phase] += \
+                    counters.num_null_actions[phase]
+            totals.match_set_sizes.update(counters.match_set_sizes)
+            totals.record_cache_lookups(counters.policy_cache_hits,
+                                        counters.policy_cache_misses,
+                                        counters.match_memo_hits,
+                                        counters.match_memo_misses)
+
+        busiest_worker_secs = max(
+            (sum(secs) for secs in worker_task_secs.values()), default=0.0)
+        learning_secs = self._stage_secs["learning"]
+        return {
+            "gen": self._gen,
+            "breeding_secs": self._stage_secs["breeding"],
+            "learning_secs": learning_secs,
+            "reinf_secs": totals.phase_secs["reinf"],
+            "perf_secs": totals.phase_secs["perf"],
+            "ipc_secs": max(learning_secs - busiest_worker_secs, 0.0),
+            "num_tasks": len(self._task_profiles),
+            "worker_task_secs": worker_task_secs,
+            "match_set_sizes":
+            _summarise_match_set_sizes(totals.match_set_sizes),
+            "num_inferences": totals.num_inferences,
+            "action_conflict_rate": {
+                phase: _calc_rate(totals.num_conflicts[phase],
+                                  totals.num_inferences[phase])
+                for phase in _LEARNING_PHASES
+            },
+            "num_truncated_rollouts": totals.num_null_actions,
+            "policy_cache": {
+                "hits": totals.policy_cache_hits,
+                "misses": totals.policy_cache_misses,
+                "hit_rate": _calc_rate(
+                    totals.policy_cache_hits,
+                    totals.policy_cache_hits + totals.policy_cache_misses)
+            },
+            "match_memo": {
+                "hits": totals.match_memo_hits,
+                "misses": totals.match_memo_misses,
+                "hit_rate": _calc_rate(
+                    totals.match_memo_hits,
+                    totals.match_memo_hits + totals.match_memo_misses)
+            }
+        }
+
+
+class JsonlProfileWriter:
+    """Profile callback that appends each record as a line of JSON to
+    file at path."""
+    def __init__(self, path):
+        self._path = path
+
+    def __call__(self, record):
+        with open(self._path, "a") as fp:
+            fp.write(json.dumps(record) + "\n")
@@ -0,0 +1,82 @@
+"""Racing for perf assessment: perf rollouts are done in increments (lock-step
+batches) and an Indiv's assessment stops early once it is confidently unable
+to reach a threshold, namely a quantile of the previous gen's fitnesses.
+
+Every perf rollout has its own seed (see rollout.calc_first_rollout_seed),
+so a stopped assessment can later be completed to give exactly the result
+of an unstopped one. Perf is assessed in this way throughout a run with
+racing enabled (incl. for the initial pop), so fitnesses stay comparable.
+
+Hyperparams:
+    perf_racing_quantile: quantile of previous gen's fitnesses that an Indiv
+        must be able to reach to continue; None (default) disables racing
+    perf_racing_z: num std errs above running mean return of upper
+        confidence bound on perf, default 2.0
+    perf_racing_num_elite: num fittest Indivs of each gen whose assessments
+        are guaranteed to be complete, default 1."""
+from collections import namedtuple
+
+import numpy as np
+
+from .hyperparams import get_hyperparam as get_hp
+
+_MIN_NUM_ROLLOUTS_FOR_BOUND = 2
+
+PerfRacingStats = namedtuple(
+    "PerfRacingStats",
+    ["threshold", "num_rollouts", "num_rollouts_saved", "num_stopped",
+     "num_completed"])
+
+
+def is_racing_enabled():
+    return get_hp("perf_racing_quantile", default=None) is not None
+
+
+def calc_racing_threshold(prev_pop):
+    quantile = get_hp("perf_racing_quantile")
+    assert 0.0 <= quantile <= 1.0
+    return float(np.quantile([indiv.fitness for indiv in prev_pop],
+                             quantile))
+
+
+def cannot_reach_threshold(rollout_returns, threshold):
+    """Whether upper confidence bound on mean return (normal approx.) given
+    rollout_returns so far is below threshold."""
+    num_rollouts = len(rollout_returns)
+    if num_rollouts < _MIN_NUM_ROLLOUTS_FOR_BOUND:
+        return False
+    z = get_hp("perf_racing_z", default=2.0)
+    std_err = (np.std(rollout_returns, ddof=1) / np.sqrt(num_rollouts))
+    return (np.mean(rollout_returns) + z * std_err) < threshold
+
+
+def is_assessment_complete(indiv, num_perf_rollouts):
+    return len(indiv.perf_assessment_res.rollout_returns) == num_perf_rollouts
+
+
+def select_incomplete_elite(pop, num_perf_rollouts):
+    """Those of the perf_racing_num_elite fittest Indivs in pop whose
+    assessments were stopped early."""
+    num_elite = get_hp("perf_racing_num_elite", default=1)
+    # stable sort so ties are broken deterministically by pop position
+    elite = sorted(pop, key=lambda indiv: indiv.fitness,
+                   reverse=True)[:num_elite]
+    return [
+        indiv for indiv in elite
+        if not is_assessment_complete(indiv, num_perf_rollouts)
+    ]
+
+
+def calc_racing_stats(pop, num_perf_rollouts, threshold, num_completed):
+    """Rollout counts are over pop as learned, so Indivs served from an eval
+    cache count as if assessed."""
+    num_rollouts = sum(
+        len(indiv.perf_assessment_res.rollout_returns) for indiv in pop)
+    return PerfRacingStats(
+        threshold=threshold,
+        num_rollouts=num_rollouts,
+        num_rollouts_saved=(len(pop) * num_perf_rollouts - num_rollouts),
+        num_stopped=sum(
+            not is_assessment_complete(indiv, num_perf_rollouts)
+            for indiv in pop),
+        num_completed=num_completed)
@@ -1,16 +1,20 @@
-import numpy as np
-
-_rng = np.random.RandomState()
-_has_been_seeded = False
+"""Shim over rng of active runtime context (see context module)."""
+from .context import get_context
 
 
 def seed_rng(seed):
-    seed = int(seed)
-    _rng.seed(seed)
-    global _has_been_seeded
-    _has_been_seeded = True
+    get_context().seed_rng(seed)
 
 
 def get_rng():
-    assert _has_been_seeded
-    return _rng
+    return get_context().rng
+
+
+def get_rng_state():
+    return get_context().get_rng_state()
+
+
+def set_rng_state(state):
+    """Restore state as returned by get_rng_state, e.g. when resuming from a
+    checkpoint."""
+    get_context().set_rng_state(state)
@@ -0,0 +1,79 @@
+from collections import namedtuple
+
+import numpy as np
+
+from .inference import NULL_ACTION, infer_actions_and_action_sets
+
+LockstepRolloutsResult = namedtuple(
+    "LockstepRolloutsResult", ["trajectories", "returns", "was_truncated"])
+
+# perf assessment result for lock-step (racing) perf assessment, in lieu of
+# that of rlenvs.environment.assess_perf
+LockstepPerfAssessmentResult = namedtuple(
+    "LockstepPerfAssessmentResult", ["perf", "rollout_returns",
+                                     "num_truncated"])
+
+
+def run_lockstep_rollouts(envs, indiv, gamma, trajectory_bufs=None):
+    """Do one rollout in each of envs using indiv as policy, stepping all envs
+    in lock-step so that inference is done for the obss of all still-active
+    envs at once. If trajectory_bufs (TrajectoryBuffers, one per env) are
+    given, they are cleared and each records its env's trajectory.
+
+    Each env is only reset and stepped by itself, so given the same seeding
+    the rollout in each env is identical to what it would be if done alone.
+    A rollout ends when its env is terminal, or is truncated when no rule
+    matches the current obs (i.e. NULL_ACTION)."""
+    num_envs = len(envs)
+    record_trajectories = (trajectory_bufs is not None)
+    if record_trajectories:
+        assert len(trajectory_bufs) == num_envs
+        for trajectory_buf in trajectory_bufs:
+            trajectory_buf.clear()
+    obss = [env.reset() for env in envs]
+    is_active = [not env.is_terminal() for env in envs]
+    returns = np.zeros(num_envs)
+    discounts = np.ones(num_envs)
+    was_truncated = np.zeros(num_envs, dtype=bool)
+
+    active_idxs = [idx for idx in range(num_envs) if is_active[idx]]
+    while len(active_idxs) > 0:
+        (actions, action_set_masks) = infer_actions_and_action_sets(
+            indiv, [obss[idx] for idx in active_idxs])
+        for (idx, action, action_set_mask) in zip(active_idxs, actions,
+                                                  action_set_masks):
+            if action == NULL_ACTION:
+                # rollout is truncated
+                was_truncated[idx] = True
+                is_active[idx] = False
+                continue
+            env_response = envs[idx].step(action)
+            reward = env_response.reward
+            if record_trajectories:
+                trajectory_bufs[idx].append(obss[idx], action,
+                                            action_set_mask, reward)
+            returns[idx] += (discounts[idx] * reward)
+            discounts[idx] *= gamma
+            obss[idx] = env_response.obs
+            is_active[idx] = not envs[idx].is_terminal()
+        active_idxs = [idx for idx in active_idxs if is_active[idx]]
+
+    return LockstepRolloutsResult(
+        trajectories=trajectory_bufs,
+        returns=returns,
+        was_truncated=was_truncated)
+
+
+def calc_first_rollout_seed(indiv_id, phase, num_reinf_rollouts,
+                            num_perf_rollouts):
+    """Env seed of rollout 0 of given learning phase ("reinf" or "perf") of
+    indiv, that of rollout k being this + k. Each indiv has its own block of
+    num_reinf_rollouts + num_perf_rollouts seeds, reinf rollouts taking the
+    start of it and perf rollouts the rest, so no two rollouts of a run
+    share a seed, however they are batched."""
+    block_start = (indiv_id * (num_reinf_rollouts + num_perf_rollouts))
+    if phase == "reinf":
+        return block_start
+    else:
+        assert phase == "perf"
+        return (block_start + num_reinf_rollouts)
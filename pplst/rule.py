@@ -1,7 +1,7 @@
 import numpy as np
 
-from .hyperparams import get_hyperparam as get_hp
-from .rng import get_rng
+from .context import get_context
+from .rule_store import RuleStore
 
 np.seterr(divide="raise", over="raise", invalid="raise")
 
@@ -9,24 +9,84 @@ _INIT_PAYOFF_VAR = 0
 _INIT_PAYOFF_STDEV = 0
 
 
+def init_learned_params_bulk(num_rules, num_features, ctx=None):
+    """Bulk equivalent of the learned param init done by Rule.__init__,
+    returning (weight_mat, payoff_vars, payoff_stdevs)."""
+    ctx = (ctx if ctx is not None else get_context())
+    low = ctx.hyperparams.weight_I_min
+    high = ctx.hyperparams.weight_I_max
+    assert low <= high
+    weight_mat = ctx.rng.uniform(low, high,
+                                 size=(num_rules, num_features + 1)).astype(
+                                     np.float32)
+    payoff_vars = np.full(shape=num_rules, fill_value=_INIT_PAYOFF_VAR)
+    payoff_stdevs = np.full(shape=num_rules, fill_value=_INIT_PAYOFF_STDEV)
+    return (weight_mat, payoff_vars, payoff_stdevs)
+
+
 class Rule:
-    def __init__(self, condition, action):
+    # learned params live in store, so a Rule is just a few refs
+    __slots__ = ("_condition", "_action", "_num_features", "_store", "_idx")
+
+    def __init__(self, condition, action, ctx=None):
         self._condition = condition
         self._action = action
 
         self._num_features = len(condition)
-        self._weight_vec = self._init_weight_vec(self._num_features)
-        self._payoff_var = _INIT_PAYOFF_VAR
-        self._payoff_stdev = _INIT_PAYOFF_STDEV
-
-    def _init_weight_vec(self, num_features):
+        # own single row store until rule is placed in an Indiv, at which
+        # point it is re-bound to a row of the Indiv's store
+        self._store = RuleStore(num_rules=1, num_features=self._num_features)
+        self._idx = 0
+        self._store.set_condition(self._idx, self._condition)
+        self._store.set_action(self._idx, self._action)
+        self.weight_vec = self._init_weight_vec(
+            self._num_features, (ctx if ctx is not None else get_context()))
+        self.payoff_var = _INIT_PAYOFF_VAR
+        self.payoff_stdev = _INIT_PAYOFF_STDEV
+
+    @classmethod
+    def view_of(cls, condition, action, store, idx):
+        """Make rule as view of row idx of store, which must already hold
+        all of this rule's data (incl. condition bounds and action)."""
+        rule = cls.__new__(cls)
+        rule._condition = condition
+        rule._action = action
+        rule._num_features = len(condition)
+        rule._store = store
+        rule._idx = idx
+        return rule
+
+    @classmethod
+    def from_store(cls, condition, action, store, idx):
+        """Make rule as view of existing row in store, i.e. with learned
+        params already present there, rather than initing fresh ones."""
+        rule = cls.view_of(condition, action, store, idx)
+        rule._store.set_condition(rule._idx, rule._condition)
+        rule._store.set_action(rule._idx, rule._action)
+        return rule
+
+    def clone_into(self, store, idx):
+        """Make new rule sharing this rule's (immutable) condition, as view of
+        row idx of store, which must already hold a copy of this rule's
+        data (see RuleStore.gather)."""
+        return self.view_of(self._condition, self._action, store, idx)
+
+    def _init_weight_vec(self, num_features, ctx):
         # since linear prediction only,
         # weight vec is of len n+1, n = num features
-        low = get_hp("weight_I_min")
-        high = get_hp("weight_I_max")
+        low = ctx.hyperparams.weight_I_min
+        high = ctx.hyperparams.weight_I_max
         assert low <= high
-        return get_rng().uniform(low, high,
-                                 size=(num_features + 1)).astype(np.float32)
+        return ctx.rng.uniform(low, high,
+                               size=(num_features + 1)).astype(np.float32)
+
+    @property
+    def store(self):
+        return self._store
+
+    @property
+    def idx(self):
+        return self._idx
 
     @property
     def condition(self):
@@ -35,6 +95,8 @@ class Rule:
     @condition.setter
     def condition(self, val):
         self._condition = val
+        # keep store in sync (e.g. after mutation)
+        self._store.set_condition(self._idx, val)
 
     @property
     def action(self):
@@ -43,47 +105,56 @@ class Rule:
     @action.setter
     def action(self, val):
         self._action = val
+        self._store.set_action(self._idx, val)
 
     @property
     def weight_vec(self):
-        return self._weight_vec
+        # view into store, so in-place updates write through
+        return self._store.weight_mat[self._idx]
 
     @weight_vec.setter
     def weight_vec(self, val):
-        self._weight_vec = val
+        self._store.weight_mat[self._idx] = val
 
     @property
     def payoff_var(self):
-        return self._payoff_var
+        return self._store.payoff_vars[self._idx]
 
     @payoff_var.setter
     def payoff_var(self, val):
-        self._payoff_var = val
+        self._store.payoff_vars[self._idx] = val
 
     @property
     def payoff_stdev(self):
-        return self._payoff_stdev
+        return self._store.payoff_stdevs[self._idx]
 
     @payoff_stdev.setter
     def payoff_stdev(self, val):
-        self._payoff_stdev = val
+        self._store.payoff_stdevs[self._idx] = val
+
+    def bind(self, store, idx):
+        """Move rule's data into given row of store (i.e. that of its owning
+        Indiv), and make rule a view of that row from then on."""
+        store.copy_row(idx, self._store, self._idx)
+        self._store = store
+        self._idx = idx
 
     def does_match(self, obs):
         return self._condition.does_match(obs)
 
     def prediction(self, aug_obs):
-        return np.dot(aug_obs, self._weight_vec)
+        return np.dot(aug_obs, self.weight_vec)
 
     def strength(self, aug_obs):
         """Strength is computed based on given obs"""
-        return self.prediction(aug_obs) - self._payoff_stdev
+        return self.prediction(aug_obs) - self.payoff_stdev
 
     def __eq__(self, other):
         return (self._condition == other._condition and
                 self._action == other._action and
-                np.array_equal(self._weight_vec, other._weight_vec) and
-                self._payoff_var == other._payoff_var and
-                self._payoff_stdev == other._payoff_stdev)
+                np.array_equal(self.weight_vec, other.weight_vec) and
+                self.payoff_var == other.payoff_var and
+                self.payoff_stdev == other.payoff_stdev)
 
     def __str__(self):
         return f"{self._condition} -> {self._action}"
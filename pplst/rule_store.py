@@ -0,0 +1,197 @@
+import numpy as np
+
+from .match_memo import MatchSetMemo
+from .match_table import MatchTable
+
+
+class RuleStore:
+    """Array-backed storage for a collection of rules (typically those
+    contained within an Indiv), so that inference can be done for all rules
+    at once via vectorised ops rather than one Python call per rule.
+
+    Rule objects bound to a store are views into it: reads/writes of their
+    condition bounds, action and learned params go to the store's arrays."""
+    # per-rule arrays, i.e. everything that makes up a row
+    _ROW_ATTRS = ("_lowers", "_uppers", "_actions", "_weight_mat",
+                  "_payoff_vars", "_payoff_stdevs")
+
+    def __init__(self, num_rules, num_features):
+        assert num_rules > 0
+        self._lowers = np.empty(shape=(num_rules, num_features))
+        self._uppers = np.empty(shape=(num_rules, num_features))
+        self._actions = np.empty(shape=num_rules, dtype=np.int64)
+        # since linear prediction only, weight vecs are of len n+1,
+        # n = num features
+        self._weight_mat = np.empty(shape=(num_rules, num_features + 1),
+                                    dtype=np.float32)
+        self._payoff_vars = np.empty(shape=num_rules)
+        self._payoff_stdevs = np.empty(shape=num_rules)
+        # optional compiled MatchTable, see compile_match_table
+        self._match_table = None
+        # optional MatchSetMemo, see enable_match_memo
+        self._match_memo = None
+
+    @classmethod
+    def from_arrays(cls, actions, weight_mat, payoff_vars, payoff_stdevs):
+        """Make store backed by (i.e. viewing, not copying) given arrays for
+        actions and learned params, e.g. views into shared memory. Condition
+        bounds must be filled in by caller, e.g. as rules are bound to the
+        store."""
+        (num_rules, num_features_plus_one) = weight_mat.shape
+        assert actions.shape == (num_rules, )
+        assert payoff_vars.shape == (num_rules, )
+        assert payoff_stdevs.shape == (num_rules, )
+        store = cls.__new__(cls)
+        store._lowers = np.empty(shape=(num_rules,
+                                        num_features_plus_one - 1))
+        store._uppers = np.empty(shape=(num_rules,
+                                        num_features_plus_one - 1))
+        store._actions = actions
+        store._weight_mat = weight_mat
+        store._payoff_vars = payoff_vars
+        store._payoff_stdevs = payoff_stdevs
+        store._match_table = None
+        store._match_memo = None
+        return store
+
+    @classmethod
+    def from_rules(cls, rules):
+        rules = list(rules)
+        store = cls(num_rules=len(rules), num_features=len(rules[0].condition))
+        for (idx, rule) in enumerate(rules):
+            rule.bind(store, idx)
+        return store
+
+    @classmethod
+    def gather(cls, rules):
+        """Make new store holding copies of the rows of given (bound) rules,
+        in order, with one vectorised copy per array per source store. Rules
+        are not re-bound: see Rule.clone_into."""
+        rules = list(rules)
+        store = cls(num_rules=len(rules), num_features=len(rules[0].condition))
+        # group by source store: {id: (source store, dst idxs, src idxs)}
+        copy_specs = {}
+        for (dst_idx, rule) in enumerate(rules):
+            (_, dst_idxs, src_idxs) = copy_specs.setdefault(
+                id(rule.store), (rule.store, [], []))
+            dst_idxs.append(dst_idx)
+            src_idxs.append(rule.idx)
+        for (src, dst_idxs, src_idxs) in copy_specs.values():
+            for attr in cls._ROW_ATTRS:
+                getattr(store, attr)[dst_idxs] = getattr(src, attr)[src_idxs]
+        return store
+
+    @property
+    def lowers(self):
+        return self._lowers
+
+    @property
+    def uppers(self):
+        return self._uppers
+
+    @property
+    def actions(self):
+        return self._actions
+
+    @property
+    def weight_mat(self):
+        return self._weight_mat
+
+    @property
+    def payoff_vars(self):
+        return self._payoff_vars
+
+    @property
+    def payoff_stdevs(self):
+        return self._payoff_stdevs
+
+    @property
+    def match_table(self):
+        return self._match_table
+
+    @property
+    def match_memo(self):
+        return self._match_memo
+
+    def __len__(self):
+        return len(self._actions)
+
+    def compile_match_table(self, obs_space):
+        """Compile current conditions into a MatchTable for the (integer)
+        obs_space, to be used for matching until conditions change."""
+        self._match_table = MatchTable(self._lowers, self._uppers, obs_space)
+        return self._match_table
+
+    def clear_match_table(self):
+        self._match_table = None
+
+    def enable_match_memo(self, max_size):
+        """Memoise match sets of (up to max_size most recently seen) obss
+        until conditions change."""
+        self._match_memo = MatchSetMemo(max_size)
+        return self._match_memo
+
+    def disable_match_memo(self):
+        self._match_memo = None
+
+    def _invalidate_condition_caches(self):
+        self._match_table = None
+        if self._match_memo is not None:
+            self._match_memo.clear()
+
+    def set_condition(self, idx, condition):
+        # bounds straight from (unordered) allele pairs, equivalent to
+        # decoding phenotype
+        allele_pairs = np.reshape(condition.alleles, (-1, 2))
+        assert len(allele_pairs) == self._lowers.shape[1]
+        self._lowers[idx] = np.min(allele_pairs, axis=1)
+        self._uppers[idx] = np.max(allele_pairs, axis=1)
+        # any compiled table / memoised match sets are now stale
+        self._invalidate_condition_caches()
+
+    def set_action(self, idx, action):
+        self._actions[idx] = action
+
+    def copy_row(self, idx, other, other_idx):
+        """Copy all data for rule at other_idx in other store into idx."""
+        for attr in self._ROW_ATTRS:
+            getattr(self, attr)[idx] = getattr(other, attr)[other_idx]
+        self._invalidate_condition_caches()
+
+    def gen_match_mask(self, obs):
+        """Boolean mask over rules: True for those whose conditions match
+        obs, i.e. lower <= obs <= upper on every dim."""
+        if self._match_table is not None:
+            return self._match_table.lookup_match_mask(obs)
+        obs = np.asarray(obs)
+        return np.all((self._lowers <= obs) & (obs <= self._uppers), axis=1)
+
+    def gen_match_idxs(self, obs):
+        # table lookup is cheaper than memo lookup
+        if self._match_memo is not None and self._match_table is None:
+            return self._match_memo.lookup(
+                obs, calc_match_idxs_func=self._calc_match_idxs)
+        else:
+            return self._calc_match_idxs(obs)
+
+    def _calc_match_idxs(self, obs):
+        return np.flatnonzero(self.gen_match_mask(obs))
+
+    def gen_match_masks(self, obs_batch):
+        """Batched version of gen_match_mask: (num obss, num rules) mask."""
+        if self._match_table is not None:
+            return self._match_table.lookup_match_masks(obs_batch)
+        obs_batch = np.asarray(obs_batch)[:, np.newaxis, :]
+        return np.all(
+            (self._lowers <= obs_batch) & (obs_batch <= self._uppers),
+            axis=2)
+
+    def calc_strength_mat(self, aug_obs_batch):
+        """Strengths of all rules for each aug obs in batch:
+        (num obss, num rules)."""
+        return (aug_obs_batch @ self._weight_mat.T) - self._payoff_stdevs
+
+    def calc_strengths(self, idxs, aug_obs):
+        """Strengths of rules at idxs for given aug obs via single mat-vec:
+        prediction - payoff stdev."""
+        return (self._weight_mat[idxs] @ aug_obs) - self._payoff_stdevs[idxs]
@@ -0,0 +1,118 @@
+import numpy as np
+
+from .context import get_context
+from .param_update import update_rules_in_store
+
+_INIT_CAPACITY = 64
+
+
+class TrajectoryBuffer:
+    """Trajectory of an Indiv as arrays: augmented obs, action, reward and
+    action set (as bool mask over Indiv's rules) of each step. Preallocated
+    and re-used across trajectories via clear(), growing (doubling) when a
+    trajectory is longer than any before it."""
+    def __init__(self,
+                 num_rules,
+                 aug_obs_dim,
+                 x_nought,
+                 capacity=_INIT_CAPACITY):
+        assert capacity >= 1
+        self._x_nought = x_nought
+        self._aug_obss = np.empty(shape=(capacity, aug_obs_dim))
+        self._aug_obss[:, 0] = self._x_nought
+        self._actions = np.empty(shape=capacity, dtype=np.int64)
+        self._rewards = np.empty(shape=capacity)
+        self._action_set_masks = np.zeros(shape=(capacity, num_rules),
+                                          dtype=bool)
+        self._len = 0
+        # gamma**k for k = 0, 1, ..., computed via Python float pow to give
+        # exactly the same payoffs as calculating them step-by-step
+        self._discounts_gamma = None
+        self._discounts = None
+
+    @classmethod
+    def for_indiv(cls, indiv):
+        (num_rules, aug_obs_dim) = indiv.rule_store.weight_mat.shape
+        return cls(num_rules, aug_obs_dim, indiv.x_nought)
+
+    def __len__(self):
+        return self._len
+
+    @property
+    def capacity(self):
+        return len(self._rewards)
+
+    @property
+    def aug_obss(self):
+        return self._aug_obss[:self._len]
+
+    @property
+    def actions(self):
+        return self._actions[:self._len]
+
+    @property
+    def rewards(self):
+        return self._rewards[:self._len]
+
+    @property
+    def action_set_masks(self):
+        return self._action_set_masks[:self._len]
+
+    def clear(self):
+        self._action_set_masks[:self._len] = False
+        self._len = 0
+
+    def append(self, obs, action, action_set_idxs, reward):
+        """action_set_idxs: idxs (or bool mask) of action set rules."""
+        if self._len == self.capacity:
+            self._grow()
+        step = self._len
+        self._aug_obss[step, 1:] = obs
+        self._actions[step] = action
+        self._rewards[step] = reward
+        self._action_set_masks[step, action_set_idxs] = True
+        self._len += 1
+
+    def _grow(self):
+        capacity = self.capacity
+        self._aug_obss = np.concatenate(
+            (self._aug_obss, np.empty_like(self._aug_obss)))
+        self._aug_obss[capacity:, 0] = self._x_nought
+        self._actions = np.concatenate(
+            (self._actions, np.empty_like(self._actions)))
+        self._rewards = np.concatenate(
+            (self._rewards, np.empty_like(self._rewards)))
+        self._action_set_masks = np.concatenate(
+            (self._action_set_masks, np.zeros_like(self._action_set_masks)))
+
+    def calc_payoffs(self, gamma):
+        """Payoff of each step is (gamma**steps_from_end) * sum of rewards
+        from that step to end of trajectory, all steps in one pass."""
+        num_steps = self._len
+        # summing in reverse gives same partial sums (in same order) as
+        # accumulating from end one step at a time
+        reward_sums = np.cumsum(self.rewards[::-1])[::-1]
+        steps_from_end = np.arange(num_steps - 1, -1, -1)
+        return self._get_discounts(gamma, num_steps)[steps_from_end] * \
+            reward_sums
+
+    def _get_discounts(self, gamma, num_steps):
+        if (self._discounts_gamma != gamma
+                or len(self._discounts) < num_steps):
+            self._discounts = np.array(
+                [gamma**k for k in range(max(num_steps, self.capacity))])
+            self._discounts_gamma = gamma
+        return self._discounts
+
+    def reinforce(self, store, gamma, ctx=None):
+        """Update params of rules in store (that of Indiv the trajectory is
+        of) backwards over steps, for each step's action set given its
+        payoff."""
+        if self._len == 0:
+            return
+        ctx = (ctx if ctx is not None else get_context())
+        payoffs = self.calc_payoffs(gamma)
+        for step in range(self._len - 1, -1, -1):
+            update_rules_in_store(
+                store, np.flatnonzero(self._action_set_masks[step]),
+                payoffs[step], self._aug_obss[step], ctx)
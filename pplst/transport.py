@@ -0,0 +1,173 @@
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .indiv import make_indiv
+from .rule import Rule
+from .rule_store import RuleStore
+
+# Indivs have at most this many parents; in arrays, parent ids of Indivs
+# with fewer are padded with NO_PARENT_ID
+MAX_NUM_PARENTS = 2
+NO_PARENT_ID = -1
+
+
+def calc_pop_array_layouts(pop_size, indiv_size, obs_dim, allele_dtype):
+    """{name: (shape, dtype)} of columnar arrays holding genotypes, ids,
+    parent ids and learned params of a pop, as filled by pack_indiv."""
+    (p, n, d) = (pop_size, indiv_size, obs_dim)
+    return {
+        "ids": ((p, ), np.int64),
+        "parent_ids": ((p, MAX_NUM_PARENTS), np.int64),
+        "alleles": ((p, n, 2 * d), np.dtype(allele_dtype)),
+        "actions": ((p, n), np.int64),
+        "weight_mat": ((p, n, d + 1), np.float32),
+        "payoff_vars": ((p, n), np.float64),
+        "payoff_stdevs": ((p, n), np.float64)
+    }
+
+
+def pack_indiv(arrays, pop_idx, indiv):
+    """Write genotype, id, parent ids and current learned params of indiv
+    into slot pop_idx of arrays."""
+    store = indiv.rule_store
+    arrays["ids"][pop_idx] = indiv.id
+    parent_ids = indiv.parent_ids
+    arrays["parent_ids"][pop_idx] = (
+        parent_ids + (NO_PARENT_ID, ) * (MAX_NUM_PARENTS - len(parent_ids)))
+    arrays["alleles"][pop_idx] = [
+        rule.condition.alleles for rule in indiv.rules
+    ]
+    arrays["actions"][pop_idx] = store.actions
+    arrays["weight_mat"][pop_idx] = store.weight_mat
+    arrays["payoff_vars"][pop_idx] = store.payoff_vars
+    arrays["payoff_stdevs"][pop_idx] = store.payoff_stdevs
+
+
+def unpack_indiv(arrays, pop_idx, encoding, selectable_actions, ctx=None):
+    """Re-make Indiv in slot pop_idx of arrays (same id and parent ids) with
+    rules whose learned params are views into arrays."""
+    store = RuleStore.from_arrays(
+        actions=arrays["actions"][pop_idx],
+        weight_mat=arrays["weight_mat"][pop_idx],
+        payoff_vars=arrays["payoff_vars"][pop_idx],
+        payoff_stdevs=arrays["payoff_stdevs"][pop_idx])
+    # decode all conditions at once, then make rules as views that do not
+    # write to store
+    alleles = np.reshape(arrays["alleles"][pop_idx],
+                         (len(store), len(encoding.obs_space), 2))
+    bounds = encoding.decode_bulk(alleles)
+    store.lowers[:] = bounds[:, :, 0]
+    store.uppers[:] = bounds[:, :, 1]
+    rules = [
+        Rule.view_of(condition, action, store, idx)
+        for (idx, (condition, action)) in enumerate(
+            zip(encoding.make_conditions_bulk(alleles),
+                arrays["actions"][pop_idx].tolist()))
+    ]
+    indiv = make_indiv(rules,
+                       selectable_actions,
+                       rule_store=store,
+                       indiv_id=int(arrays["ids"][pop_idx]),
+                       ctx=ctx)
+    indiv.parent_ids = [
+        parent_id for parent_id in arrays["parent_ids"][pop_idx].tolist()
+        if parent_id != NO_PARENT_ID
+    ]
+    return indiv
+
+
+# everything a worker needs to attach to a SharedPop: small enough to send
+# with every task
+SharedPopSpec = namedtuple(
+    "SharedPopSpec",
+    ["shm_names", "pop_size", "indiv_size", "obs_dim", "allele_dtype"])
+
+
+class SharedPop:
+    """Compact columnar packing of a population's genotypes and learned
+    params into shared memory, so that pool workers can read and update them
+    in place rather than having whole Indiv object graphs pickled to and from
+    them."""
+    def __init__(self, spec, create):
+        self._spec = spec
+        self._shms = {}
+        self._arrays = {}
+        for (name, (shape, dtype)) in calc_pop_array_layouts(
+                spec.pop_size, spec.indiv_size, spec.obs_dim,
+                spec.allele_dtype).items():
+            nbytes = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+            if create:
+                shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            else:
+                shm = shared_memory.SharedMemory(name=spec.shm_names[name])
+            self._shms[name] = shm
+            self._arrays[name] = np.ndarray(shape=shape,
+                                            dtype=dtype,
+                                            buffer=shm.buf)
+        if create:
+            self._spec = self._spec._replace(shm_names={
+                name: shm.name
+                for (name, shm) in self._shms.items()
+            })
+
+    @classmethod
+    def create(cls, pop_size, indiv_size, obs_dim, allele_dtype):
+        spec = SharedPopSpec(shm_names=None,
+                             pop_size=pop_size,
+                             indiv_size=indiv_size,
+                             obs_dim=obs_dim,
+                             allele_dtype=np.dtype(allele_dtype))
+        return cls(spec, create=True)
+
+    @classmethod
+    def attach(cls, spec):
+        return cls(spec, create=False)
+
+    @property
+    def spec(self):
+        return self._spec
+
+    def is_compatible(self, pop, encoding):
+        """Whether pop can be packed, i.e. it fits (pop_size is a capacity)
+        and has right shape."""
+        return (len(pop) <= self._spec.pop_size
+                and self._spec.indiv_size == len(pop[0])
+                and self._spec.obs_dim == len(encoding.obs_space)
+                and self._spec.allele_dtype == np.dtype(
+                    encoding.allele_dtype))
+
+    def pack(self, pop):
+        """Write genotypes, ids and current learned params of pop into first
+        len(pop) slots."""
+        assert len(pop) <= self._spec.pop_size
+        for (pop_idx, indiv) in enumerate(pop):
+            pack_indiv(self._arrays, pop_idx, indiv)
+
+    def make_indiv(self, pop_idx, encoding, selectable_actions):
+        """Re-make Indiv at pop_idx (same id) with rules whose learned params
+        are views into shared memory, so learning updates them in place."""
+        return unpack_indiv(self._arrays, pop_idx, encoding,
+                            selectable_actions)
+
+    def unpack_learned_params(self, pop):
+        """Copy learned params (as updated by workers) back into pop."""
+        assert len(pop) <= self._spec.pop_size
+        arrays = self._arrays
+        for (pop_idx, indiv) in enumerate(pop):
+            assert indiv.id == arrays["ids"][pop_idx]
+            store = indiv.rule_store
+            store.weight_mat[:] = arrays["weight_mat"][pop_idx]
+            store.payoff_vars[:] = arrays["payoff_vars"][pop_idx]
+            store.payoff_stdevs[:] = arrays["payoff_stdevs"][pop_idx]
+
+    def close(self):
+        # drop array views before closing, else buffers still exported
+        self._arrays = {}
+        for shm in self._shms.values():
+            shm.close()
+
+    def unlink(self):
+        for shm in self._shms.values():
+            shm.unlink()
@@ -3,3 +3,9 @@ import numpy as np
 
 def augment_obs(obs, x_nought):
     return np.concatenate(([x_nought], obs))
+
+
+def augment_obs_batch(obs_batch, x_nought):
+    obs_batch = np.asarray(obs_batch)
+    return np.hstack((np.full(shape=(len(obs_batch), 1),
+                              fill_value=x_nought), obs_batch))
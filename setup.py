@@ -22,5 +22,5 @@ setuptools.setup(
         "numpy",
         "gym"
     ],
-    python_requires='>=3.6',
+    python_requires='>=3.8',
 )